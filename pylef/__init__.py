@@ -55,9 +55,16 @@ ou no Jupyter notebook
     >>> ?scope      # documentação do osciloscópio  
     >>> ?gerador    # documentação do gerador
 
+Para várias medidas seguidas, uma sessão mantém os dois
+instrumentos conectados (ver pylef.session)
+
+    >>> with pylef.Session() as sessao:
+    ...     fig, dados = pylef.sweep_frequency(100, 1e4, 20, session = sessao)
+
 """
 
 ## import instrument modules
 from .scope import TektronixTBS1062
 from .generator import BK4052
-from .methods import sweep_frequency
+from .methods import sweep_frequency, sweep_frequency_hardware
+from .session import Session
@@ -0,0 +1,161 @@
+#-*- coding: utf-8 -*-
+
+""" Background acquisition for the Tektronix TBS1062 """
+
+#################################
+import queue  # thread-safe queues
+import threading  # acquisition thread
+import time # module for time related funtions
+import numpy  # module for array manipulation
+################################
+class AcquisitionWorker:
+    def __init__(self, scope, channels = ['CH1'], n_buffers = 3, max_rate = None):
+        """
+        AcquisitionWorker
+        =================
+
+        Acquires waveforms of a "TektronixTBS1062" in a dedicated thread, so
+        that the USB transfer of a frame overlaps the processing of the
+        previous one. The frames are converted into a small ring of
+        preallocated buffers and handed to the consumer through a bounded
+        queue: when all the buffers are in use the thread waits (a "stall")
+        instead of allocating more memory.
+
+        While the worker is running it owns the VISA session: the scope must
+        not be used from other threads.
+
+        Usage:
+
+        >>> worker = AcquisitionWorker(scope, ['CH1', 'CH2'])
+        >>> worker.start()
+        >>> for t, Y in worker.frames(100):   # Y[0] is CH1 and Y[1] is CH2
+        ...     process(t, Y)                # the buffer is reused after the next iteration
+        >>> worker.stop()
+        >>> print(worker.stats())
+
+        or, handling the buffers by hand
+
+        >>> frame = worker.get()     # (index, t, Y, timestamp)
+        >>> worker.release(frame)    # give the buffer back to the worker
+
+        Parameters
+        ----------
+        scope: pylef.TektronixTBS1062
+            connected scope
+        channels: list of strings - optional
+            channels acquired in each frame (see "read_channels")
+        n_buffers: int - optional
+            number of frame buffers in the ring
+        max_rate: float - optional
+            maximum number of frames per second
+        """
+        self.scope = scope
+        self.channels = list(channels)
+        self.n_buffers = n_buffers
+        self.max_rate = max_rate
+        self.buffers = None
+        self._free = queue.Queue()   # indices of the buffers that can be filled
+        self._ready = queue.Queue(maxsize = n_buffers)   # completed frames
+        self._stop = threading.Event()
+        self._thread = None
+        self._error = None
+        self._stats = {'frames': 0, 'stalls': 0, 'waits': 0}
+        self._start_time = None
+#
+    def start(self):
+        """ allocate the buffers (from a first acquisition) and start the thread """
+        if self._thread is not None and self._thread.is_alive():
+            raise RuntimeError('The acquisition is already running')
+        t, Y = self.scope.read_channels(self.channels)
+        self.buffers = numpy.empty((self.n_buffers,) + Y.shape)
+        self._free, self._ready = queue.Queue(), queue.Queue(maxsize = self.n_buffers)
+        for index in range(self.n_buffers):
+            self._free.put(index)
+        self._stop.clear()
+        self._error = None
+        self._stats = {'frames': 0, 'stalls': 0, 'waits': 0}
+        self._start_time = time.time()
+        self._thread = threading.Thread(target = self._run, name = 'pylef-acquisition', daemon = True)
+        self._thread.start()
+        return None
+#
+    def stop(self):
+        """ stop the thread and wait for it to end """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return None
+#
+    def running(self):
+        """ return True while the acquisition thread is alive """
+        return self._thread is not None and self._thread.is_alive()
+#
+    def _run(self):
+        """ acquisition loop of the thread """
+        try:
+            while not self._stop.is_set():
+                if self.max_rate is not None:
+                    time.sleep(max(0., self._start_time + self._stats['frames']/self.max_rate - time.time()))
+                if self._free.empty():
+                    self._stats['stalls'] += 1   # the consumer holds all the buffers
+                index = None
+                while index is None and not self._stop.is_set():
+                    try:
+                        index = self._free.get(timeout = 0.1)
+                    except queue.Empty:
+                        pass
+                if index is None:
+                    break
+                t, Y = self.scope.read_channels(self.channels, out = self.buffers[index])
+                self._ready.put((index, t, Y, time.time()))
+                self._stats['frames'] += 1
+        except Exception as error:   # handed to the consumer by "get"
+            self._error = error
+#
+    def get(self, timeout = None):
+        """ return the next frame (index, t, Y, timestamp). The buffer Y belongs to
+        the consumer until it is given back with "release" """
+        if self._ready.empty():
+            self._stats['waits'] += 1   # the consumer waits for the instrument
+        start = time.time()
+        while True:
+            try:
+                return self._ready.get(timeout = 0.1)
+            except queue.Empty:
+                if self._error is not None:
+                    raise self._error
+                if not self.running():
+                    raise RuntimeError('The acquisition is not running')
+                if timeout is not None and time.time() - start > timeout:
+                    raise TimeoutError('No frame acquired in %g s' % timeout)
+#
+    def release(self, frame):
+        """ give the buffer of frame back to the acquisition thread """
+        self._free.put(frame[0])
+        return None
+#
+    def frames(self, n_frames = None):
+        """ generator of (t, Y) frames. The buffer of each frame is released when the
+        next one is requested, so it must be copied to be kept """
+        n, frame = 0, None
+        try:
+            while n_frames is None or n < n_frames:
+                if frame is not None:
+                    self.release(frame)
+                    frame = None
+                frame = self.get()
+                n += 1
+                yield (frame[1], frame[2])
+        finally:
+            if frame is not None:
+                self.release(frame)
+#
+    def stats(self):
+        """ return a dictionary with the number of 'frames', the frame 'rate' (frames/s),
+        the 'queue_depth' (completed frames waiting for the consumer), the acquisition
+        'stalls' (all buffers in use) and the consumer 'waits' (no frame ready) """
+        stats = dict(self._stats)
+        elapsed = time.time() - self._start_time if self._start_time is not None else 0.
+        stats['rate'] = stats['frames']/elapsed if elapsed > 0 else 0.
+        stats['queue_depth'] = self._ready.qsize()
+        return stats
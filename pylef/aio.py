@@ -0,0 +1,115 @@
+#-*- coding: utf-8 -*-
+
+""" asyncio interface for the instruments
+
+Each instrument gets its own single thread executor, where all of its
+(blocking) VISA calls run in order. Calls to different instruments run in
+different threads, so they can be awaited at the same time:
+
+    >>> import asyncio
+    >>> import pylef.aio
+    >>> async def main():
+    ...     func_gen, scope = pylef.aio.AsyncBK4052(), pylef.aio.AsyncTektronixTBS1062()
+    ...     await func_gen.ch1.turn_on()
+    ...     # the scope sets the scale while the generator waits for the *OPC?
+    ...     await asyncio.gather(func_gen.ch1.set_frequency(1e3), scope.ch2.set_smart_scale())
+    ...     t, Y = await scope.read_channels(['CH1', 'CH2'])
+    ...     await asyncio.gather(func_gen.close(), scope.close())
+    >>> asyncio.run(main())
+
+Every method of the instrument, of its channels, measurements and trigger
+becomes a coroutine function with the same arguments. Generator methods
+(such as "ChannelScope.stream") become asynchronous generators.
+"""
+
+#################################
+import asyncio  # event loop
+import concurrent.futures  # thread executors
+import functools  # bind the call arguments
+import inspect  # tell methods and generators apart
+from .scope import TektronixTBS1062, ChannelScope, Measure, Trigger, CurveFormat, PreambleCache, MeasurementSet
+from .generator import BK4052, ChannelFuncGen, WaveformStore
+################################
+_COMPONENTS = (ChannelScope, Measure, Trigger, CurveFormat, PreambleCache, MeasurementSet, ChannelFuncGen, WaveformStore)   # wrapped as well
+
+class AsyncProxy:
+    def __init__(self, target, executor):
+        """
+            Asynchronous view of "target": its methods run in "executor" and
+            return awaitables. The other attributes are returned unchanged.
+        """
+        self.sync = target   # the wrapped (blocking) object
+        self.executor = executor
+#
+    def __getattr__(self, name):
+        value = getattr(self.sync, name)
+        if isinstance(value, _COMPONENTS):
+            return AsyncProxy(value, self.executor)
+        if inspect.isgeneratorfunction(getattr(type(self.sync), name, None)):
+            return functools.partial(self._iterate, value)
+        if inspect.ismethod(value):
+            return functools.partial(self.run, value)
+        return value
+#
+    def __repr__(self):
+        return 'Async(%r)' % (self.sync,)
+#
+    async def run(self, func, *args, **kwargs):
+        """ await func(*args, **kwargs) run in the instrument thread """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+#
+    async def _iterate(self, func, *args, **kwargs):
+        """ asynchronous generator over the items of func(*args, **kwargs) """
+        loop = asyncio.get_running_loop()
+        items = await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+        done = object()
+        try:
+            while True:
+                item = await loop.run_in_executor(self.executor, next, items, done)
+                if item is done:
+                    break
+                yield item
+        finally:
+            await loop.run_in_executor(self.executor, items.close)
+#
+class AsyncInstrument(AsyncProxy):
+    def __init__(self, instrument):
+        """ asynchronous instrument with its own single thread executor """
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1, thread_name_prefix = 'pylef-' + type(instrument).__name__)
+        AsyncProxy.__init__(self, instrument, executor)
+#
+    async def close(self):
+        """ close the instrument and release the thread """
+        try:
+            return await self.run(self.sync.close)
+        finally:
+            self.executor.shutdown(wait = False)
+#
+    async def __aenter__(self):
+        return self
+#
+    async def __aexit__(self, *exc_info):
+        await self.close()
+#
+class AsyncTektronixTBS1062(AsyncInstrument):
+    def __init__(self, resource = None, instrument = None):
+        """
+            asyncio version of "TektronixTBS1062" (see the module documentation).
+
+            resource: pyvisa resource given to "TektronixTBS1062"
+            instrument: an already connected "TektronixTBS1062" to be used
+                instead of a new one
+        """
+        AsyncInstrument.__init__(self, instrument if instrument is not None else TektronixTBS1062(resource))
+#
+class AsyncBK4052(AsyncInstrument):
+    def __init__(self, resource = None, instrument = None):
+        """
+            asyncio version of "BK4052" (see the module documentation).
+
+            resource: pyvisa resource given to "BK4052"
+            instrument: an already connected "BK4052" to be used instead of a
+                new one
+        """
+        AsyncInstrument.__init__(self, instrument if instrument is not None else BK4052(resource))
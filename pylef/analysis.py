@@ -0,0 +1,369 @@
+#-*- coding: utf-8 -*-
+
+""" Measurements computed in the computer from the acquired waveforms
+
+The automatic measurements of the scope cost one or more queries each. When
+the waveform has already been transferred, the same numbers can be computed
+here from the curve, for a single waveform or for a stack of frames at once:
+
+    >>> t, y = scope.ch1.read_channel()
+    >>> values = pylef.analysis.measure(t, y)
+    >>> print(values['Vpp'], values['frequency'])
+    >>> t, Y = scope.read_channels(['CH1', 'CH2'])
+    >>> values = pylef.analysis.measure(t, Y[1], Y[0])   # with the phase of CH2 relative to CH1
+
+The definitions follow the ones of the TBS1062: the period is measured
+between the rising crossings of the mid level (half way between the maximum
+and the minimum, with a 10 % hysteresis), "cycle_rms" is the rms over the
+whole periods and the phase is 360 degrees times the delay of the first
+rising crossing of the second source relative to the first one, divided by
+the period. Measurements that cannot be done (less than two crossings, flat
+signal) are NaN, where the scope would return 9.9E37.
+"""
+
+#################################
+import numpy  # module for array manipulation
+################################
+MEASUREMENTS = ['Vpp', 'maximum', 'minimum', 'mean', 'rms', 'cycle_rms', 'period', 'frequency', 'phase']
+
+def rising_crossings(t, Y):
+    """
+        rising crossings of the mid level of each row of Y (with 10 % hysteresis).
+
+        Returns the tuple (first, last, count) with the times of the first and
+        last crossings and the number of crossings of each row (the times are
+        NaN for the rows without crossings).
+    """
+    Y = numpy.atleast_2d(Y)
+    vmax, vmin = Y.max(axis = 1, keepdims = True), Y.min(axis = 1, keepdims = True)
+    mid, hyst = (vmax + vmin)/2., 0.1*(vmax - vmin)
+    # a crossing only counts if the signal went below the hysteresis band since the previous one
+    index = numpy.arange(Y.shape[1])
+    last_below = numpy.maximum.accumulate(numpy.where(Y < mid - hyst, index, -1), axis = 1)[:, :-1]
+    cross = (Y[:, :-1] < mid) & (Y[:, 1:] >= mid)
+    previous = numpy.maximum.accumulate(numpy.where(cross, last_below, -1), axis = 1)
+    previous = numpy.concatenate((numpy.full((Y.shape[0], 1), -1), previous[:, :-1]), axis = 1)
+    valid = cross & (last_below >= 0) & (last_below != previous)
+    count = valid.sum(axis = 1)
+    rows = numpy.arange(Y.shape[0])
+    i_first = numpy.argmax(valid, axis = 1)
+    i_last = Y.shape[1] - 2 - numpy.argmax(valid[:, ::-1], axis = 1)
+    times = []
+    for i in [i_first, i_last]:
+        y0, y1 = Y[rows, i], Y[rows, i + 1]
+        with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+            tc = t[i] + (mid[:, 0] - y0)*(t[i + 1] - t[i])/(y1 - y0)
+        times.append(numpy.where(count > 0, tc, numpy.nan))
+    return times[0], times[1], count
+
+def measure(t, y, y2 = None):
+    """
+        compute the scope measurements of the waveform(s) y.
+
+        Parameters
+        ----------
+        t: 1-D array
+            time axis, shared by all the waveforms
+        y: array
+            one waveform (same size as t) or a stack of frames (N x samples)
+        y2: array - optional
+            reference waveform(s) for the phase (the "Source2" of the scope),
+            with the same shape as y
+
+        Returns a dictionary with the measurements in "MEASUREMENTS" (phase
+        only if y2 is given): floats for a single waveform or arrays with one
+        value per frame.
+    """
+    t = numpy.asarray(t, float)
+    single = numpy.ndim(y) == 1
+    Y = numpy.atleast_2d(y)
+    if Y.shape[1] != t.shape[0]:
+        raise ValueError('The waveforms must have the same number of points as the time axis')
+    values = {}
+    values['maximum'], values['minimum'] = Y.max(axis = 1), Y.min(axis = 1)
+    values['Vpp'] = values['maximum'] - values['minimum']
+    values['mean'] = Y.mean(axis = 1)
+    values['rms'] = numpy.sqrt(numpy.einsum('ij,ij->i', Y, Y)/Y.shape[1])
+    first, last, count = rising_crossings(t, Y)
+    with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+        period = numpy.where(count > 1, (last - first)/(count - 1), numpy.nan)
+        values['period'], values['frequency'] = period, 1./period
+        cycle = (t >= first[:, None]) & (t < last[:, None])
+        values['cycle_rms'] = numpy.where(count > 1, numpy.sqrt((Y**2*cycle).sum(axis = 1)/cycle.sum(axis = 1)), numpy.nan)
+    if y2 is not None:
+        Y2 = numpy.atleast_2d(y2)
+        if Y2.shape != Y.shape:
+            raise ValueError('The reference waveforms must have the same shape as the waveforms')
+        first2, _, _ = rising_crossings(t, Y2)
+        phase = 360.*(first2 - first)/period
+        values['phase'] = (phase + 180.) % 360. - 180.
+    if single:
+        values = dict([(key, float(val[0])) for key, val in values.items()])
+    return values
+
+def sine_fit(t, y, frequency, fit_frequency = False, n_iterations = 6):
+    """
+        least squares fit of y = amplitude*cos(2*pi*frequency*t + phase) + offset.
+
+        With fit_frequency = False the frequency is the given one (three
+        parameter fit, a linear problem solved at once for all the frames).
+        With fit_frequency = True it is refined for each frame by
+        n_iterations Gauss-Newton steps starting from the given value (four
+        parameter fit).
+
+        Parameters
+        ----------
+        t: 1-D array
+            time axis, shared by all the waveforms
+        y: array
+            one waveform (same size as t) or a stack of frames (N x samples)
+        frequency: float
+            frequency in Hz (the one set on the function generator)
+
+        Returns a dictionary with 'amplitude', 'phase' (degrees), 'offset',
+        'frequency', their standard deviations ('amplitude_std', ...) computed
+        from the covariance of the fit and the 'residual_rms': floats for a
+        single waveform or arrays with one value per frame.
+    """
+    t = numpy.asarray(t, float)
+    single = numpy.ndim(y) == 1
+    Y = numpy.atleast_2d(numpy.asarray(y, float))
+    if Y.shape[1] != t.shape[0]:
+        raise ValueError('The waveforms must have the same number of points as the time axis')
+    n_params = 4 if fit_frequency else 3
+    if t.shape[0] <= n_params:
+        raise ValueError('The fit needs more than %d points' % n_params)
+    w = 2*numpy.pi*frequency
+    A = numpy.stack([numpy.cos(w*t), numpy.sin(w*t), numpy.ones_like(t)], axis = 1)
+    coefs = numpy.linalg.lstsq(A, Y.T, rcond = None)[0].T   # (N, 3): a cos + b sin + c
+    if fit_frequency:
+        w = numpy.full(Y.shape[0], w)
+        for iteration in range(n_iterations):
+            a, b = coefs[:, 0:1], coefs[:, 1:2]
+            wt = w[:, None]*t
+            cos, sin = numpy.cos(wt), numpy.sin(wt)
+            J = numpy.stack([cos, sin, numpy.ones_like(wt), t*(b*cos - a*sin)], axis = 2)   # (N, M, 4)
+            residual = Y - (a*cos + b*sin + coefs[:, 2:3])
+            step = numpy.linalg.solve(numpy.einsum('nmi,nmj->nij', J, J), numpy.einsum('nmi,nm->ni', J, residual)[:, :, None])[:, :, 0]
+            coefs, w = coefs + step[:, :3], w + step[:, 3]
+        a, b = coefs[:, 0:1], coefs[:, 1:2]
+        wt = w[:, None]*t
+        cos, sin = numpy.cos(wt), numpy.sin(wt)
+        J = numpy.stack([cos, sin, numpy.ones_like(wt), t*(b*cos - a*sin)], axis = 2)
+        residual = Y - (a*cos + b*sin + coefs[:, 2:3])
+        inverse = numpy.linalg.inv(numpy.einsum('nmi,nmj->nij', J, J))
+    else:
+        w = numpy.full(Y.shape[0], w)
+        residual = Y - coefs.dot(A.T)
+        inverse = numpy.broadcast_to(numpy.linalg.inv(A.T.dot(A)), (Y.shape[0], 3, 3))
+    variance = numpy.einsum('nm,nm->n', residual, residual)/(t.shape[0] - n_params)
+    cov = variance[:, None, None]*inverse
+    a, b, c = coefs[:, 0], coefs[:, 1], coefs[:, 2]
+    amplitude = numpy.hypot(a, b)
+    # a = amplitude*cos(phase) and b = -amplitude*sin(phase)
+    with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+        amplitude_var = (a**2*cov[:, 0, 0] + b**2*cov[:, 1, 1] + 2*a*b*cov[:, 0, 1])/amplitude**2
+        phase_var = (b**2*cov[:, 0, 0] + a**2*cov[:, 1, 1] - 2*a*b*cov[:, 0, 1])/amplitude**4
+    values = {'amplitude': amplitude, 'phase': numpy.degrees(numpy.arctan2(-b, a)), 'offset': c,
+              'frequency': w/(2*numpy.pi), 'amplitude_std': numpy.sqrt(amplitude_var),
+              'phase_std': numpy.degrees(numpy.sqrt(phase_var)), 'offset_std': numpy.sqrt(cov[:, 2, 2]),
+              'frequency_std': numpy.sqrt(cov[:, 3, 3])/(2*numpy.pi) if fit_frequency else numpy.zeros(Y.shape[0]),
+              'residual_rms': numpy.sqrt(variance)}
+    if single:
+        values = dict([(key, float(val[0])) for key, val in values.items()])
+    return values
+
+def sine_transfer(t, y1, y2, frequency):
+    """
+        amplitude ratio and phase of y2 relative to y1 (for example CH2 and
+        CH1 of a transfer function measurement) from three parameter sine fits
+        at the known frequency. Returns a dictionary with 'Vpp1', 'Vpp2',
+        'gain' (Vpp2/Vpp1), 'phase' (phase of y2 minus phase of y1, in degrees
+        between -180 and 180) and their standard deviations ('Vpp1_std', ...).
+    """
+    fit1, fit2 = sine_fit(t, y1, frequency), sine_fit(t, y2, frequency)
+    gain = fit2['amplitude']/fit1['amplitude']
+    gain_std = gain*numpy.hypot(fit1['amplitude_std']/fit1['amplitude'], fit2['amplitude_std']/fit2['amplitude'])
+    phase = (fit2['phase'] - fit1['phase'] + 180.) % 360. - 180.
+    return {'Vpp1': 2*fit1['amplitude'], 'Vpp2': 2*fit2['amplitude'], 'gain': gain, 'phase': phase,
+            'Vpp1_std': 2*fit1['amplitude_std'], 'Vpp2_std': 2*fit2['amplitude_std'], 'gain_std': gain_std,
+            'phase_std': numpy.hypot(fit1['phase_std'], fit2['phase_std'])}
+
+WINDOWS = {'rectangular': [1.],
+           'hann': [0.5, 0.5],
+           'hamming': [0.54, 0.46],
+           'blackman': [0.42, 0.5, 0.08],
+           'flattop': [0.21557895, 0.41663158, 0.277263158, 0.083578947, 0.006947368]}   # cosine sum coefficients
+_windows = {}   # (window, size) -> (window array, sum, sum of squares)
+_frequencies = {}   # (size, dt) -> frequency axis
+
+def window(name, size):
+    """
+        return the tuple (w, sum(w), sum(w**2)) with the periodic window
+        "name" (one of "WINDOWS") of size points. The arrays are cached per
+        size and must not be modified.
+    """
+    key = (name, size)
+    if key not in _windows:
+        if name not in WINDOWS:
+            raise ValueError('The window must be one of ' + ', '.join(WINDOWS))
+        x = 2*numpy.pi*numpy.arange(size)/size
+        w = numpy.zeros(size)
+        for k, coef in enumerate(WINDOWS[name]):
+            w += (-1)**k*coef*numpy.cos(k*x)
+        w.flags.writeable = False
+        _windows[key] = (w, w.sum(), numpy.dot(w, w))
+    return _windows[key]
+
+def spectrum(y, dt, window_name = 'hann', scaling = 'amplitude'):
+    """
+        single sided spectrum of the waveform(s) y sampled every dt seconds.
+
+        Parameters
+        ----------
+        y: array
+            one waveform or a stack of frames (N x samples), transformed by a
+            single rfft call
+        dt: float
+            sampling interval (the x_factor of "waveform_conversion")
+        window_name: string - optional
+            one of "WINDOWS"
+        scaling: string - optional
+            'amplitude': peak amplitude of each component in V (a sine of
+            amplitude A gives a peak of height A), 'power': power of each
+            component in V^2 (A^2/2) or 'density': power spectral density in
+            V^2/Hz
+
+        Returns the tuple (frequency, S), with S of shape (frequencies,) or
+        (N, frequencies). The frequency axis is cached and must not be modified.
+    """
+    y = numpy.asarray(y, float)
+    size = y.shape[-1]
+    w, w_sum, w_sum2 = window(window_name, size)
+    key = (size, dt)
+    if key not in _frequencies:
+        frequency = numpy.fft.rfftfreq(size, dt)
+        frequency.flags.writeable = False
+        _frequencies[key] = frequency
+    X = numpy.abs(numpy.fft.rfft(y*w, axis = -1))
+    if scaling == 'amplitude':
+        S = X/w_sum
+    elif scaling == 'power':
+        S = (X/w_sum)**2
+    elif scaling == 'density':
+        S = X**2*(dt/w_sum2)
+    else:
+        raise ValueError("The scaling must be 'amplitude', 'power' or 'density'")
+    # single sided: the negative frequencies are added to the positive ones
+    last = None if size % 2 else -1   # the Nyquist frequency appears only once
+    S[..., 1:last] *= 2
+    return (_frequencies[key], S)
+
+class WaveformStatistics:
+    def __init__(self, t = None):
+        """
+            Running statistics of many frames of the same length: the mean
+            waveform, the variance of each sample (Welford/Chan algorithm,
+            numerically stable) and the minimum and maximum envelopes. The
+            memory does not grow with the number of frames, so it can follow
+            captures of hours:
+
+            >>> stats = WaveformStatistics()
+            >>> for t, y in scope.ch1.stream(10000):
+            ...     stats.add(y, t)
+            >>> snapshot = stats.snapshot()   # at any time
+            >>> plt.plot(snapshot['t'], snapshot['mean'])
+
+            Statistics of separate runs are combined with "merge" and saved
+            and restored with "save" and "load".
+
+            t: time axis of the frames (optional, kept for the snapshots)
+        """
+        self.count = 0
+        self.t = None if t is None else numpy.array(t, float)
+        self.mean = self.m2 = self.minimum = self.maximum = None
+        self._delta = self._work = None   # work buffers of the single frame update
+#
+    def _allocate(self, size):
+        self.mean, self.m2 = numpy.zeros(size), numpy.zeros(size)
+        self.minimum, self.maximum = numpy.full(size, numpy.inf), numpy.full(size, -numpy.inf)
+        self._delta, self._work = numpy.empty(size), numpy.empty(size)
+#
+    def add(self, y, t = None):
+        """ add one frame (1-D) or a stack of frames (N x samples) """
+        Y = numpy.atleast_2d(y)
+        if self.mean is None:
+            self._allocate(Y.shape[1])
+        if Y.shape[1] != self.mean.shape[0]:
+            raise ValueError('The frames must have %d points' % self.mean.shape[0])
+        if self.t is None and t is not None:
+            self.t = numpy.array(t, float)
+        if Y.shape[0] == 1:   # Welford update, computed in the preallocated work buffers
+            y, delta, work = Y[0], self._delta, self._work
+            numpy.minimum(self.minimum, y, out = self.minimum)
+            numpy.maximum(self.maximum, y, out = self.maximum)
+            self.count += 1
+            numpy.subtract(y, self.mean, out = delta)
+            numpy.divide(delta, self.count, out = work)
+            self.mean += work
+            numpy.subtract(y, self.mean, out = work)
+            work *= delta
+            self.m2 += work
+        else:
+            numpy.minimum(self.minimum, Y.min(axis = 0), out = self.minimum)
+            numpy.maximum(self.maximum, Y.max(axis = 0), out = self.maximum)
+            mean = Y.mean(axis = 0)
+            self._combine(Y.shape[0], mean, ((Y - mean)**2).sum(axis = 0))
+        return None
+#
+    def _combine(self, count, mean, m2):
+        """ combine with the statistics of other count frames (Chan et al.) """
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta*(count/total)
+        self.m2 += m2 + delta**2*(self.count*count/total)
+        self.count = total
+#
+    def merge(self, other):
+        """ add the statistics of other "WaveformStatistics" (from a separate run) """
+        if other.count == 0:
+            return None
+        if self.mean is None:
+            self._allocate(other.mean.shape[0])
+            if self.t is None and other.t is not None:
+                self.t = other.t.copy()
+        if other.mean.shape != self.mean.shape:
+            raise ValueError('The statistics must have the same number of points')
+        numpy.minimum(self.minimum, other.minimum, out = self.minimum)
+        numpy.maximum(self.maximum, other.maximum, out = self.maximum)
+        self._combine(other.count, other.mean, other.m2)
+        return None
+#
+    def snapshot(self):
+        """ return a dictionary with copies of 't', 'count', 'mean', 'variance' (sample
+        variance, NaN for less than 2 frames), 'std', 'minimum' and 'maximum' """
+        if self.count == 0:
+            raise ValueError('No frames were added')
+        variance = self.m2/(self.count - 1) if self.count > 1 else numpy.full(self.m2.shape, numpy.nan)
+        return {'t': None if self.t is None else self.t.copy(), 'count': self.count, 'mean': self.mean.copy(),
+                'variance': variance, 'std': numpy.sqrt(variance),
+                'minimum': self.minimum.copy(), 'maximum': self.maximum.copy()}
+#
+    def save(self, fname):
+        """ save the state in the numpy file fname (.npz) """
+        if self.count == 0:
+            raise ValueError('No frames were added')
+        numpy.savez(fname, count = self.count, mean = self.mean, m2 = self.m2, minimum = self.minimum,
+                    maximum = self.maximum, t = self.t if self.t is not None else numpy.array([]))
+        return None
+#
+    @classmethod
+    def load(cls, fname):
+        """ return the statistics saved by "save" """
+        with numpy.load(fname) as data:
+            stats = cls(data['t'] if data['t'].shape[0] > 0 else None)
+            stats._allocate(data['mean'].shape[0])
+            stats.count = int(data['count'])
+            for key in ['mean', 'm2', 'minimum', 'maximum']:
+                getattr(stats, key)[:] = data[key]
+        return stats
@@ -0,0 +1,162 @@
+#-*- coding: utf-8 -*-
+
+""" Wall time benchmarks of the acquisition paths on the simulated bench
+
+Usage
+
+    $ python -m pylef.benchmark
+    $ python -m pylef.benchmark --repeat 50 --latency-scale 0
+
+or from python
+
+    >>> import pylef.benchmark
+    >>> results = pylef.benchmark.run(repeat = 10)
+
+Each benchmark receives a freshly configured "pylef.simulator.SimulatedBench"
+and returns the list of wall times (in seconds) of the timed calls. The
+simulated scope holds the curve and measurement queries until the averages
+reflect the current settings, where the real TBS1062 would return stale data
+at once, so the times after a change of settings are longer (and the data
+better) than on the bench; see "pylef.simulator".
+"""
+
+#################################
+import argparse  # command line interface
+import contextlib  # silence the prints of the drivers
+import io   # in-memory text stream
+import os   # module for general OS manipulation
+import tempfile  # temporary folders for the saved files
+import time # module for time related funtions
+import numpy  # module for array manipulation
+from . import simulator
+from . import methods
+from . import analysis
+################################
+def timeit(func, repeat = 10):
+    """ return the list with the wall times of "repeat" calls of func() """
+    times = []
+    for n in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+#
+def setup_bench(latency_scale = 1.0):
+    """ return (bench, func_gen, scope) with a 1 kHz sine on the generator channel 1 """
+    bench = simulator.SimulatedBench(latency_scale = latency_scale)
+    with contextlib.redirect_stdout(io.StringIO()):
+        func_gen, scope = bench.generator(), bench.scope()
+    func_gen.ch1.turn_on()
+    func_gen.ch1.set_frequency(1e3)
+    func_gen.ch1.set_Vpp(2.)
+    scope.set_horizontal_scale(2.5e-4)
+    return bench, func_gen, scope
+#
+def bench_read_channel(bench, func_gen, scope, repeat = 10):
+    """ ChannelScope.read_channel on channel 1 """
+    return timeit(scope.ch1.read_channel, repeat)
+#
+def bench_read_channel_into(bench, func_gen, scope, repeat = 10):
+    """ ChannelScope.read_channel_into on channel 1, with the pooled buffer """
+    return timeit(scope.ch1.read_channel_into, repeat)
+#
+def bench_read_window(bench, func_gen, scope, repeat = 10):
+    """ ChannelScope.read_channel_into on channel 1, 250 points around the trigger """
+    return timeit(lambda: scope.ch1.read_channel_into(start = 1126, stop = 1375), repeat)
+#
+def bench_stream(bench, func_gen, scope, repeat = 10):
+    """ frames of ChannelScope.stream on channel 1 (single sequence acquisition) """
+    frames = scope.ch1.stream(repeat)
+    return timeit(lambda: next(frames), repeat)
+#
+def bench_read_channels(bench, func_gen, scope, repeat = 10):
+    """ TektronixTBS1062.read_channels on channels 1 and 2 """
+    return timeit(lambda: scope.read_channels(['CH1', 'CH2']), repeat)
+#
+def bench_scope_measurements(bench, func_gen, scope, repeat = 10):
+    """ Vpp, frequency and rms of channel 1 and phase of channel 2 with Measure (one query each) """
+    def measurements():
+        scope.ch1.measure.Vpp(), scope.ch1.measure.frequency(), scope.ch1.measure.rms()
+        scope.ch2.measure.phase()
+    return timeit(measurements, repeat)
+#
+def bench_host_measurements(bench, func_gen, scope, repeat = 10):
+    """ all the measurements of channel 1 and 2 computed by pylef.analysis from one read_channels """
+    def measurements():
+        t, Y = scope.read_channels(['CH1', 'CH2'])
+        analysis.measure(t, Y[0], Y[1])
+    return timeit(measurements, repeat)
+#
+def bench_save_channels(bench, func_gen, scope, repeat = 10):
+    """ TektronixTBS1062.save_channels into a temporary folder """
+    with tempfile.TemporaryDirectory() as folder:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return timeit(lambda: scope.save_channels('bench', PATH = folder + os.sep, time_stamp = False), repeat)
+#
+def bench_sweep_frequency(bench, func_gen, scope, repeat = 1, Nfreq = 5):
+    """ methods.sweep_frequency with Nfreq points between 100 Hz and 10 kHz """
+    with tempfile.TemporaryDirectory() as folder:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return timeit(lambda: methods.sweep_frequency(1e2, 1e4, Nfreq, path = folder, spacing = 'log',
+                                                          func_gen = func_gen, scope = scope), repeat)
+
+def bench_sweep_hardware(bench, func_gen, scope, repeat = 1, n_bins = 50):
+    """ methods.sweep_frequency_hardware between 100 Hz and 10 kHz in 0.5 s """
+    with tempfile.TemporaryDirectory() as folder:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return timeit(lambda: methods.sweep_frequency_hardware(1e2, 1e4, 0.5, n_bins = n_bins, path = folder,
+                                                                   func_gen = func_gen, scope = scope), repeat)
+
+BENCHMARKS = [('read_channel', bench_read_channel),
+              ('read_channel_into', bench_read_channel_into),
+              ('read_window', bench_read_window),
+              ('stream', bench_stream),
+              ('read_channels', bench_read_channels),
+              ('scope_measurements', bench_scope_measurements),
+              ('host_measurements', bench_host_measurements),
+              ('save_channels', bench_save_channels),
+              ('sweep_frequency', bench_sweep_frequency),
+              ('sweep_hardware', bench_sweep_hardware)]
+
+def run(repeat = 10, latency_scale = 1.0, names = None, verbose = True):
+    """
+        Run the benchmarks and return a dictionary {name: list of wall times}.
+
+        Parameters
+        ----------
+        repeat: int - optional
+            number of timed calls of the fast benchmarks (the frequency sweeps
+            run only once)
+        latency_scale: float - optional
+            scale of the latencies of the simulated instruments
+        names: list of strings - optional
+            names of the benchmarks to run (all of them by default)
+        verbose: boolean - optional
+            print a table with the results
+    """
+    results = {}
+    for name, benchmark in BENCHMARKS:
+        if names is not None and name not in names:
+            continue
+        bench, func_gen, scope = setup_bench(latency_scale)
+        if name in ['sweep_frequency', 'sweep_hardware']:
+            results[name] = benchmark(bench, func_gen, scope)
+        else:
+            results[name] = benchmark(bench, func_gen, scope, repeat)
+    if verbose:
+        print('%-20s %8s %12s %12s %12s' % ('benchmark', 'calls', 'mean (ms)', 'min (ms)', 'max (ms)'))
+        for name, times in results.items():
+            times = 1e3*numpy.array(times)
+            print('%-20s %8d %12.2f %12.2f %12.2f' % (name, times.shape[0], times.mean(), times.min(), times.max()))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Wall time benchmarks of pylef on the simulated bench')
+    parser.add_argument('--repeat', type = int, default = 10, help = 'number of timed calls')
+    parser.add_argument('--latency-scale', type = float, default = 1.0, help = 'scale of the simulated latencies')
+    parser.add_argument('names', nargs = '*', help = 'benchmarks to run: ' + ', '.join([name for name, _ in BENCHMARKS]))
+    args = parser.parse_args()
+    run(args.repeat, args.latency_scale, args.names or None)
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,10 @@
 
 import pyvisa as visa   # interface with NI-Visa
 import time # time handling
+import contextlib  # context manager for the deferred completion checks
+import hashlib  # content hash of the arbitrary waveforms
+import collections  # least recently used waveform slots
+import numpy  # module for array manipulation
 ################################
 def read_only_properties(*attrs):
     """
@@ -30,9 +34,9 @@ def read_only_properties(*attrs):
     return class_rebuilder
 
 ##########################
-@read_only_properties('id_bk_hex', 'id_bk_dec', 'instr', 'ch1', 'ch2', )
+@read_only_properties('id_bk_hex', 'id_bk_dec', 'instr', 'ch1', 'ch2', 'shadow', 'waveforms')
 class BK4052:
-    def __init__(self):
+    def __init__(self, resource = None):
         """
         BK4052
         =========
@@ -97,19 +101,70 @@ class BK4052:
         >>> print(info1['type'])      # will return ramp
         >>> info2 = channel2.wave_info()   # current wave information of channel 2
         >>> print(info2['stdev'])          # will return 0.5            
+
+        An already opened pyvisa resource (or a simulated one, see
+        pylef.simulator) can be given as "resource", in which case the USB
+        ports are not searched.
+
+        Instead of a fixed delay, the wait before reading the answers comes
+        from a settle model: the response time of the queries is measured
+        by "calibrate" when the instrument is connected, and the time each
+        kind of command takes to complete is learned from the "*OPC?" that
+        follows it ("settle_times"): the wait is shortened after each check
+        that succeeds, but never below the last wait that worked once a read
+        came too early. A read that comes too early waits at most
+        "probe_timeout" (instead of the 10 s timeout), the late answer is
+        discarded and the wait of that kind of message is lengthened.
+        Several commands can share a single completion check:
+
+        >>> with instrument.deferred():    # one *OPC? at the end
+        ...     channel1.set_frequency(1000)
+        ...     channel1.set_Vpp(2)
+
+        The channels keep a copy of their settings ("shadow"): a setter with
+        the value already set writes nothing and "wave_info", "state", "load"
+        and "sync" are answered from the copy. The copy is taken with one
+        "BSWV?" query and is read again after "copy_to", "copy_from" and
+        "resync". Call "resync" after changing the instrument by other means
+        (the front panel or "write").
+
+        >>> print(instrument.shadow.stats())   # cache hits and misses
+
+        Arbitrary waveforms are given as numpy arrays with one period of the
+        signal. They are quantized to 16 bits, resampled to one of the lengths
+        accepted by the instrument and uploaded once: the generator memory is
+        tracked by the content of the waveforms ("waveforms"), so selecting a
+        waveform already uploaded only writes "ARWV".
+
+        >>> t = numpy.linspace(0, 1, 1000, endpoint = False)
+        >>> channel1.set_arbitrary(numpy.exp(-5*t))   # frequency and Vpp are kept
+        >>> print(instrument.waveforms.stats())   # uploads and bytes transferred
         """
 
         self.id_bk_hex = '0xF4ED'; # identificador do fabricante BK em hexadecimal
         self.id_bk_dec = '62701'; # identificador do fabricante BK em hexadecimal
-        self.delay_time = 0.5 # time to wait after write and query - BK BUG!
-        interface_name = self.find_interface()
+        self.delay_time = 0.5 # time to wait after write and query - BK BUG! (used when the settle model fails)
+        self.settle_times = {}   # time (s) to wait for each kind of message, see "calibrate"
+        self.settle_margin = 1.5   # safety factor of the measured times
+        self.probe_timeout = 1000   # timeout (ms) of the reads that may come too early
+        self.settle_floor = {}   # shortest wait (s) allowed after a read came too early
+        self._worked = {}   # last wait (s) that worked, per kind of message
+        self._deferred = 0   # depth of the "deferred" blocks
+        self._pending = []   # kinds of the commands written since the last "*OPC?"
+        self._written_at = None   # time of the first pending command
         # instrument initialization
-        self.instr = visa.ResourceManager().open_resource(interface_name)   ## resource name
+        if resource is None:
+            interface_name = self.find_interface()
+            resource = visa.ResourceManager().open_resource(interface_name)   ## resource name
+        self.instr = resource
         self.instr.timeout = 10000 # set timeout to 10 seconds
         #self.instr.delay = 1.0 #delay for query
-        self.ch1 = ChannelFuncGen(self.instr, 'CH1', self.write, self.query)
-        self.ch2 = ChannelFuncGen(self.instr, 'CH2', self.write, self.query)
+        self.shadow = ShadowState()   # last known settings of the channels
+        self.waveforms = WaveformStore(self.write_binary)   # arbitrary waveforms in the generator memory
+        self.ch1 = ChannelFuncGen(self.instr, 'CH1', self.write, self.query, self.shadow, self.waveforms)
+        self.ch2 = ChannelFuncGen(self.instr, 'CH2', self.write, self.query, self.shadow, self.waveforms)
         self.instr.chunk_size = 40960  # set the buffer size to 40 kB  
+        self.calibrate()
 
     def find_interface(self):
         """ Function to extract the interface name for the  BK function generator"""
@@ -143,20 +198,162 @@ class BK4052:
     def identify(self):
         """ identify the resource"""
         return self.instr.query('*IDN?')
+#
+    def message_kind(self, msg):
+        """ kind of the message for the settle model: its header without the channel,
+        e.g. 'BSWV' for 'C1:BSWV FRQ,100' and 'BSWV?' for 'C1:BSWV?' """
+        header = str(msg).strip().split(' ')[0].upper()
+        if header[:3] in ['C1:', 'C2:']:
+            header = header[3:]
+        return header
+#
+    def settle_time(self, kind):
+        """ time to wait for a message of the given kind """
+        default = self.settle_times.get('*OPC?', self.delay_time)
+        return self.settle_times.get(kind, default)
+#
+    def calibrate(self, repeat = 3):
+        """ measure the response time of the queries (with no delay before reading and
+        a "probe_timeout" timeout); if the instrument does not answer, the fixed
+        "delay_time" is kept for the remaining queries """
+        messages = ['*OPC?', 'C1:BSWV?', 'C1:OUTP?']
+        with self.timeout(self.probe_timeout):
+            for index, msg in enumerate(messages):
+                kind, elapsed = self.message_kind(msg), []
+                try:
+                    for n in range(repeat):
+                        start = time.perf_counter()
+                        self.instr.write(msg)
+                        self.instr.read()
+                        elapsed.append(time.perf_counter() - start)
+                except visa.VisaIOError:
+                    self.discard_output()
+                    for other in messages[index:]:
+                        self.settle_times[self.message_kind(other)] = self.delay_time
+                    break
+                self.settle_times[kind] = self.settle_margin*max(elapsed)
+        return dict(self.settle_times)
+#
+    @contextlib.contextmanager
+    def timeout(self, timeout):
+        """ context manager: use the given VISA timeout (ms) inside the block """
+        previous = self.instr.timeout
+        self.instr.timeout = timeout
+        try:
+            yield self
+        finally:
+            self.instr.timeout = previous
+#
+    def discard_output(self):
+        """ clear the instrument after a failed read, so that its late answer is not
+        read by the next query """
+        try:
+            self.instr.clear()
+        except visa.VisaIOError:
+            pass
+        return None
+#
+    def settle_success(self, kind, measured = None):
+        """ learn from a completion check that worked after waiting settle_time(kind).
+        measured is the completion time when the instrument was still busy """
+        current = self.settle_time(kind)
+        if measured is not None:
+            self.settle_times[kind] = self._worked[kind] = max(measured, current)
+            return None
+        self._worked[kind] = current
+        # it may have been ready earlier: try a shorter wait next time, but not below the floor
+        self.settle_times[kind] = max(0.8*current, self.settle_floor.get(kind, 0.))
+        return None
+#
+    def settle_failure(self, kind):
+        """ back off after a read that came too early for a message of this kind """
+        current = self.settle_time(kind)
+        worked = self._worked.get(kind, 0.)
+        backoff = worked if worked > current else 2*max(current, 1e-3)   # the floor failed too: double it
+        self.settle_times[kind] = self.settle_floor[kind] = backoff
+        return None
+#
+    @contextlib.contextmanager
+    def deferred(self):
+        """ context manager: the commands written inside the block are checked with a
+        single "*OPC?" at its end, instead of one after each command """
+        self._deferred += 1
+        try:
+            yield self
+        finally:
+            self._deferred -= 1
+            if self._deferred == 0 and len(self._pending) > 0:
+                self.wait()
 #
     def wait(self):
         """ wait for the task to end """
-        return self.instr.query('*OPC?', delay = self.delay_time)
+        pending, written_at = self._pending, self._written_at
+        self._pending, self._written_at = [], None
+        # time still expected for the pending commands
+        expected = sum([self.settle_time(kind) for kind in pending])
+        if written_at is not None:
+            expected -= time.perf_counter() - written_at
+        delay = max(expected, 0.)
+        start = time.perf_counter()
+        try:
+            with self.timeout(self.probe_timeout):
+                output = self.instr.query('*OPC?', delay = delay)
+        except visa.VisaIOError:   # read too early: back off and check again after the fixed delay
+            self.discard_output()
+            for kind in pending:
+                self.settle_failure(kind)
+            return self.instr.query('*OPC?', delay = self.delay_time)
+        if len(pending) == 1:   # learn the completion time of this kind of command
+            now, answer = time.perf_counter(), self.settle_times.get('*OPC?', 0.)/self.settle_margin
+            if now - start - delay > 1.2*answer:   # the instrument was still busy after the delay
+                self.settle_success(pending[0], now - written_at - answer)
+            else:
+                self.settle_success(pending[0])
+        return output
 #
     def write(self, msg):
         """ write into the laser """
         write_output = self.instr.write(str(msg)) 
-        self.wait()
+        if self._written_at is None:
+            self._written_at = time.perf_counter()
+        self._pending.append(self.message_kind(msg))
+        if self._deferred == 0:
+            self.wait()
         return write_output 
         
+    def write_binary(self, msg, data):
+        """ write msg followed by the bytes data, in pieces of at most "chunk_size" bytes
+        sent as a single message. Returns the number of bytes written """
+        message = str(msg).encode('latin-1') + bytes(data) + b'\n'
+        chunk_size = self.instr.chunk_size
+        send_end = self.instr.send_end
+        try:
+            self.instr.send_end = False   # END only with the last piece
+            for start in range(0, len(message) - chunk_size, chunk_size):
+                self.instr.write_raw(message[start:start + chunk_size])
+            self.instr.send_end = True
+            self.instr.write_raw(message[chunk_size*((len(message) - 1)//chunk_size):])
+        finally:
+            self.instr.send_end = send_end
+        if self._written_at is None:
+            self._written_at = time.perf_counter()
+        self._pending.append(self.message_kind(msg))
+        if self._deferred == 0:
+            self.wait()
+        return len(message)
+#
     def query(self, msg):
         """ query into the laser """
-        return self.instr.query(str(msg), delay = self.delay_time)
+        if len(self._pending) > 0:   # the answer must reflect the deferred commands
+            self.wait()
+        kind = self.message_kind(msg)
+        try:
+            with self.timeout(self.probe_timeout):
+                return self.instr.query(str(msg), delay = self.settle_time(kind))
+        except visa.VisaIOError:   # read too early: fall back to the fixed delay
+            self.discard_output()
+            self.settle_times[kind] = self.delay_time
+            return self.instr.query(str(msg), delay = self.delay_time)
      
     def read(self):
         """ read from the laser """
@@ -165,11 +362,126 @@ class BK4052:
     def close(self):
         """ close the instrument """
         return self.instr.close()
+#
+    def resync(self):
+        """ forget the settings kept by the channels and read them again """
+        self.shadow.invalidate()
+        self.ch1.wave_info()
+        self.ch2.wave_info()
+        return None
+
+#######
+class ShadowState:
+    def __init__(self):
+        """
+           Last known settings of the function generator channels: the parsed
+           "BSWV?" answer ("wave") and the answers of the other queries
+           ("responses"), per channel. "hits" counts the queries and writes
+           saved, "misses" the queries sent to the instrument.
+        """
+        self.wave = {'CH1': None, 'CH2': None}
+        self.responses = {'CH1': {}, 'CH2': {}}
+        self.hits, self.misses = 0, 0
+#
+    def invalidate(self, channel = None):
+        """ forget the settings of channel, or of both channels """
+        for name in ([channel] if channel is not None else ['CH1', 'CH2']):
+            self.wave[name] = None
+            self.responses[name] = {}
+#
+    def stats(self):
+        """ return a dictionary with the 'hits', 'misses' and 'hit_rate' of the cache """
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits/total if total > 0 else 0.}
+
+#######
+class WaveformStore:
+    def __init__(self, write_binary, lengths = [1024, 2048, 4096, 8192, 16384], slots = 10):
+        """
+           Arbitrary waveforms uploaded to the function generator, by content:
+           "names" maps the hash of the quantized samples to the name of the
+           waveform in the generator memory, from the least to the most recently
+           used. "write_binary(msg, data)" sends a command followed by binary data
+           (see "BK4052.write_binary") and "lengths" are the numbers of points
+           accepted by the instrument. At most "slots" waveforms ('PY00', 'PY01',
+           ...) are kept in the generator memory: when they are all used, the
+           least recently used one is overwritten (a channel still outputting it
+           changes too).
+        """
+        if slots < 1:
+            raise ValueError('The number of waveform slots must be at least 1')
+        self.write_binary = write_binary
+        self.lengths = sorted(lengths)
+        self.slots = slots
+        self.names = collections.OrderedDict()   # content hash -> waveform name
+        self.uploads, self.hits, self.bytes_written = 0, 0, 0
+#
+    def resample(self, data):
+        """ resample one period of data to the shortest accepted length with at least as
+        many points (or to the longest one). Longer data is low pass filtered to the new
+        Nyquist frequency (harmonics weighted by the Lanczos sigma factors, which keep the
+        Gibbs ringing small) so that it does not alias; shorter data is interpolated
+        (periodic linear interpolation) """
+        data = numpy.asarray(data, dtype = float).ravel()
+        if data.shape[0] < 2:
+            raise ValueError('The waveform must have at least 2 points')
+        if not numpy.all(numpy.isfinite(data)):
+            raise ValueError('The waveform must have only finite values')
+        length = ([n for n in self.lengths if n >= data.shape[0]] + [self.lengths[-1]])[0]
+        if length == data.shape[0]:
+            return data
+        if data.shape[0] > length:   # band limited periodic decimation
+            K = length//2
+            harmonics = numpy.fft.rfft(data)[:K]*numpy.sinc(numpy.arange(K)/K)
+            return numpy.fft.irfft(harmonics, length)*(length/data.shape[0])
+        x = numpy.arange(length)*(data.shape[0]/length)
+        return numpy.interp(x, numpy.arange(data.shape[0] + 1), numpy.append(data, data[0]))
+#
+    def quantize(self, data):
+        """ 16-bit samples (little endian) of data, stretched to the full range of the DAC.
+        The amplitude and the offset of the output are set by the channel (Vpp and offset) """
+        data = self.resample(data)
+        center, half_span = (data.max() + data.min())/2., (data.max() - data.min())/2.
+        if half_span == 0:
+            return numpy.zeros(data.shape[0], dtype = '<i2')
+        samples = numpy.rint((data - center)*(32767./half_span))
+        return numpy.clip(samples, -32767, 32767).astype('<i2')
+#
+    def digest(self, samples):
+        """ content hash of the quantized samples """
+        return hashlib.sha1(samples.tobytes()).hexdigest()
+#
+    def upload(self, data, channel = 'CH1'):
+        """ upload data (one period of the waveform), unless the same samples are already
+        in the generator. Returns the name of the waveform """
+        samples = self.quantize(data)
+        key = self.digest(samples)
+        if key in self.names:
+            self.hits += 1
+            self.names.move_to_end(key)
+            return self.names[key]
+        if len(self.names) < self.slots:
+            name = 'PY%02d' % len(self.names)
+        else:   # reuse the slot of the least recently used waveform
+            name = self.names.popitem(last = False)[1]
+        self.bytes_written += self.write_binary('C' + channel[-1] + ':WVDT WVNM,' + name + ',WAVEDATA,', samples.tobytes())
+        self.uploads += 1
+        self.names[key] = name
+        return name
+#
+    def invalidate(self):
+        """ forget the uploaded waveforms (e.g. after a reset of the instrument) """
+        self.names = collections.OrderedDict()
+#
+    def stats(self):
+        """ return a dictionary with the number of 'uploads', of 'hits' (uploads saved)
+        and the 'bytes_written' """
+        return {'uploads': self.uploads, 'hits': self.hits, 'bytes_written': self.bytes_written}
 
 #######
-@read_only_properties('instrument', 'channel', 'functions', 'other_chan', 'dict_info', 'tag_volts', 'frequency_max', 'frequency_min', 'Vpp_max', 'Vpp_min', 'offset_max', 'offset_min', 'phase_max', 'phase_min', 'symmetry_max', 'symmetry_min', 'duty_max', 'duty_min', 'stdev_max', 'stdev_min', 'mean_max', 'mean_min', 'delay_max', 'delay_min')
+@read_only_properties('instrument', 'channel', 'shadow', 'waveforms', 'functions', 'other_chan', 'dict_info', 'tag_volts', 'frequency_max', 'frequency_min', 'Vpp_max', 'Vpp_min', 'offset_max', 'offset_min', 'phase_max', 'phase_min', 'symmetry_max', 'symmetry_min', 'duty_max', 'duty_min', 'stdev_max', 'stdev_min', 'mean_max', 'mean_min', 'delay_max', 'delay_min')
 class ChannelFuncGen:
-    def __init__(self, instrument, channel, write, query):
+    def __init__(self, instrument, channel, write, query, shadow = None, waveforms = None):
         """
             Class for the channels of the function generator
         """
@@ -177,6 +489,8 @@ class ChannelFuncGen:
         self.write = write
         self.instr = instrument   ## resource name
         self.channel = channel
+        self.shadow = shadow if shadow is not None else ShadowState()   # last known settings
+        self.waveforms = waveforms   # arbitrary waveforms of the instrument (WaveformStore)
         self.functions = ['SINE', 'SQUARE', 'RAMP', 'PULSE', 'NOISE', 'ARB', 'DC']  # list of allowed functions
         self.other_chan = {'CH1':'2', 'CH2':'1'}
         self.dict_info = {'WVTP':'type', 'FRQ':'frequency', 'AMP':'Vpp', 'OFST':'offset', 'PHSE':'phase', 
@@ -202,47 +516,71 @@ class ChannelFuncGen:
         self.mean_min = 0.0     # minimum mean in Voltse
         self.delay_max = 1000   # maximum delay in seconds
         self.delay_min = 0     # minimum duty delay in seconds
+        self.sweep_time_max = 500   # maximum sweep time in seconds
+        self.sweep_time_min = 1e-3     # minimum sweep time in seconds
+        self.sweep_spacings = {'linear': 'LINE', 'log': 'LOG'}
+        self.sweep_triggers = ['INT', 'EXT', 'MAN']
+#
+    def cached_query(self, msg):
+        """ query msg, or return its last answer if the channel settings did not change """
+        responses = self.shadow.responses[self.channel]
+        if msg in responses:
+            self.shadow.hits += 1
+        else:
+            self.shadow.misses += 1
+            responses[msg] = self.query(msg)
+        return responses[msg]
+#
+    def write_setting(self, msg, query, value):
+        """ write msg, which changes the answer of query, unless the cached answer shows
+        that the channel is already at value """
+        answer = self.shadow.responses[self.channel].get(query)
+        if answer is not None and value is not None and answer.split(' ')[-1].strip().startswith(value):
+            self.shadow.hits += 1
+            return None
+        self.shadow.responses[self.channel].pop(query, None)
+        return self.write(msg)
 #
     def state(self):
         """ return the specified channel state """
         #return self.instr.query('C' + self.channel[-1] + ':OUTput?').split(' ')[1].split(',')[0]
-        return self.query('C' + self.channel[-1] + ':OUTput?').split(' ')[1].split(',')[0]
+        return self.cached_query('C' + self.channel[-1] + ':OUTput?').split(' ')[1].split(',')[0]
 #    
     def turn_on(self):
         """ turn the specified channel ON """
-        self.write('C' + self.channel[-1] + ':OUTput ON')
+        self.write_setting('C' + self.channel[-1] + ':OUTput ON', 'C' + self.channel[-1] + ':OUTput?', 'ON')
         return None
 #
     def turn_off(self):
         """ turn the specified channel OFF """
-        self.write('C' + self.channel[-1] + ':OUTput OFF')
+        self.write_setting('C' + self.channel[-1] + ':OUTput OFF', 'C' + self.channel[-1] + ':OUTput?', 'OFF')
         return None
 ####
     def sync(self):
         """ return the specified channel sync response """
-        return self.query('C' + self.channel[-1] + ':SYNC?')
+        return self.cached_query('C' + self.channel[-1] + ':SYNC?')
 #
     def sync_on(self):
         """ turn the specified channel sync ON """
-        self.write('C' + self.channel[-1] + ':SYNC ON')
+        self.write_setting('C' + self.channel[-1] + ':SYNC ON', 'C' + self.channel[-1] + ':SYNC?', 'ON')
         return None
 #    
     def sync_off(self):
         """ turn the specified channel sync OFF """
-        self.write('C' + self.channel[-1] + ':SYNC OFF')
+        self.write_setting('C' + self.channel[-1] + ':SYNC OFF', 'C' + self.channel[-1] + ':SYNC?', 'OFF')
         return None
 #####
     def load(self):
         """ return the specified channel load """
-        return self.query('C' + self.channel[-1] + ':OUTput?')[:-1].split(',')[-1]
+        return self.cached_query('C' + self.channel[-1] + ':OUTput?')[:-1].split(',')[-1]
 #    
     def set_load_hz(self):
         """ set the channel load to HZ """
-        return self.write('C' + self.channel[-1] + ':OUTput LOAD,HZ')
+        return self.write_setting('C' + self.channel[-1] + ':OUTput LOAD,HZ', 'C' + self.channel[-1] + ':OUTput?', None)
 #
     def set_load_50(self):
         """ set the channel load to 50 Ohms """
-        return self.write('C' + self.channel[-1] + ':OUTput LOAD,50')
+        return self.write_setting('C' + self.channel[-1] + ':OUTput LOAD,50', 'C' + self.channel[-1] + ':OUTput?', None)
 ####
     def invert_on(self):
         """ turn the specified channel inversion ON"""
@@ -259,7 +597,7 @@ class ChannelFuncGen:
         val = val.upper()  # convert to upper case
         if val in self.functions:
             cmd = 'C' + self.channel[-1] + ':BSWV WVTP,' + val
-            self.write(cmd)
+            self.write_wave({'type': val.lower()}, cmd)
         else:
             raise ValueError('The functions must be one of those: ' + ', '.join([l.lower() for l in self.functions]))
         return None
@@ -268,7 +606,7 @@ class ChannelFuncGen:
         """set the function generator frequency """
         if val <= self.frequency_max and val >= self.frequency_min:
             cmd = 'C' + self.channel[-1] + ':BSWV FRQ,' + str(float(val)) + 'Hz'
-            self.write(cmd)
+            self.write_wave({'frequency': float(val)}, cmd)
         else: 
             raise ValueError("The frequency must be between %4.2f uHz and %4.2f MHz" % (1e6*self.frequency_min, 1e-6*self.frequency_max))                 
         return None    
@@ -277,7 +615,7 @@ class ChannelFuncGen:
         """set the function generator voltage peak-to-peak """
         if val <= self.Vpp_max and val >= self.Vpp_min:
             cmd = 'C' + self.channel[-1] + ':BSWV AMP,' + str(float(val)) + 'V'
-            self.write(cmd)
+            self.write_wave({'Vpp': float(val)}, cmd)
         else: 
             raise ValueError("The Vpp must be between %4.2f V and %4.2f V" % (self.Vpp_min, self.Vpp_max))                 
         return None
@@ -286,7 +624,7 @@ class ChannelFuncGen:
         """set the function generator offset """
         if val <= self.offset_max and val >= self.offset_min:
             cmd = 'C' + self.channel[-1] + ':BSWV OFST,' + str(float(val)) + 'V'
-            self.write(cmd)
+            self.write_wave({'offset': float(val)}, cmd)
         else: 
             raise ValueError("The offset must be between %4.2f V and %4.2f V" % (self.offset_min, self.offset_max))                 
         return None    
@@ -295,7 +633,7 @@ class ChannelFuncGen:
         """set the function generator phase """
         if val <= self.phase_max and val >= self.phase_min:
             cmd = 'C' + self.channel[-1] + ':BSWV PHSE,' + str(float(val))
-            self.write(cmd)
+            self.write_wave({'phase': float(val)}, cmd)
         else: 
             raise ValueError("The phase must be between %4.2f and %4.2f degrees" % (self.phase_min, self.phase_max))                 
         return None
@@ -304,7 +642,7 @@ class ChannelFuncGen:
         """set the function generator signal symmetry """
         if val <= self.symmetry_max and val >= self.symmetry_min:
             cmd = 'C' + self.channel[-1] + ':BSWV SYM,' + str(float(val))
-            self.write(cmd)
+            self.write_wave({'symmetry': float(val)}, cmd)
         else: 
             raise ValueError("The symmetry must be between %4.0f and %4.0f percent" % (self.symmetry_min, self.symmetry_max))                 
         return None  
@@ -313,7 +651,7 @@ class ChannelFuncGen:
         """set the function generator duty cycle """
         if val <= self.duty_max and val >= self.duty_min:
             cmd = 'C' + self.channel[-1] + ':BSWV DUTY,' + str(float(val))
-            self.write(cmd)
+            self.write_wave({'duty_cycle': float(val)}, cmd)
         else: 
             raise ValueError("The duty cycle must be between %4.0f and %4.0f percent" % (self.duty_min, self.duty_max))                 
         return None
@@ -322,7 +660,7 @@ class ChannelFuncGen:
         """set the function generator mean in Volts"""
         if val <= self.mean_max and val >= self.mean_min:
             cmd = 'C' + self.channel[-1] + ':BSWV MEAN,' + str(float(val)) + 'V'
-            self.write(cmd)
+            self.write_wave({'mean': float(val)}, cmd)
         else: 
             raise ValueError("The noise mean must be between %4.2f V and %4.2f V" % (self.mean_min, self.mean_max))                 
         return None
@@ -331,7 +669,7 @@ class ChannelFuncGen:
         """set the noise function generator standard deviation in Volts"""
         if val <= self.stdev_max and val >= self.stdev_min:
             cmd = 'C' + self.channel[-1] + ':BSWV STDEV,' + str(float(val)) + 'V'
-            self.write(cmd)
+            self.write_wave({'stdev': float(val)}, cmd)
         else: 
             raise ValueError("The standard deviation must be between %4.0f V and %4.0f V" % (self.stdev_min, self.stdev_max))                 
         return None
@@ -340,35 +678,191 @@ class ChannelFuncGen:
         """set the function generator pulse delay in seconds """
         if val <= self.delay_max and val >= self.delay_min:
             cmd = 'C' + self.channel[-1] + ':BSWV DLY,' + str(float(val)) + 'S'
-            self.write(cmd)
+            self.write_wave({'delay': float(val)}, cmd)
         else: 
             raise ValueError("The delay must be between %4.0f s and %4.0f s" % (self.delay_min, self.delay_max))                 
         return None
+#
+    def write_wave(self, values, cmd):
+        """ write the BSWV command cmd, that sets the "wave_info" values, unless the channel
+        already has them. The kept settings are updated """
+        wave = self.cached_wave()
+        if all([self.same_value(wave, key, val) for key, val in values.items()]):
+            self.shadow.hits += 1
+            return None
+        output = self.write(cmd)
+        if 'type' in values:   # the parameters of the new function are not known
+            self.shadow.wave[self.channel] = None
+            return output
+        wave.update(values)
+        if 'frequency' in values and values['frequency'] != 0:
+            wave['period'] = 1./values['frequency']
+        if 'Vpp' in wave and 'offset' in wave:
+            wave['high_level'], wave['low_level'] = wave['offset'] + wave['Vpp']/2., wave['offset'] - wave['Vpp']/2.
+        return output
+#
+    def same_value(self, wave, key, val):
+        """ True if the kept "wave_info" has key equal to val """
+        if key not in wave:
+            return False
+        if isinstance(val, str):
+            return wave[key] == val
+        return abs(wave[key] - val) <= 1e-9*abs(val)
+#
+    def cached_wave(self):
+        """ return the kept "wave_info" of the channel (read from the instrument if unknown) """
+        if self.shadow.wave[self.channel] is None:
+            self.shadow.misses += 1
+            self.shadow.wave[self.channel] = self.parse_wave_info(self.query('C' + self.channel[-1] + ':BSWV?'))
+        return self.shadow.wave[self.channel]
+#
+    def configure(self, **params):
+        """ set several wave parameters with a single BSWV command (and a single completion
+        check). The parameters are the ones of the "set_" functions: 'function', 'frequency',
+        'Vpp', 'offset', 'phase', 'symmetry', 'duty', 'mean', 'stdev' and 'delay'. All of them
+        are checked against the instrument limits before anything is written
+
+        >>> channel1.configure(function = 'sine', frequency = 1000, Vpp = 2, offset = 0)
+        """
+        units = {'frequency': ('FRQ', 'Hz'), 'Vpp': ('AMP', 'V'), 'offset': ('OFST', 'V'), 'phase': ('PHSE', ''),
+                 'symmetry': ('SYM', ''), 'duty': ('DUTY', ''), 'mean': ('MEAN', 'V'), 'stdev': ('STDEV', 'V'),
+                 'delay': ('DLY', 'S')}
+        info_keys = {'duty': 'duty_cycle'}   # names in "wave_info"
+        pairs, values = [], {}
+        if 'function' in params:
+            val = params.pop('function').upper()
+            if val not in self.functions:
+                raise ValueError('The functions must be one of those: ' + ', '.join([l.lower() for l in self.functions]))
+            pairs.append('WVTP,' + val)   # the type goes first: the other values apply to it
+            values['type'] = val.lower()
+        for name, val in params.items():
+            if name not in units:
+                raise ValueError('Unknown parameter "%s". The parameters must be: function, ' % name + ', '.join(units))
+            val_min, val_max = getattr(self, name + '_min'), getattr(self, name + '_max')
+            if not val_min <= val <= val_max:
+                raise ValueError('The %s must be between %g and %g' % (name, val_min, val_max))
+            tag, unit = units[name]
+            pairs.append(tag + ',' + str(float(val)) + unit)
+            values[info_keys.get(name, name)] = float(val)
+        if len(pairs) == 0:
+            return None
+        wave = self.cached_wave()
+        if self.same_value(wave, 'type', values.get('type', wave.get('type'))):   # same function: only the changed values
+            values.pop('type', None)
+            pairs = [pair for pair in pairs if not pair.startswith('WVTP,')]
+            pairs = [pair for pair, (key, val) in zip(pairs, values.items()) if not self.same_value(wave, key, val)]
+        if len(pairs) == 0:
+            self.shadow.hits += 1
+            return None
+        self.write_wave(values, 'C' + self.channel[-1] + ':BSWV ' + ','.join(pairs))
+        return None
 #
     def wave_info(self, raw_output = False):
-        """return the wave information for "channel". If raw_output = True, the output from the function is returned without processing"""
-        output = self.query('C' + self.channel[-1] + ':BSWV?')
+        """return the wave information for "channel". If raw_output = True, the output from the function is returned without processing.
+        The processed information comes from the kept settings of the channel, when they are known"""
         if not raw_output:
-            info = output.split(' ')[-1][:-1].split(',') 
-            info_tags, info_vals = info[0:][::2], info[1:][::2]
-            N = len(info_tags)
-            output = {}
-            for n in list(range(N)):
-                tag = self.dict_info[info_tags[n]]
-                if tag in self.tag_volts_secs:
-                    val = float(info_vals[n][:-1])
-                elif tag == 'frequency':
-                    val = float(info_vals[n][:-2])
-                elif tag == 'type': val = info_vals[n].lower()
-                else: val = float(info_vals[n])
-                output[tag] = val
+            return dict(self.cached_wave())
+        output = self.query('C' + self.channel[-1] + ':BSWV?')
+        self.shadow.misses += 1
+        self.shadow.wave[self.channel] = self.parse_wave_info(output)
         return output
+#
+    def parse_wave_info(self, output):
+        """ convert the answer of "BSWV?" into the dictionary of "wave_info" """
+        info = output.split(' ')[-1][:-1].split(',') 
+        info_tags, info_vals = info[0:][::2], info[1:][::2]
+        N = len(info_tags)
+        output = {}
+        for n in list(range(N)):
+            tag = self.dict_info[info_tags[n]]
+            if tag in self.tag_volts_secs:
+                val = float(info_vals[n][:-1])
+            elif tag == 'frequency':
+                val = float(info_vals[n][:-2])
+            elif tag == 'type': val = info_vals[n].lower()
+            else: val = float(info_vals[n])
+            output[tag] = val
+        return output
+#
+    def set_arbitrary(self, data, frequency = None, Vpp = None, offset = None):
+        """
+            output the arbitrary waveform with one period given by the array data (see
+            "WaveformStore"). The waveform is uploaded only if it is not in the generator
+            yet, and selected only if the channel is not already using it. frequency, Vpp
+            and offset are set with "configure" when given.
+        """
+        if self.waveforms is None:
+            raise ValueError('The channel has no access to the arbitrary waveforms of the instrument')
+        uploads = self.waveforms.uploads
+        name = self.waveforms.upload(data, self.channel)
+        uploaded = self.waveforms.uploads != uploads   # a reused slot must be selected again
+        query = 'C' + self.channel[-1] + ':ARWV?'
+        answer = self.shadow.responses[self.channel].get(query)
+        if not uploaded and answer is not None and answer.strip().split(',')[-1] == name and self.cached_wave().get('type') == 'arb':
+            self.shadow.hits += 1
+        else:
+            self.write('C' + self.channel[-1] + ':ARWV NAME,' + name)
+            self.shadow.invalidate(self.channel)   # the wave type changes to ARB
+            self.shadow.responses[self.channel][query] = 'C' + self.channel[-1] + ':ARWV NAME,' + name
+        params = dict([(key, val) for key, val in [('frequency', frequency), ('Vpp', Vpp), ('offset', offset)] if val is not None])
+        if len(params) > 0:
+            self.configure(**params)
+        return name
+#
+    def set_sweep(self, start, stop, sweep_time, spacing = 'linear', trigger = 'INT', direction = 'UP'):
+        """
+            turn on the hardware frequency sweep of the channel: the frequency goes from
+            "start" to "stop" (Hz) in "sweep_time" seconds, with 'linear' or 'log' spacing,
+            and then starts again. trigger is the sweep trigger source ('INT', 'EXT' or
+            'MAN', see "trigger_sweep"). The sweep trigger output ("TRMD,ON", on the Aux
+            In/Out connector of the rear panel, not the front panel sync output) marks the
+            start of each sweep, so the scope can trigger on it with the EXT source.
+        """
+        for val in [start, stop]:
+            if val > self.frequency_max or val < self.frequency_min:
+                raise ValueError("The frequency must be between %4.2f uHz and %4.2f MHz" % (1e6*self.frequency_min, 1e-6*self.frequency_max))
+        if sweep_time > self.sweep_time_max or sweep_time < self.sweep_time_min:
+            raise ValueError("The sweep time must be between %4.3f s and %4.0f s" % (self.sweep_time_min, self.sweep_time_max))
+        if spacing not in self.sweep_spacings:
+            raise ValueError("The spacing must be one of %s" % list(self.sweep_spacings))
+        if trigger.upper() not in self.sweep_triggers:
+            raise ValueError("The trigger source must be one of %s" % self.sweep_triggers)
+        if direction.upper() not in ['UP', 'DOWN']:
+            raise ValueError("The direction must be 'UP' or 'DOWN'")
+        self.write('C' + self.channel[-1] + ':SWWV STATE,ON,TIME,' + str(float(sweep_time)) + 'S,START,' + str(float(start)) +
+                   'HZ,STOP,' + str(float(stop)) + 'HZ,SWMD,' + self.sweep_spacings[spacing] + ',DIR,' + direction.upper() +
+                   ',TRSR,' + trigger.upper() + ',TRMD,ON')
+        return None
+#
+    def sweep_off(self):
+        """ turn off the frequency sweep: the channel goes back to its basic wave """
+        self.write('C' + self.channel[-1] + ':SWWV STATE,OFF')
+        return None
+#
+    def trigger_sweep(self):
+        """ start one sweep when the trigger source is 'MAN' """
+        self.write('C' + self.channel[-1] + ':SWWV MTRIG')
+        return None
+#
+    def sweep_info(self):
+        """ return the sweep settings of the channel as a dictionary """
+        output = self.query('C' + self.channel[-1] + ':SWWV?').strip()
+        info = output.split(' ')[-1].split(',')
+        units = {'TIME': 'S', 'START': 'HZ', 'STOP': 'HZ'}
+        sweep = {}
+        for tag, val in zip(info[0::2], info[1::2]):
+            if tag in units:
+                sweep[tag.lower()] = float(val.upper().replace(units[tag], ''))
+            else:
+                sweep[tag.lower()] = val
+        return sweep
 #          
     def copy_to(self):
         """
             copy the parameters to this channel from the other channel 
         """
         self.write('PAraCoPy C' + self.other_chan[self.channel] + ',C' + self.channel[-1])
+        self.shadow.invalidate()
         return None
 #          
     def copy_from(self):
@@ -376,6 +870,7 @@ class ChannelFuncGen:
             copy the parameters from this channel to the other channel 
         """
         self.write('PAraCoPy C' + self.channel[-1] + ',C' + self.other_chan[self.channel])
+        self.shadow.invalidate()
         return None
 
 
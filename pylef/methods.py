@@ -9,7 +9,8 @@ import matplotlib.pyplot as plt
 import os   # module for general OS manipulation
 import time # module for time related funtions
 import pandas as pd # module for general data analysis
-import pylef
+from . import analysis
+from .session import Session
 ################################
 
 #bibliotecas para atualizacoa de grafico
@@ -78,7 +79,154 @@ def plot_bode(freq,phase,T,T_dB,spacing='log'):
     return fig
 #***********************************************
 #***********************************************
-def sweep_frequency(freq0, freq1, Nfreq, path = '', fname='', spacing = 'linear', average = 4):
+class LivePlot:
+    '''
+    Diagrama de Bode atualizado ponto a ponto durante uma varredura
+    ===============
+    A figura é criada uma única vez; cada ponto novo só é acrescentado aos
+    dados das curvas e a figura é redesenhada no máximo max_rate vezes por
+    segundo. Com enabled = False nada é mostrado durante a varredura (uso
+    sem tela): a figura só recebe os dados em "close".
+    Uso simples:
+    >>> live = LivePlot(freq, spacing = 'log')
+    >>> live.append(f, T, T_dB, phase)    # a cada ponto medido
+    >>> fig = live.close()                # figura final (para salvar)
+    entrada:
+    --------
+    freq: vetor de frequências da varredura (define os limites do eixo x)
+    spacing (opcional): 'linear' (mostra T) ou 'log' (mostra T_dB)
+    max_rate (opcional): número máximo de atualizações da figura por segundo
+    enabled (opcional): se False, a figura não é mostrada durante a varredura
+    '''
+    def __init__(self, freq, spacing = 'log', max_rate = 2., enabled = True):
+        self.spacing = spacing
+        self.max_rate = max_rate
+        self.enabled = enabled
+        self.n = 0   # número de pontos
+        self.data = np.full((4, max(len(freq), 1)), np.nan)   # frequência, T, T_dB, fase
+        self.handle = None   # saída do notebook com a figura
+        self.last_draw = 0.
+        self.fig, self.ax = plt.subplots(2, sharex=True)
+        self.line_T, = self.ax[0].plot([], [], 'ro')   # transmissão
+        self.line_phase, = self.ax[1].plot([], [], 'bo')   # fase
+        for ax in self.ax:
+            ax.set_xscale(spacing)
+            ax.set_xlim((np.min(freq), np.max(freq)))
+        self.ax[0].set_ylabel('Transmissão (dB)' if spacing == 'log' else 'Transmissão')
+        self.ax[1].set_xlabel('frequência (Hz)')
+        self.ax[1].set_ylabel('Fase (graus)')
+        self.ax[1].set_ylim((-180, 180))
+        plt.close(self.fig)   # mostrada só por "draw"
+#
+    def append(self, freq, T, T_dB, phase):
+        ''' acrescenta um ponto e redesenha a figura se a última atualização foi há mais de 1/max_rate s '''
+        if self.n == self.data.shape[1]:   # mais pontos que o previsto
+            self.data = np.concatenate([self.data, np.full(self.data.shape, np.nan)], axis = 1)
+        self.data[:, self.n] = freq, T, T_dB, phase
+        self.n += 1
+        if self.enabled and time.time() - self.last_draw >= 1./self.max_rate:
+            self.draw()
+        return None
+#
+    def update_lines(self):
+        ''' passa os pontos para as curvas, em ordem de frequência '''
+        freq, T, T_dB, phase = self.data[:, np.argsort(self.data[0, :self.n])]
+        self.line_T.set_data(freq, T_dB if self.spacing == 'log' else T)
+        self.line_phase.set_data(freq, phase)
+        self.ax[0].relim()
+        self.ax[0].autoscale_view(scalex = False)
+        return None
+#
+    def draw(self):
+        ''' redesenha a figura (na mesma saída do notebook) '''
+        self.update_lines()
+        if self.handle is None:
+            self.handle = display(self.fig, display_id = True)
+        else:
+            self.handle.update(self.fig)
+        self.last_draw = time.time()
+        return None
+#
+    def close(self):
+        ''' última atualização da figura. Retorna a figura '''
+        if self.enabled:
+            self.draw()
+        else:
+            self.update_lines()
+        return self.fig
+#***********************************************
+#***********************************************
+class ScalePredictor:
+    '''
+    Previsão da escala vertical de um canal ao longo de uma varredura
+    ===============
+    A escala e a posição do próximo ponto são extrapoladas (retas em
+    função de log(frequência)) a partir do Vpp e da posição dos últimos
+    pontos medidos. O canal só é alterado se a curva prevista não couber
+    bem na escala atual, e o "set_auto_scale" só corrige a previsão quando
+    a curva sai da tela ou fica pequena demais.
+    Uso simples:
+    >>> predictor = ScalePredictor(scope.ch2)
+    >>> predictor.seed(freq)              # ajusta escala e posição previstas
+    >>> scope.ch2.set_auto_scale()        # confere (e corrige, se necessário)
+    >>> predictor.update(freq, Vpp2)      # guarda o ponto medido
+    entrada:
+    --------
+    channel: canal do osciloscópio (pylef.scope.ChannelScope)
+    n_points (opcional): número de pontos usados na extrapolação
+    Vmax, D, min_fill (opcionais): os mesmos de "set_auto_scale"
+    margin (opcional): folga da previsão: a escala atual é mantida se a curva prevista
+        ocupar entre margin*min_fill*2*Vmax e 2*Vmax/margin divisões, isto é, se passar no
+        teste de "set_auto_scale" mesmo com um erro de previsão de (margin - 1) no Vpp
+    '''
+    def __init__(self, channel, n_points = 3, Vmax = 4., D = 0.75, min_fill = 0.3, margin = 1.2):
+        self.channel = channel
+        self.n_points = n_points
+        self.Vmax, self.D, self.min_fill = Vmax, D, min_fill
+        self.margin = margin
+        self.points = []   # (log10(freq), log10(Vpp), posição)
+        self.current = None   # (escala, posição) do canal no último ponto
+#
+    def update(self, freq, Vpp):
+        ''' guarda o Vpp medido na frequência freq e a posição atual do canal (lida do preâmbulo em cache) '''
+        if Vpp <= 0 or Vpp > 1e30:   # medida inválida (o osciloscópio retorna 9.9E37)
+            return None
+        [_, [_, y_factor, y_offset]] = self.channel.cached_conversion()
+        self.current = (25.*y_factor, y_offset/25.)
+        self.points = (self.points + [(np.log10(freq), np.log10(Vpp), y_offset/25.)])[-self.n_points:]
+        return None
+#
+    def predict(self, freq):
+        ''' retorna (escala, posição) previstas para a frequência freq, ou None sem pontos anteriores '''
+        if len(self.points) == 0:
+            return None
+        logf, logV, pos = np.array(self.points).T
+        if len(self.points) == 1 or np.ptp(logf) == 0:
+            logV_pred, pos_pred = logV[-1], pos[-1]
+        else:
+            logV_pred = np.polyval(np.polyfit(logf, logV, 1), np.log10(freq))
+            pos_pred = np.polyval(np.polyfit(logf, pos, 1), np.log10(freq))
+        logV_pred = np.clip(logV_pred, logV[-1] - 1., logV[-1] + 1.)   # no máximo uma década por ponto
+        pos_pred = np.clip(pos_pred, -(self.Vmax - self.D), self.Vmax - self.D)
+        return (10**logV_pred/(2*(self.Vmax - self.D)), float(pos_pred))
+#
+    def seed(self, freq):
+        ''' ajusta o canal com a escala e a posição previstas para a frequência freq, se
+        a curva prevista não couber bem na escala atual. Retorna True se o canal foi alterado '''
+        prediction = self.predict(freq)
+        if prediction is None:
+            return False
+        scale, position = prediction
+        span = 2*(self.Vmax - self.D)*scale/self.current[0]   # divisões ocupadas na escala atual
+        # "set_auto_scale" aceita min_fill*2*Vmax <= span <= 2*Vmax; a folga cobre o erro da previsão
+        span_min, span_max = self.margin*self.min_fill*2*self.Vmax, 2*self.Vmax/self.margin
+        if abs(position - self.current[1]) < 0.5 and span_min <= span <= span_max:
+            return False
+        self.channel.set_scale_position(scale, position)
+        return True
+#***********************************************
+#***********************************************
+def sweep_frequency(freq0, freq1, Nfreq, path = '', fname='', spacing = 'linear', average = 4, func_gen = None, scope = None, predict_scale = True, measure = 'scope', live_plot = True, session = None, tolerance = (0.5, 5.), checkpoint = None, resume = False, fsync = 1.):
     '''
     Função para realizar um sweep e fazer gráfico
     ===============
@@ -87,9 +235,29 @@ def sweep_frequency(freq0, freq1, Nfreq, path = '', fname='', spacing = 'linear'
     figure: figura
     freq0: frequência inicial (Hz)
     freq1: frequencia final (Hz)
-    Nfreq: número de pontos no vetor de frequências
-    spacing (opcional): 'linear' (espaçamento linear) ou 'log' (espaçamento logarítmico)
+    Nfreq: número de pontos no vetor de frequências (no modo 'adaptive', o número máximo de pontos)
+    spacing (opcional): 'linear' (espaçamento linear), 'log' (espaçamento logarítmico) ou 'adaptive' (começa
+        com um terço dos pontos em escala log e acrescenta pontos onde a curva é mal descrita pelos vizinhos,
+        ver next_adaptive_frequency, até que o erro fique abaixo da tolerância ou se chegue a Nfreq pontos)
+    tolerance (opcional): erros aceitos no modo 'adaptive', (transmissão em dB, fase em graus)
+    checkpoint (opcional): arquivo onde cada ponto é gravado assim que é medido (ver SweepCheckpoint)
+    resume (opcional): se True, os pontos já gravados em checkpoint não são medidos de novo, e a varredura
+        continua de onde parou; se False, o arquivo checkpoint é reescrito
+    fsync (opcional): quando forçar a gravação do checkpoint no disco: 'point' (a cada ponto), 'never' (o
+        sistema operacional decide) ou o intervalo mínimo, em segundos, entre duas gravações
     average: número de médias a serem realizadas
+    path (opcional): pasta onde salvar os arquivos; por padrão '/Users/usuario/F429/'
+    func_gen (opcional): gerador de funções já conectado (pylef.BK4052); se omitido, um novo é criado
+    scope (opcional): osciloscópio já conectado (pylef.TektronixTBS1062); se omitido, um novo é criado
+    session (opcional): sessão (pylef.Session) com os instrumentos já conectados, usados quando func_gen e
+        scope são omitidos; assim varreduras seguidas não repetem a conexão e a inicialização dos instrumentos
+    predict_scale (opcional): se True, as escalas dos canais são previstas a partir dos pontos anteriores (ScalePredictor)
+    measure (opcional): 'scope' (medidas PK2PK e PHASE do osciloscópio) ou 'fit' (ajuste de senoides às curvas
+        dos dois canais na frequência do gerador, ver pylef.analysis.sine_transfer; a tabela inclui as incertezas
+        e, em geral, bastam menos médias)
+    live_plot (opcional): se True, o diagrama de Bode é atualizado durante a varredura (LivePlot, no máximo
+        2 vezes por segundo); se False, a figura só é feita ao final (uso sem tela)
+    Os instrumentos passados como argumento (ou pela sessão) não são fechados ao final da varredura.
     '''
     # display(Javascript("""
     # require(
@@ -105,57 +273,112 @@ def sweep_frequency(freq0, freq1, Nfreq, path = '', fname='', spacing = 'linear'
     #     }
     # );"""))
 
-    func_gen = pylef.BK4052()  # definição do gerador de funções
-    scope = pylef.TektronixTBS1062()  # definição do osciloscópio
-    #------------------
-    #constroi vetor de frequencias
-    #------------------
-    if spacing == 'linear':
-        freq = np.linspace(freq0, freq1, Nfreq, endpoint = True)  # varredura logaritmica
-    elif spacing == 'log':
-        freq = np.logspace(np.log10(freq0), np.log10(freq1), Nfreq, endpoint = True)  # varredura logaritmica
-    else:
-        raise ValueError('O espaçamento entre os pontos deve ser linear ou log')
-    #### Aquisição de dados!! ####
-    scope.set_average_number(average)  # ajusta o número de médias
-    scope.set_average()    # turn average ON
-    #-----------------
-    Vpp1, Vpp2 = [], []    # listas para guardar as variáveis
-    #phase1, phase2 = [], []    # listas para guardar as variáveis
-    phase = []   # listas para guardar as variáveis
-    ### aquisição de dados no gerador com varredura de frequência
-    scope.write('MEASUREment:MEAS1:TYPE NONE')
-    scope.write('MEASUREment:MEAS2:TYPE NONE')
-    scope.write('MEASUREment:MEAS3:TYPE NONE')
-    scope.write('MEASUREment:MEAS4:TYPE NONE')
-    scope.write('MEASUREment:MEAS5:TYPE NONE')
-    for m, freqP in enumerate(list(freq)):  # loop de aquisição
-        #print('Medida ' + str(m + 1))
-        print('Frequencia atual={:2g} Hz'.format(freq[m]))
-        start=time.time()
-        ### ajuste dos instrumentos
-        func_gen.ch1.set_frequency(freqP)   # muda a frequência
-        periodP = 1./freqP   # período da onda
-        scope.set_horizontal_scale(periodP/4.)  # escala horizontal = 1/4 período (2.5 oscilações em tela)
-        scope.ch1.set_smart_scale()    #  rescala o canal 1
-        scope.ch2.set_smart_scale()    #  rescala o canal 2
-        ### aquisição de dados
-        Vpp1.append(scope.ch1.measure.Vpp()) # acumula a medida do Vpp no canal 1
-        phase.append(-scope.ch1.measure.phase()) # acumula a medida da fase no canal 1
-        Vpp2.append(scope.ch2.measure.Vpp())  # acumula a medida do Vpp no canal 2
-        #---------plotting stuff-------
-        T = (np.array(Vpp2)/np.array(Vpp1))**2   # cálculo da transmissão
-        T_dB = 10*np.log10(T)  # transmissão em dB
-        # plota o diagrama de bode para a transmissão e exporta em png
-        fig = plot_bode(freq,phase,T,T_dB,spacing)
-        #-------
+    close_session = session is None
+    if session is None:
+        session = Session(func_gen, scope)   # cria (e fecha ao final) os instrumentos que faltarem
+    saved = None   # arquivo com os pontos já medidos
+    try:   # o checkpoint e os instrumentos são fechados mesmo se a varredura for interrompida
+        func_gen, scope = session.instruments(func_gen, scope)   # definição do gerador de funções e do osciloscópio
+        #------------------
+        #constroi vetor de frequencias
+        #------------------
+        if spacing == 'linear':
+            freq = np.linspace(freq0, freq1, Nfreq, endpoint = True)  # varredura logaritmica
+        elif spacing == 'log':
+            freq = np.logspace(np.log10(freq0), np.log10(freq1), Nfreq, endpoint = True)  # varredura logaritmica
+        elif spacing == 'adaptive':
+            freq = np.logspace(np.log10(freq0), np.log10(freq1), min(Nfreq, max(5, Nfreq//3)), endpoint = True)  # grade inicial
+        else:
+            raise ValueError('O espaçamento entre os pontos deve ser linear, log ou adaptive')
+        plot_spacing = 'log' if spacing == 'adaptive' else spacing   # escala do eixo das frequências
+        if measure not in ['scope', 'fit']:
+            raise ValueError("As medidas devem ser 'scope' ou 'fit'")
+        #### Aquisição de dados!! ####
+        scope.set_average_number(average)  # ajusta o número de médias
+        scope.set_average()    # turn average ON
+        #-----------------
+        Vpp1, Vpp2 = [], []    # listas para guardar as variáveis
+        #phase1, phase2 = [], []    # listas para guardar as variáveis
+        phase = []   # listas para guardar as variáveis
+        errors = {'Vpp1_std': [], 'Vpp2_std': [], 'phase_std': []}   # incertezas do ajuste (measure = 'fit')
+        ### aquisição de dados no gerador com varredura de frequência
+        # medidas programadas uma única vez e lidas com uma só consulta a cada ponto
+        if measure == 'scope':
+            scope.measurements.configure([('Vpp1', ('PK2PK', 'CH1')),
+                                          ('phase', ('PHASE', 'CH1', 'CH2')),
+                                          ('Vpp2', ('PK2PK', 'CH2'))])
+        predictors = [ScalePredictor(scope.ch1), ScalePredictor(scope.ch2)] if predict_scale else []
+        live = LivePlot(freq, plot_spacing, enabled = live_plot)   # figura criada uma única vez
+        freq_done = []   # frequências medidas
+        if checkpoint is not None:
+            keys = ['frequency', 'Vpp1', 'Vpp2', 'phase'] + (list(errors) if measure == 'fit' else [])
+            saved = SweepCheckpoint(checkpoint, keys, fsync)
+            for values in saved.open(resume):   # pontos de uma varredura interrompida
+                freq_done.append(values['frequency'])
+                Vpp1.append(values['Vpp1'])
+                Vpp2.append(values['Vpp2'])
+                phase.append(values['phase'])
+                for key in errors if measure == 'fit' else []:
+                    errors[key].append(values[key])
+                T = values['Vpp2']/values['Vpp1']
+                live.append(values['frequency'], T, 20*np.log10(T), values['phase'])
+        queue = [freqP for freqP in freq if not np.any(np.isclose(freqP, freq_done, rtol = 1e-8, atol = 0.))]   # frequências a medir
+        start = time.time()
+        while True:  # loop de aquisição
+            if spacing == 'adaptive' and len(queue) == 0 and len(freq_done) < Nfreq:   # próximo ponto adaptativo
+                freq_next = next_adaptive_frequency(freq_done, 20*np.log10(np.array(Vpp2)/np.array(Vpp1)), phase, tolerance)
+                if freq_next is not None:
+                    queue.append(freq_next)
+            if len(queue) == 0:
+                break
+            freqP = queue.pop(0)
+            print('Frequencia atual={:2g} Hz'.format(freqP))
+            ### ajuste dos instrumentos
+            func_gen.ch1.set_frequency(freqP)   # muda a frequência
+            periodP = 1./freqP   # período da onda
+            scope.set_horizontal_scale(periodP/4.)  # escala horizontal = 1/4 período (2.5 oscilações em tela)
+            for predictor in predictors:
+                predictor.seed(freqP)    # escala prevista pelos pontos anteriores
+            scope.ch1.set_auto_scale()    #  rescala o canal 1
+            scope.ch2.set_auto_scale()    #  rescala o canal 2
+            ### aquisição de dados
+            if measure == 'scope':
+                values = scope.measurements.read()
+                values['phase'] = -values['phase']
+            else:
+                t, Y = scope.read_channels(['CH1', 'CH2'])   # uma única transferência para os dois canais
+                values = analysis.sine_transfer(t, Y[0], Y[1], freqP)
+                for key in errors:
+                    errors[key].append(values[key])
+            Vpp1.append(values['Vpp1']) # acumula a medida do Vpp no canal 1
+            phase.append(values['phase']) # acumula a medida da fase entre os canais 1 e 2
+            Vpp2.append(values['Vpp2'])  # acumula a medida do Vpp no canal 2
+            for predictor, Vpp in zip(predictors, [values['Vpp1'], values['Vpp2']]):
+                predictor.update(freqP, Vpp)
+            #---------plotting stuff-------
+            T = values['Vpp2']/values['Vpp1']   # cálculo da transmissão
+            live.append(freqP, T, 20*np.log10(T), values['phase'])   # acrescenta o ponto ao diagrama de bode
+            #-------
+            freq_done.append(freqP)
+            if saved is not None:
+                values['frequency'] = freqP
+                saved.append(values)   # grava o ponto no checkpoint
+    finally:
+        if saved is not None:
+            saved.close()
+        if close_session:
+            session.close()
     print('Fim! Tempo total de medida={:2g} s'.format(time.time()-start))
-    Vpp1 = np.array(Vpp1)  # convete a lista em array
-    Vpp2 = np.array(Vpp2)  # convete a lista em array
-    phase = np.array(phase)  # convete a lista em array
-    ''' encerra a comunicação osciloscópio e o gerador de funções '''
-    scope.close()
-    func_gen.close()
+    fig = live.close()   # figura final, exportada em png
+    freq = np.array(freq_done)  # frequências medidas
+    order = np.argsort(freq)   # em ordem de frequência (pontos adaptativos e retomados)
+    if spacing != 'adaptive' and freq0 > freq1:
+        order = order[::-1]
+    freq = freq[order]
+    Vpp1 = np.array(Vpp1)[order]  # convete a lista em array
+    Vpp2 = np.array(Vpp2)[order]  # convete a lista em array
+    phase = np.array(phase)[order]  # convete a lista em array
+    errors = dict([(key, np.array(val)[order]) for key, val in errors.items() if len(val) > 0])
     ''' organizando dados'''
     # calculando a transmitância
     T = Vpp2 / Vpp1  # cálculo da transmissão
@@ -165,10 +388,152 @@ def sweep_frequency(freq0, freq1, Nfreq, path = '', fname='', spacing = 'linear'
     dados['Vpp1 (V)'], dados['Vpp2 (V)'] = Vpp1, Vpp2
     dados['fase (Ch2-Ch1) (graus)'] = phase
     dados['frequencia (Hz)'], dados['T'], dados['T_dB'] = freq, T, T_dB
+    if measure == 'fit':
+        dados['incerteza Vpp1 (V)'], dados['incerteza Vpp2 (V)'] = errors['Vpp1_std'], errors['Vpp2_std']
+        dados['incerteza fase (graus)'] = errors['phase_std']
+    save_sweep(fig, dados, path, fname)
+    return fig, dados
+#***********************************************
+#***********************************************
+class SweepCheckpoint:
+    '''
+    Arquivo com os pontos de uma varredura, gravados à medida que são medidos
+    ===============
+    Cada ponto é uma linha (colunas separadas por tabulação, com cabeçalho)
+    acrescentada ao final do arquivo, que nunca é reescrito durante a varredura:
+    uma falha (queda do USB, erro, fim do tempo) perde no máximo o ponto em
+    curso, e a varredura pode ser retomada a partir do arquivo. O arquivo pode
+    ser lido com pandas.read_csv(filename, sep = '\t').
+    Uso simples:
+    >>> saved = SweepCheckpoint('sweep.dat', ['frequency', 'Vpp1', 'Vpp2', 'phase'])
+    >>> points = saved.open(resume = True)     # pontos já gravados (dicionários)
+    >>> saved.append({'frequency': 1e3, 'Vpp1': 2., 'Vpp2': 1.4, 'phase': -45.})
+    >>> saved.close()
+    entrada:
+    --------
+    filename: nome do arquivo
+    keys: nomes dos valores de cada ponto
+    fsync (opcional): 'point' (os.fsync a cada ponto), 'never' (só flush: o sistema
+        operacional decide quando gravar no disco) ou o intervalo mínimo, em segundos,
+        entre dois os.fsync, para que a gravação não atrase a aquisição
+    '''
+    names = {'frequency': 'frequencia (Hz)', 'Vpp1': 'Vpp1 (V)', 'Vpp2': 'Vpp2 (V)', 'phase': 'fase (Ch2-Ch1) (graus)',
+             'Vpp1_std': 'incerteza Vpp1 (V)', 'Vpp2_std': 'incerteza Vpp2 (V)', 'phase_std': 'incerteza fase (graus)'}   # cabeçalho
+    def __init__(self, filename, keys, fsync = 1.):
+        if fsync not in ['point', 'never'] and not (isinstance(fsync, (int, float)) and fsync >= 0):
+            raise ValueError("fsync deve ser 'point', 'never' ou um intervalo em segundos")
+        self.filename = filename
+        self.keys = list(keys)
+        self.fsync = fsync
+        self.file = None
+        self.last_sync = 0.
+#
+    def header(self):
+        ''' primeira linha do arquivo '''
+        return '\t'.join([self.names.get(key, key) for key in self.keys])
+#
+    def open(self, resume = False):
+        ''' abre o arquivo para acrescentar pontos. Com resume = True, retorna a lista dos pontos
+        já gravados (uma linha incompleta no final é descartada); senão, o arquivo é reescrito '''
+        points = []
+        if resume and os.path.exists(self.filename) and os.path.getsize(self.filename) > 0:
+            with open(self.filename, 'rb+') as f:
+                data = f.read()
+                end = data.rfind(b'\n') + 1
+                lines = data[:end].decode('utf-8').splitlines()
+                if len(lines) > 0 and lines[0] != self.header():   # antes de alterar o arquivo
+                    raise ValueError('As colunas de %s não são as desta varredura' % self.filename)
+                if end < len(data):   # linha interrompida no meio da gravação
+                    f.truncate(end)
+            for line in lines[1:]:
+                points.append(dict(zip(self.keys, [float(val) for val in line.split('\t')])))
+        else:
+            resume = False
+        folder = os.path.dirname(self.filename)
+        if folder != '' and not os.path.isdir(folder):
+            os.makedirs(folder)
+        self.file = open(self.filename, 'a' if resume else 'w', encoding = 'utf-8')
+        if not resume or self.file.tell() == 0:
+            self.file.write(self.header() + '\n')
+        self.sync(force = True)
+        return points
+#
+    def append(self, values):
+        ''' grava um ponto (dicionário com os valores de "keys") '''
+        self.file.write('\t'.join(['%.10g' % values[key] for key in self.keys]) + '\n')
+        self.sync()
+        return None
+#
+    def sync(self, force = False):
+        ''' passa os pontos ao sistema operacional e, segundo a política "fsync", ao disco '''
+        self.file.flush()
+        if self.fsync == 'never':
+            return None
+        now = time.time()
+        if force or self.fsync == 'point' or now - self.last_sync >= self.fsync:
+            os.fsync(self.file.fileno())
+            self.last_sync = now
+        return None
+#
+    def close(self):
+        ''' grava o que falta e fecha o arquivo '''
+        if self.file is not None:
+            self.sync(force = True)
+            self.file.close()
+            self.file = None
+        return None
+#***********************************************
+#***********************************************
+def next_adaptive_frequency(freq, T_dB, phase, tolerance = (0.5, 5.), min_ratio = 1.01):
+    '''
+    Próxima frequência de uma varredura adaptativa
+    ===============
+    Em cada ponto interno, compara a transmissão (dB) e a fase (graus) medidas
+    com a interpolação linear, em log(frequência), entre os pontos vizinhos. O
+    erro, em unidades de tolerance, é atribuído aos dois intervalos do ponto
+    (grande nas ressonâncias e nas frequências de corte). Retorna o centro
+    (em escala log) do intervalo com o maior erro, ou None se todos os erros
+    estão dentro da tolerância ou os centros dos intervalos com erro estão a
+    menos da razão min_ratio de frequências já medidas. Os pontos com medidas
+    inválidas (o osciloscópio retorna 9.9E37, no Vpp ou na fase) não entram na
+    interpolação.
+    entrada:
+    --------
+    freq, T_dB, phase: pontos já medidos (em qualquer ordem)
+    tolerance (opcional): (erro em dB, erro em graus)
+    '''
+    freq, T_dB, phase = [np.asarray(val, dtype = float) for val in [freq, T_dB, phase]]
+    # um Vpp de 9.9E37 dá |T_dB| de ~750 dB, fora do alcance de qualquer medida (8 bits por canal)
+    valid = np.isfinite(T_dB) & (np.abs(T_dB) < 300.) & np.isfinite(phase) & (np.abs(phase) < 1e30)
+    order = np.flatnonzero(valid)[np.argsort(freq[valid])]
+    if order.shape[0] < 3:
+        return None
+    x = np.log10(freq[order])
+    y = np.stack([T_dB[order]/tolerance[0], np.rad2deg(np.unwrap(np.deg2rad(phase[order])))/tolerance[1]])
+    w = (x[1:-1] - x[:-2])/(x[2:] - x[:-2])   # posição de cada ponto interno entre os vizinhos
+    error = np.abs(y[:, 1:-1] - ((1 - w)*y[:, :-2] + w*y[:, 2:])).max(axis = 0)
+    score = np.zeros(x.shape[0] - 1)   # erro de cada intervalo
+    score[:-1] = error
+    score[1:] = np.maximum(score[1:], error)
+    for k in np.argsort(score)[::-1]:   # do maior para o menor erro
+        if score[k] <= 1.:
+            break
+        x_new = (x[k] + x[k + 1])/2.
+        if np.abs(np.log10(freq) - x_new).min() >= np.log10(min_ratio)/2.:   # longe de todos os pontos medidos
+            return 10**x_new
+    return None
+#***********************************************
+#***********************************************
+def save_sweep(fig, dados, path = '', fname = ''):
+    '''
+    Salva a figura (png) e a tabela (dat, colunas separadas por tabulação) de uma varredura
+    numa pasta com a data e a hora dentro de path; por padrão '/Users/usuario/F429/'.
+    Retorna os nomes dos dois arquivos.
+    '''
     ## parametros de varredura
-    path0 = '/Users/usuario/F429/'  # pasta onde salvar todos os arquivos
+    path0 = path if path != '' else '/Users/usuario/F429/'  # pasta onde salvar todos os arquivos
     datapasta = time.strftime('dia_%D_hora_%H', time.localtime(time.time())).replace('/','-')
-    path = path0+datapasta
+    path = os.path.join(path0, datapasta)
     if fname=='':
         fname = 'sweep'
     ##--------------------------------------------------------
@@ -186,6 +551,100 @@ def sweep_frequency(freq0, freq1, Nfreq, path = '', fname='', spacing = 'linear'
     # Salvando
     fig.savefig(nome_fig, bbox_inches='tight')  # salva figura na pasta de trabalho
     dados.to_csv(nome_csv, sep='\t', index=False)  # \t significa que o separador é uma tabulação, index=False remove os indices da coluna
+    return nome_fig, nome_csv
+#***********************************************
+#***********************************************
+def sweep_time_to_frequency(t, freq0, freq1, sweep_time, spacing = 'log'):
+    '''
+    Frequência instantânea de uma varredura do gerador (ChannelFuncGen.set_sweep) que
+    começa em t = 0 com freq0 e termina em t = sweep_time com freq1
+    '''
+    x = np.clip(np.asarray(t, dtype = float)/sweep_time, 0., 1.)
+    if spacing == 'log':
+        return freq0*(freq1/freq0)**x
+    elif spacing == 'linear':
+        return freq0 + (freq1 - freq0)*x
+    raise ValueError('O espaçamento entre os pontos deve ser linear ou log')
+#***********************************************
+#***********************************************
+def sweep_frequency_hardware(freq0, freq1, sweep_time = 1., spacing = 'log', n_bins = 100, path = '', fname = '', func_gen = None, scope = None, session = None):
+    '''
+    Varredura rápida usando a varredura de frequência do próprio gerador
+    ===============
+    O canal 1 do gerador varre de freq0 a freq1 em sweep_time segundos e o osciloscópio
+    (detecção de pico, disparo EXT pela saída de disparo da varredura do gerador) captura uma
+    varredura inteira em uma única aquisição (ACQuire:STOPAfter SEQuence); a fonte e a
+    inclinação do disparo, a escala e a posição horizontais e o modo de aquisição do
+    osciloscópio são restaurados ao final. A tela é dividida em n_bins intervalos de tempo;
+    em cada um, Vpp é a diferença entre o máximo e o mínimo (envoltória) e a frequência é a
+    do centro do intervalo.
+    Uso simples:
+    >>> figure, dados = sweep_frequency_hardware(freq0, freq1, sweep_time = 1., spacing = 'log')
+    freq0: frequência inicial (Hz)
+    freq1: frequencia final (Hz)
+    sweep_time (opcional): duração da varredura (s); deve ser longa comparada ao tempo de resposta do circuito
+    spacing (opcional): 'linear' ou 'log' (varredura logarítmica do gerador)
+    n_bins (opcional): número de pontos; cada intervalo deve conter ao menos um período de freq0
+    path, fname (opcional): pasta e nome dos arquivos (ver save_sweep)
+    func_gen, scope (opcional): instrumentos já conectados, que não são fechados ao final
+    session (opcional): sessão (pylef.Session) com os instrumentos já conectados (ver sweep_frequency)
+    A fase não é medida (a coluna de fase fica com NaN); use sweep_frequency quando ela for necessária.
+    '''
+    if spacing not in ['linear', 'log']:
+        raise ValueError('O espaçamento entre os pontos deve ser linear ou log')
+    n_bins = int(min(n_bins, sweep_time*min(freq0, freq1)))   # ao menos um período por intervalo
+    if n_bins < 2:
+        raise ValueError('A varredura é curta demais: sweep_time*freq0 deve ser pelo menos 2')
+    close_session = session is None
+    if session is None:
+        session = Session(func_gen, scope)   # cria (e fecha ao final) os instrumentos que faltarem
+    try:   # os instrumentos criados aqui são fechados mesmo se a varredura for interrompida
+        func_gen, scope = session.instruments(func_gen, scope)   # definição do gerador de funções e do osciloscópio
+        start = time.time()
+        ### ajuste dos instrumentos (guarda os ajustes do osciloscópio que são alterados)
+        source, slope = scope.trigger.source(), scope.trigger.slope().split(' ')[-1]
+        scale, position = scope.horizontal_scale(), scope.horizontal_position()
+        mode = scope.acquisition_mode()
+        try:
+            func_gen.ch1.set_sweep(freq0, freq1, sweep_time, spacing = spacing)
+            scope.set_peak_detect()   # guarda a envoltória das oscilações rápidas
+            scope.set_horizontal_scale(sweep_time/10.)   # uma varredura inteira na tela
+            scope.set_horizontal_position(sweep_time/2.)   # o disparo (início da varredura) na borda esquerda
+            scope.trigger.set_source('EXT')   # saída de disparo da varredura do gerador
+            scope.trigger.set_slope_rise()
+            scope.ch1.set_auto_scale()    #  rescala o canal 1
+            scope.ch2.set_auto_scale()    #  rescala o canal 2
+            # uma única aquisição, disparada no início de uma varredura e completa (até duas varreduras)
+            scope.single_acquisition(timeout = 2*sweep_time + 10.)
+            t, Y = scope.read_channels(['CH1', 'CH2'])   # uma única transferência para os dois canais
+        finally:
+            func_gen.ch1.sweep_off()
+            scope.set_run_stop()
+            scope.set_acquisition_mode(mode)
+            scope.trigger.set_source(source)
+            if slope.upper().startswith('FALL'):
+                scope.trigger.set_slope_fall()
+            else:
+                scope.trigger.set_slope_rise()
+            scope.set_horizontal_scale(scale)
+            scope.set_horizontal_position(position)
+    finally:
+        if close_session:
+            session.close()
+    ### envoltória em cada intervalo de tempo
+    index = np.clip(((t - t[0])/sweep_time*n_bins).astype(int), 0, n_bins - 1)
+    edges = np.searchsorted(index, np.arange(n_bins))   # primeiro ponto de cada intervalo
+    Vpp1, Vpp2 = [np.maximum.reduceat(y, edges) - np.minimum.reduceat(y, edges) for y in Y]
+    freq = sweep_time_to_frequency((np.arange(n_bins) + 0.5)*sweep_time/n_bins, freq0, freq1, sweep_time, spacing)
+    phase = np.full(n_bins, np.nan)   # a fase não é medida
+    print('Fim! Tempo total de medida={:2g} s'.format(time.time()-start))
+    ''' organizando dados'''
+    T = Vpp2 / Vpp1  # cálculo da transmissão
+    T_dB = 20 * np.log10(T)  # transmissão em dB
+    fig = plot_bode(freq, phase, T, T_dB, spacing)
+    dados = pd.DataFrame()  # inicializa um dataframe do pandas
+    dados['Vpp1 (V)'], dados['Vpp2 (V)'] = Vpp1, Vpp2
+    dados['fase (Ch2-Ch1) (graus)'] = phase
+    dados['frequencia (Hz)'], dados['T'], dados['T_dB'] = freq, T, T_dB
+    save_sweep(fig, dados, path, fname if fname != '' else 'sweep_hardware')
     return fig, dados
-
-
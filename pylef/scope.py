@@ -8,6 +8,8 @@ import numpy  # module for array manipulation
 import os   # module for general OS manipulation
 import time # module for time related funtions
 import pandas # module for general data analysis
+from .waveform import WaveformRecord  # compact storage of the waveforms
+from . import analysis  # measurements and spectra computed from the curves
 ################################
 def read_only_properties(*attrs):
     """
@@ -35,26 +37,36 @@ def read_only_properties(*attrs):
 
     return class_rebuilder
 
-@read_only_properties('id_tek_hex', 'id_tek_dec', 'average_list', 'ch1', 'ch2', 'math')
+@read_only_properties('id_tek_hex', 'id_tek_dec', 'average_list', 'ch1', 'ch2', 'math', 'preamble_cache', 'curve_format', 'measurements')
 class TektronixTBS1062:
-    def __init__(self):
+    def __init__(self, resource = None):
         """
             Classe para o osciloscópio
+
+            resource: an already opened pyvisa resource (or a simulated one,
+            see pylef.simulator). If None, the scope is searched in the USB
+            ports with "find_interface"
         """
         self.id_tek_hex = '0x0699'; # identificador do fabricante TEK em hexadecimal
         self.id_tek_dec = '1689'; # identificador do fabricante TEK em decimal
-        interface_name = self.find_interface()
-        self.instr = visa.ResourceManager().open_resource(interface_name)   ## resource name
-        self.ch1 = ChannelScope(self.instr, 'CH1')  # channel 1
-        self.ch2 = ChannelScope(self.instr, 'CH2')   # channel 2
-        self.math = ChannelScope(self.instr, 'MATH')   # channel 2
+        if resource is None:
+            interface_name = self.find_interface()
+            resource = visa.ResourceManager().open_resource(interface_name)   ## resource name
+        self.instr = resource
+        self.preamble_cache = PreambleCache()   # waveform conversion factors shared by the channels
+        self.curve_format = CurveFormat(self.instr)   # transferred window and data width
+        self.ch1 = ChannelScope(self.instr, 'CH1', self.preamble_cache, self.curve_format)  # channel 1
+        self.ch2 = ChannelScope(self.instr, 'CH2', self.preamble_cache, self.curve_format)   # channel 2
+        self.math = ChannelScope(self.instr, 'MATH', self.preamble_cache, self.curve_format)   # channel 2
         self.trigger = Trigger(self.instr)
+        self.measurements = MeasurementSet(self.instr)   # persistent measurement slots
         self.average_list = [4, 16, 64, 128]
         ## VISA reading configurations
         self.instr.timeout = 10000 # set timeout to 10 seconds
         self.instr.chunk_size = 40960  # set the buffer size to 40 kB
         self.instr.write('Data:ENCDg SRI')  # set the instrument to read binary
         self.instr.write('Data:Width 1')   # set the data width to 1 byte
+        self.instr.write('DATa:STARt 1;:DATa:STOP %d' % self.curve_format.record_length)   # transfer the whole record
         self.instr.write('HEADER ON')   # set the header ON (needed)
         
         try:
@@ -111,6 +123,10 @@ class TektronixTBS1062:
         """ write into the laser """
         write_output = self.instr.write(str(msg)) 
         self.wait()
+        self.preamble_cache.invalidate()   # the message may have changed any setting
+        self.curve_format.invalidate()
+        if 'MEAS' in str(msg).upper():
+            self.measurements.invalidate()
         return write_output  
 #
     def query(self, msg):
@@ -128,16 +144,26 @@ class TektronixTBS1062:
     def set_average(self):
         """ start average acquisition """
         self.instr.write('ACQuire:MODe AVERAge')
+        self.preamble_cache.invalidate()
         return None
 #
     def set_sample(self):
         """ start sample acquisition """
         self.instr.write('ACQuire:MODe SAMPle')
+        self.preamble_cache.invalidate()
+        return None
+#
+    def set_peak_detect(self):
+        """ start peak detect acquisition: each pair of points holds the minimum and the
+        maximum of the signal over the interval, so the envelope of fast signals is kept """
+        self.instr.write('ACQuire:MODe PEAKdetect')
+        self.preamble_cache.invalidate()
         return None
 #    
     def set_horizontal_scale(self, val):
         """ set horizontal scale """
         self.instr.write('HORizontal:MAIn:SCALE ' + str(val))
+        self.preamble_cache.invalidate()
         return None
 #    
     def horizontal_scale(self):
@@ -146,6 +172,7 @@ class TektronixTBS1062:
     def set_horizontal_position(self, val):
         """ set horizontal scale """
         self.instr.write('HORizontal:MAIn:POSition ' + str(val))
+        self.preamble_cache.invalidate()
         return None
 #
     def horizontal_position(self):
@@ -171,6 +198,10 @@ class TektronixTBS1062:
             return None
         else: 
             raise ValueError("The number of waveforms must be one of " + ', '.join(['%3d' % l for l in self.average_list]))
+#
+    def preamble_queries_saved(self):
+        """ return the number of waveform preamble queries saved by the cache """
+        return self.preamble_cache.hits
 #
     def get_active_channel(self):
         """ return the active channel for the waveform aquisition """
@@ -184,6 +215,84 @@ class TektronixTBS1062:
     def stop_acquisition(self):
         """ stop the aquisition of the waveform """
         return self.instr.write('ACQuire:STATE STOP')
+#
+    def acquisition_mode(self):
+        """ return the acquisition mode ('SAMPLE', 'PEAKDETECT' or 'AVERAGE') """
+        return self.instr.query('ACQuire:MODe?').split(' ')[-1].strip().upper()
+#
+    def set_acquisition_mode(self, mode):
+        """ set the acquisition mode ('SAMPLE', 'PEAKDETECT' or 'AVERAGE'), e.g. the one
+        returned by "acquisition_mode" """
+        if mode.upper()[:3] not in ['SAM', 'PEA', 'AVE']:
+            raise ValueError("The acquisition mode must be 'SAMPLE', 'PEAKDETECT' or 'AVERAGE'")
+        self.instr.write('ACQuire:MODe ' + mode)
+        self.preamble_cache.invalidate()
+        return None
+#
+    def single_acquisition(self, timeout = None):
+        """ acquire a single sequence ("ACQuire:STOPAfter SEQuence"): the scope is armed,
+        waits for the next trigger and stops after the acquisition (or the averages of
+        the sequence), whose end is waited with "*OPC?". timeout (s), if given, is the VISA
+        timeout while waiting. The scope stays in single sequence mode; use "set_run_stop"
+        to go back to the continuous acquisition """
+        previous = self.instr.timeout
+        if timeout is not None:
+            self.instr.timeout = 1000*timeout
+        try:
+            self.instr.write('ACQuire:STOPAfter SEQuence')
+            return self.instr.query('ACQuire:STATE RUN;*OPC?')
+        finally:
+            self.instr.timeout = previous
+#
+    def set_run_stop(self):
+        """ go back to the continuous acquisition ("ACQuire:STOPAfter RUNSTop") and run it """
+        self.instr.write('ACQuire:STOPAfter RUNSTop')
+        self.instr.write('ACQuire:STATE RUN')
+        return None
+#
+    def read_channels(self, channels = ['CH1', 'CH2'], out = None, start = None, stop = None, width = None):
+        """ returns a tuple (t, Y) with the time axis shared by the channels and a 2-D
+        array with one converted curve per row, in the order of "channels".
+
+        All the curves are transferred with a single compound query; the preamble is only
+        read for the channels whose conversion factors are not cached. If the float array
+        "out" (shape n_channels x n_points) is given, the curves are converted into it and
+        t is the cached, read-only, time axis of the first channel (see "time_axis").
+        The options start, stop and width select the transferred points and the number of
+        bytes per point (see "CurveFormat").
+
+        Usage
+        -----
+
+            >>> t, Y = scope.read_channels(['CH1', 'CH2', 'MATH'])
+            >>> plt.plot(Y[0], Y[1])   # Lissajous figure
+        """
+        sources = {'CH1': self.ch1, 'CH2': self.ch2, 'MATH': self.math}
+        channels = [name.upper() for name in channels]
+        for name in channels:
+            if name not in sources:
+                raise ValueError('The channels must be among ' + ', '.join(sources.keys()))
+        self.curve_format.set(start, stop, width)
+        conversions = []
+        for name in channels:
+            conversion = self.preamble_cache.get(name, self.curve_format.width)
+            if conversion is None:
+                self.instr.write('DATa:SOUrce ' + name)   # the preamble refers to the active channel
+                conversion = sources[name].waveform_conversion()
+            conversions.append(conversion)
+        self.instr.write(';:'.join(['DATa:SOUrce ' + name + ';:CURVe?' for name in channels]))
+        y_raw = numpy.array(read_ieee_blocks(self.instr.read_raw(), self.curve_format.dtype()))
+        [y_zero, y_factor, y_offset] = numpy.array([conversion[1] for conversion in conversions]).T[:, :, None]
+        if out is None:
+            [[x_zero, x_factor, x_offset], _] = conversions[0]   # same horizontal settings for all channels
+            t = x_zero + x_factor*(numpy.arange(y_raw.shape[1]) + self.curve_format.start - 1 - x_offset)
+            out = numpy.empty(y_raw.shape)
+        else:
+            t = sources[channels[0]].time_axis(y_raw.shape[1], self.curve_format.start)
+        Y = numpy.subtract(y_raw, y_offset, out = out)
+        Y *= y_factor
+        Y += y_zero
+        return (t, Y)
 
     
 ############## Saving functions ##### (They shouldn' t be here!!)
@@ -232,8 +341,7 @@ class TektronixTBS1062:
         
         """
 ##### reading and setting directory name
-        t, x = self.ch1.read_channel()   # read channel 1
-        t0, y = self.ch2.read_channel()   # read channel 2
+        t, (x, y) = self.read_channels(['CH1', 'CH2'])   # read channels 1 and 2
 ###### name of the file        
         Npts = t.shape[0]
         indexh = range(Npts)
@@ -262,15 +370,131 @@ class TektronixTBS1062:
         print('... file => %s saved !!' % full_name)
         return t, x, y
 
+##
+def read_ieee_blocks(raw, dtype = '>i1'):
+    """ return the list of arrays in the IEEE-488.2 definite length blocks
+    of the bytes raw, such as the response to a compound "CURVe?" query. The
+    arrays are views of raw (numpy.frombuffer), not copies. """
+    dtype = numpy.dtype(dtype)
+    blocks, pos = [], 0
+    while True:
+        start = raw.find(b'#', pos)
+        if start < 0:
+            return blocks
+        ndigits = int(raw[start + 1:start + 2])
+        nbytes = int(raw[start + 2:start + 2 + ndigits])
+        offset = start + 2 + ndigits
+        blocks.append(numpy.frombuffer(raw, dtype, count = nbytes//dtype.itemsize, offset = offset))
+        pos = offset + nbytes
+#
+def round_scale(val):
+    """ round the vertical scale val up to the 1-2-5 sequence of the scope
+    (the scope rounds the scale it is given up to that sequence) """
+    decade = 10.**numpy.floor(numpy.log10(val))
+    for mantissa in [1., 2., 5., 10.]:
+        if mantissa*decade >= val*(1 - 1e-9):
+            return mantissa*decade
+#
+class CurveFormat:
+    def __init__(self, instrument, record_length = 2500):
+        """
+           Transfer settings of the curves, shared by the scope channels:
+           the first and last transferred points ("DATa:STARt" and
+           "DATa:STOP", from 1 to the record length) and the number of bytes
+           per point ("DATa:WIDth", 1 or 2). The settings are only written
+           when they change. With the 'SRI' encoding the 2 byte points are
+           little endian.
+        """
+        self.instr = instrument
+        self.record_length = record_length
+        self.start, self.stop, self.width = 1, record_length, 1
+#
+    def commands(self, start = None, stop = None, width = None):
+        """ return the commands (joined by ';:' and ending with ';:', or '') that set the
+        format; None means the whole record with 1 byte per point """
+        start = 1 if start is None else int(start)
+        stop = self.record_length if stop is None else int(stop)
+        width = 1 if width is None else int(width)
+        if not 1 <= start <= stop <= self.record_length:
+            raise ValueError('The points must satisfy 1 <= start <= stop <= %d' % self.record_length)
+        if width not in [1, 2]:
+            raise ValueError('The data width must be 1 or 2 bytes')
+        cmds = []
+        if start != self.start: cmds.append('DATa:STARt %d' % start)
+        if stop != self.stop: cmds.append('DATa:STOP %d' % stop)
+        if width != self.width: cmds.append('DATa:WIDth %d' % width)
+        self.start, self.stop, self.width = start, stop, width
+        return ''.join([cmd + ';:' for cmd in cmds])
+#
+    def set(self, start = None, stop = None, width = None):
+        """ set the format (see "commands") """
+        cmds = self.commands(start, stop, width)
+        if cmds != '':
+            self.instr.write(cmds[:-2])
+        return None
+#
+    def invalidate(self):
+        """ the state of the instrument is unknown: the next format will be written """
+        self.start, self.stop, self.width = None, None, None
+#
+    def dtype(self):
+        """ numpy type of the transferred points """
+        return numpy.dtype('<i2') if self.width == 2 else numpy.dtype('i1')
+#
+class PreambleCache:
+    def __init__(self):
+        """
+           Cache of the waveform conversion factors (see "waveform_conversion")
+           of the scope channels. The setters that change the preamble
+           invalidate the cached values. "hits" counts the preamble queries
+           saved (once per curve transfer that used the cache) and "misses"
+           the queries done. "peek" reads the cache without counting.
+        """
+        self.conversions = {}
+        self.hits = 0
+        self.misses = 0
+#
+    def get(self, channel, width = 1):
+        """ return the cached conversion of channel for the data width, or None. To be
+        called once per curve transfer: a cached value counts as a saved query """
+        conversion = self.peek(channel, width)
+        if conversion is not None:
+            self.hits += 1
+        return conversion
+#
+    def peek(self, channel, width = 1):
+        """ return the cached conversion of channel for the data width, or None, without
+        counting it (for the conversions needed again after a transfer) """
+        return self.conversions.get((channel, width))
+#
+    def store(self, channel, conversion, width = 1):
+        """ store the conversion of channel for the data width, read from the instrument """
+        self.misses += 1
+        self.conversions[(channel, width)] = conversion
+#
+    def invalidate(self, channel = None):
+        """ forget the conversion of channel (and of MATH, which depends on it) or of all channels """
+        if channel is None:
+            self.conversions.clear()
+        else:
+            for key in list(self.conversions.keys()):
+                if key[0] in [channel, 'MATH']:
+                    del self.conversions[key]
+
 ##
 @read_only_properties('instrument', 'channel', 'probe_list')
 class ChannelScope:
-    def __init__(self, instrument, channel):
+    def __init__(self, instrument, channel, preamble_cache = None, curve_format = None):
         """ 
            Channel class for the oscilloscopes
         """
         self.instr = instrument  ## resource name
         self.channel = channel
+        self.preamble_cache = preamble_cache if preamble_cache is not None else PreambleCache()
+        self.curve_format = curve_format if curve_format is not None else CurveFormat(instrument)
+        self._buffers = {}   # pooled buffers of "read_channel_into", by (size, dtype)
+        self._time_axis = (None, None)   # cached time axis and the parameters it was built with
+        self.stream_stats = {'frames': 0, 'duplicates': 0, 'rate': 0.}   # statistics of the last "stream"
         self.probe_list = [0.2, 1, 10, 20, 50, 100, 500, 1000]
         self.state_list = {"1": "on", "0": "off"} 
         self.measure = Measure(instrument, channel)  
@@ -291,6 +515,7 @@ class ChannelScope:
     def set_scale(self, val):
         """ set channel scale """
         self.instr.write(self.channel  + ':SCALE ' + str(val))
+        self.preamble_cache.invalidate(self.channel)
         return None
 #
     def scale(self):
@@ -300,11 +525,18 @@ class ChannelScope:
     def set_position(self, val):
         """ set channel position """
         self.instr.write(self.channel  + ':POSITION ' + str(val))
+        self.preamble_cache.invalidate(self.channel)
         return None
 #
     def position(self):
         """ return channel position """
         return float(self.instr.query(self.channel + ':POSITION?').split(' ')[-1])
+#
+    def set_scale_position(self, scale, position):
+        """ set channel scale and position with a single message """
+        self.instr.write('%s:SCALE %g;:%s:POSITION %g' % (self.channel, scale, self.channel, position))
+        self.preamble_cache.invalidate(self.channel)
+        return None
 #
     def set_bandwidth_on(self, val):
         """ set channel bandwidth ON """
@@ -349,6 +581,7 @@ class ChannelScope:
         """ set oscilloscope probe """
         if val in self.probe_list:
             self.instr.write(self.channel  + ':PROBE ' + str(val))
+            self.preamble_cache.invalidate(self.channel)
         else: 
             raise ValueError("The probes must be one of " + ', '.join(['%3d' % l for l in self.probe_list]))        
         return None
@@ -361,9 +594,14 @@ class ChannelScope:
         """ return a list with the praface parameters  """
         return self.instr.query('WFMPRe?').split(':')[-1].split(',')  # read the preface and convert into a list
 #
-    def waveform_conversion(self):
+    def waveform_conversion(self, use_cache = False):
         """ return the waveform convertion values in the form
-        "[[x_zero, x_factor, x_offset], [y_zero, y_factor, y_offset]]" """
+        "[[x_zero, x_factor, x_offset], [y_zero, y_factor, y_offset]]". If use_cache = True,
+        the values are only read from the instrument when the settings changed """
+        if use_cache:
+            conversion = self.preamble_cache.get(self.channel, self.curve_format.width)
+            if conversion is not None:
+                return conversion
         temp = self.read_preface()[-1].split(';')   # read the 6 position of the preface and convert into a list
         temp = [x.split(' ') for x in temp]   
         for test in temp:
@@ -373,7 +611,18 @@ class ChannelScope:
             if test[0] == 'YZERO': y_zero = float(test[1])
             if test[0] == 'YMULT': y_factor = float(test[1])
             if test[0] == 'YOFF': y_offset = float(test[1])        
-        return [[x_zero, x_factor, x_offset], [y_zero, y_factor, y_offset]]
+        conversion = [[x_zero, x_factor, x_offset], [y_zero, y_factor, y_offset]]
+        self.preamble_cache.store(self.channel, conversion, self.curve_format.width)
+        return conversion
+#
+    def cached_conversion(self):
+        """ return the conversion of the last curve transfer (see "waveform_conversion"),
+        from the cache when possible. Unlike waveform_conversion(use_cache = True), a cached
+        value is not counted as a saved preamble query, since the transfer already counted it """
+        conversion = self.preamble_cache.peek(self.channel, self.curve_format.width)
+        if conversion is None:
+            conversion = self.waveform_conversion(use_cache = True)
+        return conversion
 #
     def waveform_conversion_no_header(self):
         """ return the waveform convertion values in the form
@@ -415,13 +664,60 @@ class ChannelScope:
                 self.set_scale(new_scale)
                 keep_loop = False
         return None
+#
+    def set_auto_scale(self, Vmax = 4., D = 0.75, log_step = 10, max_iterations = 4, min_fill = 0.3):
+        """ scales the channel from the raw samples of one capture, instead of the
+        measurements of "set_smart_scale". The scale and position are computed as in
+        "set_smart_scale" and written at once; the next capture checks the result. A
+        clipped curve (raw samples at the int8 limits) has the scale multiplied by log_step.
+        The new scale is rounded up to the 1-2-5 sequence ("round_scale") before the
+        position is computed.
+        A curve spanning less than 2 levels has the scale divided by log_step. The loop
+        stops when the curve fits in +-Vmax divisions filling at least min_fill of them,
+        or after max_iterations captures. Returns the number of round trips used
+        (state query, captures, preamble queries and writes). Raises ValueError if
+        the channel is off """
+        if max_iterations < 1:
+            raise ValueError('max_iterations must be at least 1')
+        #test whether channel is on
+        if self.state() == 'off':
+            raise ValueError('O canal %s do osciloscópio está desligado!' % self.channel)
+        levels = 25.   # digitizing levels per division with 1 byte per point
+        round_trips = 1   # the state query
+        for iteration in range(max_iterations):
+            y_raw = self.acquire_y_raw_view()
+            misses = self.preamble_cache.misses
+            [_, [y_zero, y_factor, y_offset]] = self.waveform_conversion(use_cache = True)
+            round_trips += 1 + self.preamble_cache.misses - misses
+            scale, pos_div = y_factor*levels, y_offset/levels
+            count_max, count_min = int(y_raw.max()), int(y_raw.min())
+            if count_max >= 127 or count_min <= -128:   # clipped: the extremes are not known
+                new_scale, new_pos = log_step*scale, pos_div/log_step
+            elif count_max - count_min < 2:   # too small to be measured
+                new_scale, new_pos = scale/log_step, 0.
+            else:
+                top, bot = count_max/levels, count_min/levels   # divisions from the screen center
+                if top <= Vmax and bot >= -Vmax and (top - bot)/(2*Vmax) >= min_fill:
+                    break
+                max0, min0 = y_zero + y_factor*(count_max - y_offset), y_zero + y_factor*(count_min - y_offset)
+                # the position is computed for the scale the scope will accept, so that an offset
+                # curve stays centered when the scale is rounded up
+                new_scale = round_scale((max0 - min0)/(2*(Vmax - D)))
+                new_pos = -(max0 + min0)/(2*new_scale)
+            self.set_scale_position(new_scale, new_pos)
+            round_trips += 1
+        return round_trips
 #
     def acquire_y_raw_ascii(self):
-        """acquire the raw curve of whatever channel is set in "set_channel" """
+        """acquire the raw curve of whatever channel is set in "set_channel" (whole record,
+        1 byte per point) """
+        self.curve_format.set()   # a previous windowed or 16-bit transfer may have changed it
         return numpy.array(self.instr.query('CURVe?').split(' ')[-1].split(','), float)
 #
     def acquire_y_raw(self):
-        """acquire the raw curve of whatever channel is set in "set_channel" """
+        """acquire the raw curve of whatever channel is set in "set_channel" (whole record,
+        1 byte per point) """
+        self.curve_format.set()   # a previous windowed or 16-bit transfer may have changed it
         try:
             curv =  numpy.array(self.instr.query_values('CURVe?'))
             print("PyVisa is outdated, using old binary query format. Please consider updating to the latest version.")
@@ -432,13 +728,157 @@ class ChannelScope:
 #
     def read_channel(self):
         """ returns a tuple with both the x and y axis already converted. It creates the x axis and reads the y axis from the channel set with the function "set_channel". The y acquisition is done using the function "acquire_y_raw" the converting factor by using the "waveform_conversion" function """
+        self.curve_format.set()   # whole record, 1 byte per point
         self.instr.write('DATa:SOUrce ' + self.channel)  # set channel to active
         y_raw = self.acquire_y_raw()    # acquire y raw curve
-        [[x_zero, x_factor, x_offset], [y_zero, y_factor, y_offset]] = self.waveform_conversion()
+        [[x_zero, x_factor, x_offset], [y_zero, y_factor, y_offset]] = self.waveform_conversion(use_cache = True)
         x_raw = numpy.arange(len(y_raw))        
         x = x_zero + x_factor*(x_raw - x_offset)
         y = y_zero + y_factor*(y_raw - y_offset)
         return (x, y)
+#
+    def pooled_buffer(self, size, dtype):
+        """ return the buffer of the channel pool with the given size and dtype """
+        key = (size, numpy.dtype(dtype).str)
+        if key not in self._buffers:
+            self._buffers[key] = numpy.empty(size, dtype)
+        return self._buffers[key]
+#
+    def time_axis(self, size, start = 1):
+        """ return the (read-only) time axis of a curve with size points, the first one
+        being the point start of the record. It is only rebuilt when the conversion
+        factors or the window change """
+        [[x_zero, x_factor, x_offset], _] = self.cached_conversion()
+        key = (x_zero, x_factor, x_offset, size, start)
+        if self._time_axis[0] != key:
+            t = x_zero + x_factor*(numpy.arange(size) + start - 1 - x_offset)
+            t.flags.writeable = False
+            self._time_axis = (key, t)
+        return self._time_axis[1]
+#
+    def acquire_y_raw_view(self, start = None, stop = None, width = None):
+        """acquire the raw curve of the channel as an integer array that is a view of the
+        received IEEE-488.2 block (no intermediate sequence is built). Only the points
+        from start to stop (1-based, whole record by default) are transferred, with width
+        bytes per point (1 by default): the array is int8 or int16 accordingly """
+        cmds = self.curve_format.commands(start, stop, width)
+        self.instr.write(cmds + 'DATa:SOUrce ' + self.channel + ';:CURVe?')
+        return read_ieee_blocks(self.instr.read_raw(), self.curve_format.dtype())[0]
+#
+    def acquire_y_raw_into(self, buffer = None, start = None, stop = None, width = None):
+        """acquire the raw curve of the channel into the integer array "buffer" and return it.
+        If buffer is None, a buffer of the channel pool is used and overwritten at each call.
+        See "acquire_y_raw_view" for the options """
+        y_raw = self.acquire_y_raw_view(start, stop, width)
+        if buffer is None:
+            buffer = self.pooled_buffer(y_raw.shape[0], y_raw.dtype)
+        numpy.copyto(buffer, y_raw)
+        return buffer
+#
+    def read_channel_into(self, out = None, start = None, stop = None, width = None):
+        """ same as "read_channel", without allocating new arrays: the curve is converted
+        to volts directly from the received bytes into the float array "out" (or into a
+        buffer of the channel pool, overwritten at each call) and the time axis is the
+        cached, read-only, array of "time_axis". Returns the tuple (t, out). See
+        "acquire_y_raw_view" for the options
+
+        A window around the trigger with 16-bit points (for averaged data):
+
+            >>> t, y = scope.ch1.read_channel_into(start = 1000, stop = 1500, width = 2)
+
+        Usage
+        -----
+
+            >>> y = numpy.empty(2500)
+            >>> for n in range(1000):
+            ...     t, y = scope.ch1.read_channel_into(y)
+        """
+        y_raw = self.acquire_y_raw_view(start, stop, width)
+        [_, [y_zero, y_factor, y_offset]] = self.waveform_conversion(use_cache = True)
+        if out is None:
+            out = self.pooled_buffer(y_raw.shape[0], float)
+        numpy.subtract(y_raw, y_offset, out = out)
+        out *= y_factor
+        out += y_zero
+        return (self.time_axis(y_raw.shape[0], self.curve_format.start), out)
+#
+    def read_record(self, start = None, stop = None, width = None):
+        """ acquire the channel into a "WaveformRecord", which keeps the raw samples and
+        converts them to volts only when "t" or "y" are accessed. See "acquire_y_raw_view"
+        for the options """
+        y_raw = numpy.array(self.acquire_y_raw_view(start, stop, width))   # own copy of the samples
+        conversion = self.waveform_conversion(use_cache = True)
+        if self.curve_format.start != 1:   # the time axis starts at the first transferred point
+            [[x_zero, x_factor, x_offset], y_conversion] = conversion
+            conversion = [[x_zero, x_factor, x_offset - self.curve_format.start + 1], y_conversion]
+        return WaveformRecord(y_raw, conversion, time.time(), self.channel)
+#
+    def spectrum(self, window = 'hann', scaling = 'amplitude', start = None, stop = None, width = None):
+        """ acquire the channel and return its single sided spectrum (frequency, S) computed
+        in the computer, instead of the FFT of the MATH channel. See "pylef.analysis.spectrum"
+        for window and scaling and "acquire_y_raw_view" for the other options """
+        t, y = self.read_channel_into(start = start, stop = stop, width = width)
+        [[_, x_factor, _], _] = self.cached_conversion()
+        return analysis.spectrum(y, x_factor, window, scaling)
+#
+    def stream(self, n_frames = None, max_rate = None, out = None):
+        """ generator of consecutive waveform frames (t, y) of the channel.
+
+        The scope is set to single sequence acquisition ("ACQuire:STOPAfter SEQuence").
+        For each frame it is re-armed, the end of the acquisition is waited with "*OPC?"
+        and the curve is transferred. The scope is only re-armed when the next frame is
+        requested, so a slow consumer slows the acquisition down instead of filling
+        the memory. The run-stop acquisition is restored when the generator ends.
+
+        Parameters
+        ----------
+        n_frames: int - optional
+            number of frames (endless if None)
+        max_rate: float - optional
+            maximum number of frames per second
+        out: float array - optional
+            if given, every frame is converted into it (see "read_channel_into")
+            and the consumer must copy what it keeps; otherwise each frame is a
+            new array
+
+        The dictionary "stream_stats" (reset by this call, before the first frame)
+        holds the number of 'frames', 'duplicates' (frames with no new acquisition,
+        according to the acquisition counter "ACQuire:NUMACq?") and the frame 'rate'
+        in Hz.
+
+        Usage
+        -----
+
+            >>> for t, y in scope.ch1.stream(100, max_rate = 10):
+            ...     print(y.max())
+            >>> print(scope.ch1.stream_stats)
+        """
+        self.stream_stats = {'frames': 0, 'duplicates': 0, 'rate': 0.}
+        return self._stream(n_frames, max_rate, out, self.stream_stats)
+#
+    def _stream(self, n_frames, max_rate, out, stats):
+        """ generator of the frames of "stream" """
+        self.instr.write('ACQuire:STOPAfter SEQuence')
+        start = time.time()
+        try:
+            while n_frames is None or stats['frames'] < n_frames:
+                if max_rate is not None:
+                    time.sleep(max(0., start + stats['frames']/max_rate - time.time()))
+                # acquisitions since the scope was armed: 0 if the memory still holds the previous frame
+                numacq = int(self.instr.query('ACQuire:STATE RUN;*OPC?;:ACQuire:NUMACq?').split(' ')[-1])
+                y_raw = self.acquire_y_raw_view()
+                if numacq == 0:
+                    stats['duplicates'] += 1
+                [_, [y_zero, y_factor, y_offset]] = self.waveform_conversion(use_cache = True)
+                y = numpy.subtract(y_raw, y_offset, out = out)
+                y *= y_factor
+                y += y_zero
+                stats['frames'] += 1
+                stats['rate'] = stats['frames']/(time.time() - start)
+                yield (self.time_axis(y_raw.shape[0]), y)
+        finally:
+            self.instr.write('ACQuire:STOPAfter RUNSTop')
+            self.instr.write('ACQuire:STATE RUN')
 #    
 # subclass with the measurements     
 class Measure:
@@ -494,6 +934,74 @@ class Measure:
         """measure the minimum voltage in the screen in V """
         return float(self.do_measure('MINImum'))    
 
+class MeasurementSet:
+    def __init__(self, instrument, n_slots = 5):
+        """
+            Measurements kept in the slots "MEASUrement:MEAS1" to "MEAS<n_slots>"
+            of the scope. The slots are programmed once by "configure" (only the
+            ones that changed are written) and all the values are read with a
+            single compound query by "read", instead of programming the
+            "IMMed" measurement before each value.
+
+            Usage:
+
+            >>> scope.measurements.configure({'Vpp1': ('PK2PK', 'CH1'),
+            ...                               'phase': ('PHASE', 'CH1', 'CH2'),
+            ...                               'Vpp2': ('PK2PK', 'CH2')})
+            >>> values = scope.measurements.read()   # {'Vpp1': ..., 'phase': ..., 'Vpp2': ...}
+            >>> values = scope.measurements.read(as_array = True)   # in the configured order
+        """
+        self.instr = instrument
+        self.n_slots = n_slots
+        self.names = []   # configured measurements, in slot order
+        self.slots = [None]*n_slots   # programmed (type, source, source2), None if unknown
+#
+    def configure(self, measurements):
+        """ set the measurements: a dictionary (or list of pairs) name -> (type, source) or
+        (type, source, source2), where type is one of the scope types ('PK2PK', 'PHASE', 'FREQ',
+        'MEAN', ...) and source2 is the reference of the 'PHASE' measurements. The slots that
+        are not used are turned off """
+        measurements = list(dict(measurements).items())
+        if len(measurements) > self.n_slots:
+            raise ValueError('The scope has only %d measurement slots' % self.n_slots)
+        cmds = []
+        for n in range(self.n_slots):
+            if n < len(measurements):
+                setting = tuple(measurements[n][1])
+                if len(setting) not in [2, 3]:
+                    raise ValueError('The measurement %s must be (type, source) or (type, source, source2)' % measurements[n][0])
+                setting = (setting[0].upper(), setting[1].upper(), setting[2].upper() if len(setting) == 3 else None)
+            else:
+                setting = ('NONE', None, None)
+            if setting == self.slots[n]:
+                continue
+            slot = 'MEASUrement:MEAS%d:' % (n + 1)
+            cmds.append(slot + 'TYPe ' + setting[0])
+            if setting[1] is not None:
+                cmds.append(slot + 'SOUrce ' + setting[1])
+            if setting[2] is not None:
+                cmds.append(slot + 'SOUrce2 ' + setting[2])
+            self.slots[n] = setting
+        if len(cmds) > 0:
+            self.instr.write(';:'.join(cmds))
+        self.names = [name for name, _ in measurements]
+        return None
+#
+    def invalidate(self):
+        """ the slots of the instrument are unknown: they will be written again by "configure" """
+        self.slots = [None]*self.n_slots
+#
+    def read(self, as_array = False):
+        """ read all the configured measurements with one query. Returns a dictionary
+        name -> value or, if as_array is True, an array in the configured order """
+        if len(self.names) == 0:
+            raise ValueError('There are no configured measurements (see "configure")')
+        query = ';:'.join(['MEASUrement:MEAS%d:VALue?' % (n + 1) for n in range(len(self.names))])
+        values = numpy.array([float(val.split(' ')[-1]) for val in self.instr.query(query).strip().split(';')])
+        if as_array:
+            return values
+        return dict(zip(self.names, values))
+#
 @read_only_properties('instrument', 'trigger_list')
 class Trigger:
     def __init__(self, instrument):
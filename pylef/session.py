@@ -0,0 +1,84 @@
+#-*- coding: utf-8 -*-
+
+""" Instruments connected once and shared by many measurements
+
+Creating a "BK4052" searches the USB ports and calibrates the settle model,
+and creating a "TektronixTBS1062" sets up the binary transfers of the
+curves. A session keeps both instruments connected, so back to back sweeps
+pay that cost only once:
+
+    >>> import pylef
+    >>> with pylef.Session() as session:
+    ...     fig, dados = pylef.sweep_frequency(100, 10e3, 20, session = session)
+    ...     fig, dados = pylef.sweep_frequency(900, 1.1e3, 20, session = session)
+
+The instruments are connected when first used and closed at the end of the
+"with" block (or by "close"). Instruments already connected can be given to
+the session, in which case they are not closed by it.
+"""
+
+#################################
+from .scope import TektronixTBS1062
+from .generator import BK4052
+################################
+class Session:
+    def __init__(self, func_gen = None, scope = None):
+        """
+            Session with a function generator and a scope.
+
+            func_gen: an already connected "BK4052"; if omitted, one is
+                created (and owned by the session) when first used
+            scope: an already connected "TektronixTBS1062"; if omitted, one
+                is created (and owned by the session) when first used
+        """
+        self._func_gen, self._scope = func_gen, scope
+        self.owned = []   # instruments created (and closed) by the session
+        self.connections = 0   # number of instruments created
+#
+    @property
+    def func_gen(self):
+        """ function generator of the session """
+        if self._func_gen is None:
+            self._func_gen = self.connect(BK4052)
+        return self._func_gen
+#
+    @property
+    def scope(self):
+        """ scope of the session """
+        if self._scope is None:
+            self._scope = self.connect(TektronixTBS1062)
+        return self._scope
+#
+    def connect(self, instrument_class):
+        """ create an instrument owned by the session """
+        instrument = instrument_class()
+        self.owned.append(instrument)
+        self.connections += 1
+        return instrument
+#
+    def instruments(self, func_gen = None, scope = None):
+        """ return (func_gen, scope): the given instruments, or the ones of the session """
+        return (func_gen if func_gen is not None else self.func_gen,
+                scope if scope is not None else self.scope)
+#
+    def close(self):
+        """ close the instruments created by the session """
+        owned, self.owned = self.owned, []
+        for instrument in owned:
+            if instrument is self._func_gen:
+                self._func_gen = None
+            if instrument is self._scope:
+                self._scope = None
+            instrument.close()
+        return None
+#
+    def __enter__(self):
+        return self
+#
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+#
+    def __repr__(self):
+        state = lambda instrument: 'connected' if instrument is not None else 'not connected'
+        return 'Session(func_gen %s, scope %s)' % (state(self._func_gen), state(self._scope))
@@ -0,0 +1,1052 @@
+#-*- coding: utf-8 -*-
+
+""" Simulated Tektronix TBS1062 and BK Precision BK4052 for offline work
+
+The classes in this module mimic the pyvisa resources of both instruments
+closely enough for the drivers of pylef to run without a bench. They answer
+the SCPI commands sent by "TektronixTBS1062" and "BK4052", model the command
+latency and the USB bandwidth and synthesize the waveforms seen by the scope
+from the state of the function generator.
+
+Usage
+
+    >>> import pylef.simulator
+    >>> bench = pylef.simulator.SimulatedBench()   # generator CH1 -> scope CH1 and DUT -> scope CH2
+    >>> func_gen = bench.generator()   # pylef.BK4052 connected to the simulated generator
+    >>> scope = bench.scope()          # pylef.TektronixTBS1062 connected to the simulated scope
+    >>> func_gen.ch1.turn_on()
+    >>> t, y = scope.ch2.read_channel()
+
+The device under test (DUT) is described by its complex transfer function
+"transfer(f)". By default it is a RC low-pass filter with a 1 kHz corner.
+
+Differences from the real instruments
+
+In continuous (run-stop) acquisition the simulated scope answers "CURVe?"
+and the measurement queries only when the acquisition reflects the current
+settings, i.e. when all the averages taken after the last change are done:
+the query blocks until then. The real TBS1062 answers at once with whatever
+is in its acquisition memory, which right after a change of the generator
+or of the scope may be the previous waveform or a partial average. The
+simulator therefore never returns stale data, and the wall times of the
+benchmarks ("pylef.benchmark") include this wait; the drivers must still
+wait for the new acquisition themselves (e.g. with a single sequence and
+"*OPC?") on the real scope.
+"""
+
+#################################
+import re   # regular expressions for the SCPI parser
+import time # module for time related funtions
+import threading  # lock shared by the simulated instruments
+import numpy  # module for array manipulation
+import pyvisa as visa   # interface with NI-Visa (used for the error types)
+################################
+def rc_lowpass(fc):
+    """ transfer function of a first order low-pass filter with corner frequency fc (Hz) """
+    return lambda f: 1./(1. + 1j*numpy.asarray(f, float)/fc)
+#
+def rc_highpass(fc):
+    """ transfer function of a first order high-pass filter with corner frequency fc (Hz) """
+    return lambda f: (1j*numpy.asarray(f, float)/fc)/(1. + 1j*numpy.asarray(f, float)/fc)
+#
+def rlc_bandpass(f0, Q):
+    """ transfer function of a second order band-pass filter centred at f0 (Hz) with quality factor Q """
+    def transfer(f):
+        x = 1j*numpy.asarray(f, float)/f0
+        return (x/Q)/(1. + x/Q + x**2)
+    return transfer
+
+#################################
+## SCPI parsing
+# mnemonics in the Tektronix notation: the upper case prefix is the short form
+_MNEMONICS = ['ACQuire', 'MODe', 'NUMAVg', 'NUMACq', 'STATE', 'STOPAfter', 'CH', 'MATH', 'SCAle',
+              'POSition', 'BANdwidth', 'INVert', 'COUPling', 'PRObe', 'CURSor', 'CURVe', 'DATa',
+              'ENCdg', 'WIDth', 'SOUrce', 'STARt', 'STOP', 'HEADer', 'HORizontal', 'MAIn',
+              'MEASUrement', 'MEAS', 'IMMed', 'TYPe', 'VALue', 'SELect', 'WFMPre', 'TRIGger',
+              'EDGE', 'LEVel', 'SLOpe', 'SETLevel', 'SAMple', 'AVErage', 'PEAKdetect', 'RUNSTop',
+              'SEQuence', 'RUN', 'ON', 'OFF', 'ASCIi', 'RIBinary', 'RPBinary', 'SRIbinary',
+              'SRPbinary', 'RISe', 'FALL', 'AC', 'DC', 'GND', 'HFRej', 'LFRej', 'NOISErej',
+              'EXT', 'LINE', 'FREQuency', 'PERIod', 'MEAN', 'PK2pk', 'CRMs', 'RMS', 'MINImum',
+              'MAXImum', 'PHAse', 'NONe']
+_SHORT, _LONG = {}, {}
+for _mnemonic in _MNEMONICS:
+    _SHORT[_mnemonic.upper()] = re.match('[A-Z0-9]*', _mnemonic).group(0)
+    _LONG[_SHORT[_mnemonic.upper()]] = _mnemonic.upper()
+
+def _canonical(token):
+    """ return the short form of a SCPI mnemonic, keeping the numeric suffix """
+    token = token.strip().upper()
+    match = re.match('([A-Z_]*?)([0-9]*)$', token)
+    candidates = [(token, '')]
+    if match is not None:
+        candidates.append(match.groups())
+    for letters, digits in candidates:
+        for long_form, short_form in _SHORT.items():
+            if long_form.startswith(letters) and len(letters) >= len(short_form):
+                return short_form + digits
+    return token
+
+def _split_unquoted(msg, sep):
+    """ split the string msg at sep, ignoring the separators between quotes """
+    parts, current, quoted = [], '', False
+    for char in msg:
+        if char == '"':
+            quoted = not quoted
+        if char == sep and not quoted:
+            parts.append(current)
+            current = ''
+        else:
+            current += char
+    parts.append(current)
+    return parts
+
+def _parse_message(msg):
+    """ split a (compound) SCPI message into a list of (nodes, name, argument, is_query) """
+    commands, path = [], []
+    for part in _split_unquoted(msg.strip(), ';'):
+        part = part.strip()
+        if part == '':
+            continue
+        head, _, arg = part.partition(' ')
+        is_query = head.endswith('?')
+        head = head.rstrip('?')
+        if head.startswith(':') or head.startswith('*'):
+            names = head.lstrip(':').split(':')
+        else:
+            names = path + head.split(':')   # relative to the previous header
+        path = names[:-1]
+        nodes = [_canonical(name) if not name.startswith('*') else name.upper() for name in names]
+        commands.append((nodes, ':'.join([name.upper() for name in names]), arg.strip(), is_query))
+    return commands
+
+def _nr3(val):
+    """ format a number in the NR3 notation used by the Tektronix scopes """
+    return '%.6E' % val
+
+def _ieee_block(data):
+    """ wrap the bytes data into a IEEE-488.2 definite length block """
+    size = str(len(data))
+    return ('#' + str(len(size)) + size).encode('ascii') + data
+
+def _number(arg):
+    """ extract the number from an argument with units such as '1000.0Hz' """
+    return float(re.match(r'\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?', arg).group(0))
+
+def _format_value(val):
+    """ format a number as the BK4052 does """
+    return '%.10g' % val
+
+#################################
+class SimulatedResource:
+    """
+        Minimal look-alike of a pyvisa message based resource. Each written
+        message is handled by "handle", which returns the response to be read
+        back (or None) and the time at which it becomes available.
+    """
+    latency = {'write': 1e-3, 'read': 1e-3}   # per-command latency in seconds
+    bandwidth = 1e6   # USB throughput in bytes per second
+
+    def __init__(self, bench, resource_name):
+        self.bench = bench
+        self.resource_name = resource_name
+        self.timeout = 2000   # timeout in ms, as in pyvisa
+        self.chunk_size = 20*1024
+        self.send_end = True
+        self.closed = False
+        self.stats = {'writes': 0, 'reads': 0, 'bytes_written': 0, 'bytes_read': 0}
+        self._input = b''   # partial message (send_end = False)
+        self._output = b''  # pending response
+        self._ready_at = 0.   # time at which the pending response is available
+        self._lock = threading.RLock()
+
+    def _sleep(self, seconds):
+        """ sleep the modeled latency, scaled by the bench "latency_scale" """
+        seconds = seconds*self.bench.latency_scale
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def _check_open(self):
+        if self.closed:
+            raise visa.errors.InvalidSession()
+
+    def open(self):
+        """ (re)open the simulated session """
+        self.closed = False
+        self._input, self._output = b'', b''
+
+    def close(self):
+        """ close the simulated session """
+        self.closed = True
+
+    def clear(self):
+        """ device clear: discard the partial message and the pending response """
+        self._check_open()
+        with self._lock:
+            self._input, self._output = b'', b''
+
+    def write_raw(self, message):
+        """ write the bytes message into the instrument """
+        self._check_open()
+        with self._lock:
+            self._input += message
+            if not self.send_end:
+                return len(message)
+            message, self._input = self._input, b''
+            self.stats['writes'] += 1
+            self.stats['bytes_written'] += len(message)
+            self._sleep(self.latency['write'] + len(message)/self.bandwidth)
+            with self.bench.lock:
+                response, ready_at = self.handle(message)
+            if response is not None:
+                self._output, self._ready_at = response, ready_at
+        return len(message)
+
+    def write(self, message, termination = None, encoding = None):
+        """ write the string message into the instrument """
+        return self.write_raw((message + '\n').encode('latin-1'))
+
+    def read_raw(self, size = None):
+        """ read the pending response. Raises a timeout if there is none """
+        self._check_open()
+        with self._lock:
+            wait = self._ready_at - time.perf_counter()
+            if self._output == b'' or wait > self.timeout/1000.:
+                time.sleep(self.timeout/1000.)
+                raise visa.errors.VisaIOError(visa.constants.StatusCode.error_timeout)
+            if wait > 0:
+                time.sleep(wait)
+            if size is None:
+                size = len(self._output)
+            data, self._output = self._output[:size], self._output[size:]
+            self.stats['reads'] += 1
+            self.stats['bytes_read'] += len(data)
+            self._sleep(self.latency['read'] + len(data)/self.bandwidth)
+        return data
+
+    def read_bytes(self, count, chunk_size = None, break_on_termchar = False):
+        """ read exactly count bytes """
+        return self.read_raw(count)
+
+    def read(self, termination = None, encoding = None):
+        """ read the pending response as a string """
+        return self.read_raw().decode('latin-1')
+
+    def query(self, message, delay = None):
+        """ write the message and read the response back """
+        self.write(message)
+        if delay:
+            time.sleep(delay)
+        return self.read()
+
+    def query_binary_values(self, message, datatype = 'f', is_big_endian = False, container = list,
+                            delay = None, header_fmt = 'ieee', expect_termination = True,
+                            data_points = 0, chunk_size = None):
+        """ write the message and read back a IEEE-488.2 binary block """
+        self.write(message)
+        if delay:
+            time.sleep(delay)
+        raw = self.read_raw()
+        start = raw.index(b'#')
+        ndigits = int(raw[start + 1:start + 2])
+        nbytes = int(raw[start + 2:start + 2 + ndigits])
+        offset = start + 2 + ndigits
+        dtype = numpy.dtype(datatype).newbyteorder('>' if is_big_endian else '<')
+        values = numpy.frombuffer(raw, dtype, count = nbytes//dtype.itemsize, offset = offset)
+        return container(values)
+
+    def handle(self, message):
+        """ process a message. Must return (response or None, ready time) """
+        raise NotImplementedError
+
+#################################
+class SimulatedTBS1062(SimulatedResource):
+    """
+        Simulated Tektronix TBS1062 oscilloscope. The channels see the signals
+        of the simulated bench: CH1 is the output of the generator channel 1
+        and CH2 is the output of the device under test (or the generator
+        channel 2 if the bench has no transfer function).
+    """
+    latency = {'write': 1e-3, 'read': 1e-3, 'query': 4e-3, 'curve': 8e-3, 'measurement': 30e-3}
+    bandwidth = 250e3   # USB throughput of the TBS1000 series in bytes per second
+    record_length = 2500   # number of points in the record
+    counts_per_division = 25   # vertical resolution of the 8-bit ADC
+    min_frame_time = 5e-3   # minimum time between two acquisitions in seconds
+    idn = 'TEKTRONIX,TBS 1062,C000000,CF:91.1CT FV:v26.01'
+
+    def __init__(self, bench, resource_name = 'USB0::0x0699::0x0368::C000000::INSTR'):
+        super().__init__(bench, resource_name)
+        self.reset()
+
+    def reset(self):
+        """ factory settings """
+        now = time.perf_counter()
+        self.header = True
+        self.channels = {}
+        for name in ['CH1', 'CH2', 'MATH']:
+            self.channels[name] = {'SEL': name != 'MATH', 'SCA': 1.0, 'POS': 0., 'PRO': 1.,
+                                   'COUP': 'DC', 'INV': False, 'BAN': False}
+        self.horizontal = {'SCA': 5e-4, 'POS': 0.}
+        self.acquire = {'MOD': 'SAM', 'NUMAV': 16, 'STATE': True, 'STOPA': 'RUNST'}
+        self.data = {'SOU': 'CH1', 'ENC': 'RIB', 'WID': 1, 'STAR': 1, 'STOP': self.record_length}
+        self.trigger = {'SOU': 'CH1', 'LEV': 0., 'SLO': 'RIS', 'COUP': 'DC'}
+        self.measurements = {'IMM': {'TYP': 'PK2', 'SOU': 'CH1', 'SOU2': 'CH2'}}
+        for n in range(1, 6):
+            self.measurements['MEAS' + str(n)] = {'TYP': 'NON', 'SOU': 'CH1', 'SOU2': 'CH2'}
+        self.settings = {}   # storage of the commands without a model
+        self._acquisitions = 0   # acquisitions done before _run_start
+        self._run_start = now
+        self._run_acquisitions = 0   # acquisitions since the last RUN
+        self._sequence_done = now
+        self._settled_at = now
+        self._records, self._records_frame = {}, None
+
+    #### acquisition model
+    def frame_time(self):
+        """ time between two acquisitions """
+        return max(10*self.horizontal['SCA'], self.min_frame_time)
+
+    def acquisition_time(self):
+        """ time for a complete (averaged) waveform """
+        if self.acquire['MOD'] == 'AVE':
+            return self.acquire['NUMAV']*self.frame_time()
+        return self.frame_time()
+
+    def _update(self, now):
+        """ advance the acquisition state to the time now """
+        if not self.acquire['STATE']:
+            return
+        if self.acquire['STOPA'] == 'SEQ':
+            if now >= self._sequence_done:
+                self.acquire['STATE'] = False
+                n = int(round(self.acquisition_time()/self.frame_time()))
+                self._acquisitions += n
+                self._run_acquisitions = n
+        else:
+            self._run_acquisitions = int((now - self._run_start)/self.frame_time())
+
+    def frame(self, now = None):
+        """ identifier of the waveform held in the acquisition memory at the time now """
+        self._update(time.perf_counter() if now is None else now)
+        if self.acquire['STATE'] and self.acquire['STOPA'] == 'RUNST':
+            return self._acquisitions + self._run_acquisitions
+        return self._acquisitions
+
+    def _run(self, now):
+        """ start the acquisition """
+        self._update(now)
+        if self.acquire['STATE'] and self.acquire['STOPA'] == 'RUNST':
+            self._acquisitions += self._run_acquisitions
+        self.acquire['STATE'] = True
+        self._run_start, self._run_acquisitions = now, 0
+        self._sequence_done = now + self.acquisition_time()
+        self._settled_at = now + self.acquisition_time()
+
+    def _stop(self, now):
+        """ stop the acquisition and freeze the current waveform """
+        self._update(now)
+        if self.acquire['STATE'] and self.acquire['STOPA'] == 'RUNST':
+            self._acquisitions += self._run_acquisitions
+        self.acquire['STATE'] = False
+
+    def changed(self):
+        """ a setting of the scope or of the signals changed: the averages restart """
+        now = time.perf_counter()
+        if self.acquire['STATE'] and self.acquire['STOPA'] == 'RUNST':
+            self._update(now)
+            self._acquisitions += self._run_acquisitions
+            self._run_start, self._run_acquisitions = now, 0
+            self._settled_at = now + self.acquisition_time()
+        self._records = {}
+
+    def _data_ready(self, now):
+        """ time at which the acquired data reflects the current settings. The curve and
+        measurement queries are answered only then (the real scope does not wait and may
+        return stale data, see the module documentation) """
+        if self.acquire['STATE'] and self.acquire['STOPA'] == 'RUNST':
+            return max(now, self._settled_at)
+        return now
+
+    #### signal model
+    def volts(self, source, frame):
+        """ noiseless and noisy voltages of source over the record, in volts """
+        if frame != self._records_frame:   # keep only the current acquisition
+            self._records, self._records_frame = {}, frame
+        key = source
+        if key not in self._records:
+            rng = numpy.random.default_rng((self.bench.seed, frame))
+            hscale = self.horizontal['SCA']
+            t = self.horizontal['POS'] - 5*hscale + 10*hscale/self.record_length*numpy.arange(self.record_length)
+            t = t + self.bench.trigger_time(self.trigger, rng)
+            if self.acquire['MOD'] == 'PEAK':   # minimum and maximum over each pair of sample intervals
+                dt = 20*hscale/self.record_length
+                n = int(numpy.clip(numpy.ceil(8*dt*self.bench.generator_resource.max_frequency()), 2, 256))
+                t = t[0::2, None] + dt*numpy.arange(n)/n
+            if source == 'MATH':
+                v = self._channel_volts('CH1', t, rng) - self._channel_volts('CH2', t, rng)
+            else:
+                v = self._channel_volts(source, t, rng)
+            if self.acquire['MOD'] == 'PEAK':
+                v = numpy.stack([v.min(axis = 1), v.max(axis = 1)], axis = 1).ravel()[:self.record_length]
+            self._records[key] = v
+        return self._records[key]
+
+    def _channel_volts(self, source, t, rng):
+        """ signal at the input of a channel, including noise and coupling """
+        channel = self.channels[source]
+        if channel['COUP'] == 'GND':
+            return numpy.zeros_like(t)
+        v = self.bench.signal(source, t, rng)
+        noise = self.bench.noise
+        if self.acquire['MOD'] == 'AVE':
+            noise = noise/numpy.sqrt(self.acquire['NUMAV'])
+        if noise > 0:
+            v = v + rng.normal(0., noise, t.shape)
+        if channel['COUP'] == 'AC':
+            v = v - v.mean()
+        if channel['INV']:
+            v = -v
+        return v
+
+    def counts(self, source, width, now = None):
+        """ digitized record of source """
+        channel = self.channels[source]
+        v = self.volts(source, self.frame(now))
+        levels = self.counts_per_division*256**(width - 1)
+        raw = numpy.round((v/channel['SCA'] + channel['POS'])*levels)
+        limit = 2**(8*width - 1)
+        return numpy.clip(raw, -limit, limit - 1).astype('i' + str(width))
+
+    def conversion(self, source, width):
+        """ return (x_zero, x_incr, y_zero, y_mult, y_off) of source """
+        channel = self.channels[source]
+        hscale = self.horizontal['SCA']
+        levels = self.counts_per_division*256**(width - 1)
+        return (self.horizontal['POS'] - 5*hscale, 10*hscale/self.record_length,
+                0., channel['SCA']/levels, channel['POS']*levels)
+
+    def measured_volts(self, source, now = None):
+        """ voltages seen by the measurement system (clipped and quantized) """
+        x_zero, x_incr, y_zero, y_mult, y_off = self.conversion(source, 1)
+        y = y_zero + y_mult*(self.counts(source, 1, now) - y_off)
+        t = x_zero + x_incr*numpy.arange(y.shape[0])
+        return t, y
+
+    def measure(self, kind, source, source2, now = None):
+        """ automatic measurement of the scope """
+        if not self.channels[source]['SEL']:
+            return 9.9e37
+        t, y = self.measured_volts(source, now)
+        if kind == 'PK2':
+            return y.max() - y.min()
+        if kind == 'MAXI':
+            return y.max()
+        if kind == 'MINI':
+            return y.min()
+        if kind == 'MEAN':
+            return y.mean()
+        if kind == 'RMS':
+            return numpy.sqrt(numpy.mean(y**2))
+        crossings = _rising_crossings(t, y)
+        if crossings.shape[0] < 2:
+            return 9.9e37
+        period = (crossings[-1] - crossings[0])/(crossings.shape[0] - 1)
+        if kind == 'PERI':
+            return period
+        if kind == 'FREQ':
+            return 1./period
+        if kind == 'CRM':
+            cycle = (t >= crossings[0]) & (t < crossings[-1])
+            return numpy.sqrt(numpy.mean(y[cycle]**2))
+        if kind == 'PHA':
+            if not self.channels[source2]['SEL']:
+                return 9.9e37
+            t2, y2 = self.measured_volts(source2, now)
+            crossings2 = _rising_crossings(t2, y2)
+            if crossings2.shape[0] == 0:
+                return 9.9e37
+            phase = 360.*(crossings2[0] - crossings[0])/period
+            return (phase + 180.) % 360. - 180.
+        return 9.9e37
+
+    #### SCPI interface
+    def handle(self, message):
+        now = time.perf_counter()
+        responses, ready_at = [], now
+        for nodes, name, arg, is_query in _parse_message(message.decode('latin-1')):
+            try:
+                response, ready = self.command(nodes, arg, is_query, now)
+            except (KeyError, ValueError, IndexError):
+                response, ready = None, now   # the real scope would only set an error bit
+            if nodes[0] in ['*OPC', '*WAI']:   # the next commands run when the acquisition is done
+                now = max(now, ready)
+            if is_query and response is not None:
+                if isinstance(response, str):
+                    if self.header and nodes in [['WFMP'], ['ACQ'], ['CURS']]:
+                        response = ':' + name + ':' + response   # whole subsystem
+                    elif self.header and not nodes[0].startswith('*'):
+                        response = ':' + name + ' ' + response
+                    response = response.encode('latin-1')
+                elif self.header:
+                    response = (':' + name + ' ').encode('latin-1') + response
+                responses.append(response)
+                ready_at = max(ready_at, ready)
+        if len(responses) == 0:
+            return None, now
+        return b';'.join(responses) + b'\n', ready_at
+
+    def command(self, nodes, arg, is_query, now):
+        """ execute a single SCPI command. Returns (response, ready time) """
+        root = nodes[0]
+        delay = self.latency['query']*self.bench.latency_scale
+        if root == '*IDN':
+            return self.idn, now + delay
+        if root in ['*OPC', '*WAI']:
+            self._update(now)
+            done = now
+            if self.acquire['STATE'] and self.acquire['STOPA'] == 'SEQ':
+                done = self._sequence_done
+            return ('1' if root == '*OPC' else None), done + delay
+        if root == '*RST':
+            self.reset()
+            return None, now
+        if root == '*CLS':
+            return None, now
+        if root == 'HEAD':
+            if is_query:
+                return str(int(self.header)), now + delay
+            self.header = _canonical(arg) in ['ON', '1']
+            return None, now
+        if root in self.channels:
+            return self._channel_command(root, nodes[1:], arg, is_query, now + delay)
+        if root == 'SEL':
+            channel = self.channels[nodes[1]]
+            if is_query:
+                return str(int(channel['SEL'])), now + delay
+            channel['SEL'] = _canonical(arg) in ['ON', '1']
+            return None, now
+        if root == 'HOR':
+            key = nodes[-1]
+            if is_query:
+                return _nr3(self.horizontal[key]), now + delay
+            val = float(arg)
+            if key == 'SCA':
+                val = _quantize(val, [1., 2.5, 5.], 5e-9, 50.)
+            self.horizontal[key] = val
+            self.changed()
+            return None, now
+        if root == 'ACQ':
+            return self._acquire_command(nodes[1:], arg, is_query, now, delay)
+        if root == 'DAT':
+            return self._data_command(nodes[1:], arg, is_query, now, delay)
+        if root == 'WFMP':
+            return self._preamble(), now + delay
+        if root == 'CURV':
+            ready = self._data_ready(now)
+            return self._curve(ready), ready + self.latency['curve']*self.bench.latency_scale
+        if root == 'CURS':
+            return 'FUNCTION OFF;SELECT:SOURCE CH1;:CURSOR:VBARS:UNITS SECONDS;POSITION1 0.0E0;POSITION2 0.0E0', now + delay
+        if root == 'MEASU':
+            return self._measurement_command(nodes[1:], arg, is_query, now, delay)
+        if root == 'TRIG':
+            return self._trigger_command(nodes[1:], arg, is_query, now, delay)
+        # commands without a model are only stored
+        key = ':'.join(nodes)
+        if is_query:
+            return self.settings.get(key, '0'), now + delay
+        self.settings[key] = arg
+        return None, now
+
+    def _channel_command(self, source, nodes, arg, is_query, ready):
+        channel = self.channels[source]
+        key = nodes[0]
+        if is_query:
+            val = channel[key]
+            if isinstance(val, bool):
+                return ['OFF', 'ON'][int(val)], ready
+            if isinstance(val, str):
+                return _LONG.get(val, val), ready
+            return _nr3(val), ready
+        if key in ['SCA', 'POS', 'PRO']:
+            val = float(arg)
+            if key == 'SCA':   # rounded up, so that the signal is not clipped
+                val = _quantize(val, [1., 2., 5.], 2e-3*channel['PRO'], 5.*channel['PRO'], up = True)
+            elif key == 'POS':
+                val = min(max(val, -50.), 50.)
+            channel[key] = val
+        elif key in ['INV', 'BAN']:
+            channel[key] = _canonical(arg) in ['ON', '1']
+        else:
+            channel[key] = _canonical(arg)
+        self.changed()
+        return None, ready
+
+    def _acquire_command(self, nodes, arg, is_query, now, delay):
+        self._update(now)
+        if len(nodes) == 0:
+            return ('STOPAFTER %s;STATE %d;MODE %s;NUMAVG %d;NUMACQ %d'
+                    % ({'RUNST': 'RUNSTOP', 'SEQ': 'SEQUENCE'}[self.acquire['STOPA']], self.acquire['STATE'],
+                       {'SAM': 'SAMPLE', 'AVE': 'AVERAGE', 'PEAK': 'PEAKDETECT'}[self.acquire['MOD']],
+                       self.acquire['NUMAV'], self._run_acquisitions)), now + delay
+        key = nodes[0]
+        if key == 'NUMAC':
+            return str(self._run_acquisitions), now + delay
+        if is_query:
+            val = self.acquire[key]
+            return str(int(val)) if not isinstance(val, str) else _LONG.get(val, val), now + delay
+        if key == 'STATE':
+            if _canonical(arg) in ['RUN', 'ON', '1']:
+                self._run(now)
+            else:
+                self._stop(now)
+        elif key == 'NUMAV':
+            self.acquire[key] = int(arg)
+            self.changed()
+        else:
+            self.acquire[key] = _canonical(arg)
+            self.changed()
+        return None, now
+
+    def _data_command(self, nodes, arg, is_query, now, delay):
+        key = nodes[0]
+        if is_query:
+            return str(self.data[key]), now + delay
+        if key in ['WID', 'STAR', 'STOP']:
+            val = int(float(arg))
+            if key == 'WID':
+                val = min(max(val, 1), 2)
+            else:
+                val = min(max(val, 1), self.record_length)
+            self.data[key] = val
+        else:
+            self.data[key] = _canonical(arg)
+        return None, now
+
+    def _window(self):
+        """ first and last points (1-based) of the transferred record """
+        start, stop = sorted([self.data['STAR'], self.data['STOP']])
+        return start, stop
+
+    def _preamble(self):
+        source, width = self.data['SOU'], self.data['WID']
+        x_zero, x_incr, y_zero, y_mult, y_off = self.conversion(source, width)
+        start, stop = self._window()
+        encoding = {'ASCI': 'ASC', 'RIB': 'BIN', 'RPB': 'BIN', 'SRI': 'BIN', 'SRP': 'BIN'}[self.data['ENC']]
+        fmt = 'RP' if self.data['ENC'] in ['RPB', 'SRP'] else 'RI'
+        order = 'LSB' if self.data['ENC'] in ['SRI', 'SRP'] else 'MSB'
+        mode = {'SAM': 'Sample', 'AVE': 'Average', 'PEAK': 'Peak detect'}[self.acquire['MOD']]
+        wfid = '"%s, %s coupling, %.1E V/div, %.1E s/div, %d points, %s mode"' % (
+            source.capitalize(), self.channels[source]['COUP'], self.channels[source]['SCA'],
+            self.horizontal['SCA'], stop - start + 1, mode)
+        fields = [('BYT_NR', str(width)), ('BIT_NR', str(8*width)), ('ENCDG', encoding), ('BN_FMT', fmt),
+                  ('BYT_OR', order), ('NR_PT', str(stop - start + 1)), ('WFID', wfid), ('PT_FMT', 'Y'),
+                  ('XINCR', _nr3(x_incr)), ('PT_OFF', '0'), ('XZERO', _nr3(x_zero)), ('XUNIT', '"s"'),
+                  ('YMULT', _nr3(y_mult)), ('YZERO', _nr3(y_zero)), ('YOFF', _nr3(y_off)), ('YUNIT', '"V"')]
+        if self.header:
+            return ';'.join([tag + ' ' + val for tag, val in fields])
+        return ';'.join([val for tag, val in fields])
+
+    def _curve(self, now):
+        width = self.data['WID']
+        start, stop = self._window()
+        raw = self.counts(self.data['SOU'], width, now)[start - 1:stop]
+        encoding = self.data['ENC']
+        if encoding == 'ASCI':
+            return ','.join([str(val) for val in raw])
+        if encoding in ['RPB', 'SRP']:
+            raw = raw.astype(int) + 2**(8*width - 1)
+            dtype = 'u' + str(width)
+        else:
+            dtype = 'i' + str(width)
+        order = '<' if encoding in ['SRI', 'SRP'] else '>'
+        return _ieee_block(raw.astype(order + dtype).tobytes())
+
+    def _measurement_command(self, nodes, arg, is_query, now, delay):
+        slot = self.measurements[nodes[0]]
+        key = nodes[1]
+        if key == 'VAL':
+            ready = self._data_ready(now)
+            val = self.measure(slot['TYP'], slot['SOU'], slot['SOU2'], ready)
+            return _nr3(val), ready + self.latency['measurement']*self.bench.latency_scale
+        if is_query:
+            return _LONG.get(slot[key], slot[key]), now + delay
+        slot[key] = _canonical(arg)
+        return None, now
+
+    def _trigger_command(self, nodes, arg, is_query, now, delay):
+        if nodes == ['STATE']:
+            return 'TRIGGER' if self.bench.trigger_time(self.trigger, None) is not None else 'AUTO', now + delay
+        if nodes == ['MAI'] and _canonical(arg) == 'SETL':
+            t, y = self.measured_volts(self.trigger['SOU']) if self.trigger['SOU'] in self.channels else (None, [0.])
+            self.trigger['LEV'] = (numpy.max(y) + numpy.min(y))/2.
+            self.changed()
+            return None, now
+        key = nodes[-1]
+        if is_query:
+            val = self.trigger[key]
+            return (_nr3(val) if key == 'LEV' else _LONG.get(val, val)), now + delay
+        self.trigger[key] = float(arg) if key == 'LEV' else ' '.join([_canonical(word) for word in arg.split()])
+        self.changed()
+        return None, now
+
+def _quantize(val, mantissas, vmin, vmax, up = False):
+    """ round val to the closest (or next larger) step of the instrument 1-2-5 like sequence """
+    val = min(max(val, vmin), vmax)
+    decade = 10.**numpy.floor(numpy.log10(val))
+    steps = numpy.array([m*decade*10.**k for k in [-1, 0, 1] for m in mantissas])
+    steps = steps[(steps >= vmin*(1 - 1e-9)) & (steps <= vmax*(1 + 1e-9))]
+    if up:
+        return float(steps[steps >= val*(1 - 1e-9)].min())
+    return float(steps[numpy.argmin(numpy.abs(numpy.log(steps/val)))])
+
+def _rising_crossings(t, y):
+    """ times of the rising crossings of y through its mid level (with 10 % hysteresis) """
+    vmax, vmin = y.max(), y.min()
+    if vmax - vmin == 0:
+        return numpy.array([])
+    mid, hyst = (vmax + vmin)/2., 0.1*(vmax - vmin)
+    # a crossing only counts if the signal went below the hysteresis band since the last one
+    last_below = numpy.maximum.accumulate(numpy.where(y < mid - hyst, numpy.arange(y.shape[0]), -1))
+    index = numpy.flatnonzero((y[:-1] < mid) & (y[1:] >= mid))
+    armed = last_below[index]
+    index = index[(armed >= 0) & (numpy.diff(numpy.concatenate(([-1], armed))) != 0)]
+    return t[index] + (mid - y[index])*(t[index + 1] - t[index])/(y[index + 1] - y[index])
+
+#################################
+class SimulatedBK4052(SimulatedResource):
+    """
+        Simulated BK Precision BK4052 function generator. Commands are queued
+        and executed one after the other, so the responses of "*OPC?" and of
+        the queries become available only when the previous commands are done.
+        As in the real instrument, a read issued while it is still busy with
+        the previous commands times out ("early_read_fails"), and the response
+        is still sent later unless the instrument is cleared.
+    """
+    early_read_fails = True
+    latency = {'write': 2e-3, 'read': 2e-3, 'query': 10e-3}
+    bandwidth = 1e6
+    processing = {'BSWV': 20e-3, 'OUTP': 10e-3, 'SYNC': 10e-3, 'INVT': 10e-3, 'PACP': 60e-3, 'SWWV': 30e-3,
+                  'WVDT': 200e-3, 'ARWV': 50e-3}   # execution time per command
+    idn = '*IDN BK,4052,000000000000,5.01.02.15,02-00-00-25-00'
+    aliases = {'OUTPUT': 'OUTP', 'BASIC_WAVE': 'BSWV', 'INVERT': 'INVT', 'PARACOPY': 'PACP', 'SWEEPWAVE': 'SWWV',
+               'WAVEDATA': 'WVDT', 'ARBWAVE': 'ARWV'}
+
+    def __init__(self, bench, resource_name = 'USB0::0xF4ED::0xEE3A::000000000000::INSTR'):
+        super().__init__(bench, resource_name)
+        self.reset()
+
+    def reset(self):
+        """ factory settings """
+        self.channels = {}
+        for name in ['C1', 'C2']:
+            self.channels[name] = {'WVTP': 'SINE', 'FRQ': 1000., 'AMP': 4., 'OFST': 0., 'PHSE': 0.,
+                                   'DUTY': 50., 'SYM': 50., 'DLY': 0., 'STDEV': 0.5, 'MEAN': 0.,
+                                   'OUTP': False, 'LOAD': 'HZ', 'SYNC': False, 'INVT': False,
+                                   'SWWV': {'STATE': 'OFF', 'TIME': 1., 'START': 100., 'STOP': 1000., 'SWMD': 'LINE',
+                                            'DIR': 'UP', 'TRSR': 'INT', 'TRMD': 'OFF'}, 'ARWV': 'SINE'}
+        self.settings = {}
+        self.waveforms = {}   # user waveforms loaded by "WVDT", normalized between -1 and 1
+        self._busy_until = 0.
+        self._free_at = 0.   # time at which the pending response starts being processed
+
+    def read_raw(self, size = None):
+        """ read the pending response. Times out if the instrument is still busy """
+        self._check_open()
+        if self.early_read_fails and self._output != b'' and time.perf_counter() < self._free_at:
+            time.sleep(self.timeout/1000.)
+            raise visa.errors.VisaIOError(visa.constants.StatusCode.error_timeout)
+        return super().read_raw(size)
+
+    def basic_wave(self, name):
+        """ list of (tag, value) pairs returned by "BSWV?" """
+        channel = self.channels[name]
+        wvtp = channel['WVTP']
+        if wvtp == 'NOISE':
+            return [('WVTP', wvtp), ('STDEV', _format_value(channel['STDEV']) + 'V'),
+                    ('MEAN', _format_value(channel['MEAN']) + 'V')]
+        if wvtp == 'DC':
+            return [('WVTP', wvtp), ('OFST', _format_value(channel['OFST']) + 'V')]
+        pairs = [('WVTP', wvtp), ('FRQ', _format_value(channel['FRQ']) + 'HZ'),
+                 ('PERI', _format_value(1./channel['FRQ']) + 'S'), ('AMP', _format_value(channel['AMP']) + 'V'),
+                 ('OFST', _format_value(channel['OFST']) + 'V'),
+                 ('HLEV', _format_value(channel['OFST'] + channel['AMP']/2.) + 'V'),
+                 ('LLEV', _format_value(channel['OFST'] - channel['AMP']/2.) + 'V'),
+                 ('PHSE', _format_value(channel['PHSE']))]
+        if wvtp in ['SQUARE', 'PULSE']:
+            pairs.append(('DUTY', _format_value(channel['DUTY'])))
+        if wvtp == 'RAMP':
+            pairs.append(('SYM', _format_value(channel['SYM'])))
+        if wvtp == 'PULSE':
+            pairs.append(('DLY', _format_value(channel['DLY'])))
+        return pairs
+
+    def handle(self, message):
+        now = time.perf_counter()
+        start = max(now, self._busy_until)
+        message, _, data = message.partition(b'WAVEDATA,')   # binary samples of "WVDT"
+        text = message.decode('latin-1').strip()
+        head, _, arg = text.partition(' ')
+        is_query = head.endswith('?')
+        nodes = [self.aliases.get(node, node) for node in head.rstrip('?').upper().split(':')]
+        delay = self.latency['query']*self.bench.latency_scale
+        if is_query:
+            self._free_at = start
+        if nodes[0] == '*IDN':
+            return (self.idn + '\n').encode('latin-1'), start + delay
+        if nodes[0] == '*OPC':
+            return b'1\n', start + delay
+        if nodes[0] == '*RST':
+            self.reset()
+            self.bench.changed()
+            return None, now
+        if is_query:
+            return (self.query_command(nodes) + '\n').encode('latin-1'), start + delay
+        if nodes[-1] == 'WVDT':
+            self.load_waveform(arg, data[:-1] if data.endswith(b'\n') else data)
+        else:
+            self.set_command(nodes, arg)
+        self._busy_until = start + self.processing.get(nodes[-1], 10e-3)*self.bench.latency_scale
+        self.bench.changed()
+        return None, now
+
+    def query_command(self, nodes):
+        if len(nodes) == 1:
+            return self.settings.get(nodes[0], '')
+        name, key = nodes[0], nodes[1]
+        channel = self.channels[name]
+        if key == 'OUTP':
+            return '%s:OUTP %s,LOAD,%s' % (name, ['OFF', 'ON'][channel['OUTP']], channel['LOAD'])
+        if key in ['SYNC', 'INVT']:
+            return '%s:%s %s' % (name, key, ['OFF', 'ON'][channel[key]])
+        if key == 'BSWV':
+            return '%s:BSWV %s' % (name, ','.join([tag + ',' + val for tag, val in self.basic_wave(name)]))
+        if key == 'ARWV':
+            return '%s:ARWV NAME,%s' % (name, channel['ARWV'])
+        if key == 'SWWV':
+            sweep = channel['SWWV']
+            units = {'TIME': 'S', 'START': 'HZ', 'STOP': 'HZ'}
+            return '%s:SWWV %s' % (name, ','.join([tag + ',' + (_format_value(val) + units[tag] if tag in units else val)
+                                                   for tag, val in sweep.items()]))
+        return '%s:%s %s' % (name, key, self.settings.get(name + ':' + key, ''))
+
+    def set_command(self, nodes, arg):
+        args = [word.strip().upper() for word in arg.split(',')]
+        if nodes[0] == 'PACP':   # PACP destination,source
+            self.channels[args[0]].update(dict([(key, val) for key, val in self.channels[args[1]].items()
+                                                if key not in ['OUTP', 'LOAD', 'SYNC', 'INVT']]))
+            return
+        if len(nodes) == 1:
+            self.settings[nodes[0]] = arg
+            return
+        name, key = nodes[0], nodes[1]
+        channel = self.channels[name]
+        if key == 'OUTP':
+            if args[0] == 'LOAD':
+                channel['LOAD'] = args[1]
+            else:
+                channel['OUTP'] = args[0] == 'ON'
+        elif key in ['SYNC', 'INVT']:
+            channel[key] = args[0] == 'ON'
+        elif key == 'ARWV':   # ARWV NAME,name
+            if args[1] in self.waveforms:
+                channel['ARWV'], channel['WVTP'] = args[1], 'ARB'
+        elif key == 'SWWV':
+            for tag, val in zip(args[0::2], args[1::2]):
+                if tag in ['TIME', 'START', 'STOP']:
+                    channel['SWWV'][tag] = _number(val)
+                elif tag in channel['SWWV']:
+                    channel['SWWV'][tag] = val
+        elif key == 'BSWV':
+            for tag, val in zip(args[0::2], args[1::2]):
+                if tag == 'WVTP':
+                    channel[tag] = val
+                elif tag == 'PERI':
+                    channel['FRQ'] = 1./_number(val)
+                elif tag in ['HLEV', 'LLEV']:
+                    high = _number(val) if tag == 'HLEV' else channel['OFST'] + channel['AMP']/2.
+                    low = _number(val) if tag == 'LLEV' else channel['OFST'] - channel['AMP']/2.
+                    channel['AMP'], channel['OFST'] = high - low, (high + low)/2.
+                else:
+                    channel[tag] = _number(val)
+        else:
+            self.settings[name + ':' + key] = arg
+
+    def load_waveform(self, arg, data):
+        """ store the 16-bit little endian samples of "WVDT WVNM,name,WAVEDATA," """
+        args = [word.strip().upper() for word in arg.split(',')]
+        name = dict(zip(args[0::2], args[1::2])).get('WVNM', 'USER')
+        self.waveforms[name] = numpy.frombuffer(data, '<i2').astype(float)/32767.
+
+    #### signal model
+    def sweeping(self, name):
+        """ True if channel name is sweeping the frequency """
+        channel = self.channels[name]
+        return channel['OUTP'] and channel['SWWV']['STATE'] == 'ON' and channel['WVTP'] not in ['DC', 'NOISE']
+
+    def max_frequency(self):
+        """ highest frequency at the outputs """
+        freqs = [0.]
+        for name, channel in self.channels.items():
+            if channel['OUTP']:
+                freqs.append(channel['FRQ'])
+                if self.sweeping(name):
+                    freqs += [channel['SWWV']['START'], channel['SWWV']['STOP']]
+        return max(freqs)
+
+    def sweep(self, name, t):
+        """ instantaneous frequency and number of cycles of the sweep of channel name at the
+        times t (the sweeps start at t = 0 and repeat every sweep time; all the trigger sources
+        behave as the internal one) """
+        sweep = self.channels[name]['SWWV']
+        T, f0, f1 = sweep['TIME'], sweep['START'], sweep['STOP']
+        if sweep['DIR'] == 'DOWN':
+            f0, f1 = f1, f0
+        tau = numpy.mod(t, T)
+        if sweep['SWMD'] == 'LOG':
+            rate = numpy.log(f1/f0)/T
+            freq = f0*numpy.exp(rate*tau)
+            cycles = f0*numpy.expm1(rate*tau)/rate if rate != 0 else f0*tau
+        else:
+            freq = f0 + (f1 - f0)*tau/T
+            cycles = f0*tau + (f1 - f0)*tau**2/(2*T)
+        return freq, cycles
+
+    def shape(self, name, u):
+        """ normalized waveform (between -1 and 1) as function of the cycle fraction u """
+        channel = self.channels[name]
+        wvtp = channel['WVTP']
+        u = numpy.mod(u, 1.)
+        if wvtp == 'SINE':
+            return numpy.sin(2*numpy.pi*u)
+        if wvtp in ['SQUARE', 'PULSE']:
+            return numpy.where(u < channel['DUTY']/100., 1., -1.)
+        if wvtp == 'RAMP':
+            sym = min(max(channel['SYM']/100., 1e-6), 1 - 1e-6)
+            return numpy.where(u < sym, -1. + 2*u/sym, 1. - 2*(u - sym)/(1. - sym))
+        if wvtp == 'ARB' and channel['ARWV'] in self.waveforms:
+            samples = self.waveforms[channel['ARWV']]
+            return samples[(u*samples.shape[0]).astype(int) % samples.shape[0]]
+        return numpy.zeros_like(u)
+
+    def output(self, name, t, rng, transfer = None):
+        """ voltage at the output of channel name at the times t, optionally filtered by transfer(f) """
+        channel = self.channels[name]
+        if not channel['OUTP']:
+            return numpy.zeros_like(t)
+        gain = 2. if channel['LOAD'] == '50' else 1.   # the scope is a high impedance load
+        sign = -1. if channel['INVT'] else 1.
+        dc_gain = 1. if transfer is None else float(numpy.real(transfer(0.)))
+        wvtp = channel['WVTP']
+        if wvtp == 'DC':
+            return gain*dc_gain*channel['OFST']*numpy.ones_like(t)
+        if wvtp == 'NOISE':
+            noise = rng.normal(channel['MEAN'], channel['STDEV'], t.shape) if rng is not None else channel['MEAN']*numpy.ones_like(t)
+            return gain*sign*noise
+        freq, amp = channel['FRQ'], channel['AMP']/2.
+        if self.sweeping(name):   # slow sweep: the transfer function follows the frequency
+            freq, cycles = self.sweep(name, t)
+            H = transfer(freq) if transfer is not None else numpy.ones_like(freq)
+            u = cycles + numpy.angle(H)/(2*numpy.pi) + channel['PHSE']/360.
+            wave = numpy.abs(H)*self.shape(name, u)
+            return gain*(dc_gain*channel['OFST'] + sign*amp*wave)
+        u = freq*t + channel['PHSE']/360.
+        if transfer is None:
+            wave = self.shape(name, u)
+        elif wvtp == 'SINE':
+            H = transfer(freq)
+            wave = numpy.abs(H)*numpy.sin(2*numpy.pi*u + numpy.angle(H))
+        else:   # filter the harmonics of one period of the waveform
+            M = 1024
+            spectrum = numpy.fft.rfft(self.shape(name, numpy.arange(M)/M))
+            spectrum[1:] *= transfer(freq*numpy.arange(1, spectrum.shape[0]))
+            spectrum[0] *= dc_gain
+            period = numpy.fft.irfft(spectrum, M)
+            wave = numpy.interp(numpy.mod(u, 1.)*M, numpy.arange(M + 1), numpy.append(period, period[0]))
+        return gain*(dc_gain*channel['OFST'] + sign*amp*wave)
+
+#################################
+class SimulatedBench:
+    """
+        Simulated bench: a BK4052 function generator and a TBS1062 scope.
+
+        The scope CH1 sees the generator channel 1. If "transfer" is given
+        (a function of the frequency returning the complex transfer function
+        of the device under test), the scope CH2 sees the generator channel 1
+        after the device under test; otherwise it sees the generator channel 2.
+
+        Parameters
+        ----------
+        transfer: callable or None - optional
+            transfer function H(f) of the device under test
+        noise: float - optional
+            RMS noise at the scope inputs in volts
+        latency_scale: float - optional
+            scale factor of all latencies and transfer times of the model
+            (0 removes them; the acquisition times are not scaled)
+        seed: int - optional
+            seed of the random noise
+    """
+    def __init__(self, transfer = rc_lowpass(1e3), noise = 2e-3, latency_scale = 1.0, seed = 0):
+        self.transfer = transfer
+        self.noise = noise
+        self.latency_scale = latency_scale
+        self.seed = seed
+        self.lock = threading.RLock()
+        self.scope_resource = SimulatedTBS1062(self)
+        self.generator_resource = SimulatedBK4052(self)
+
+    def scope(self):
+        """ return a pylef.TektronixTBS1062 connected to the simulated scope """
+        from .scope import TektronixTBS1062
+        self.scope_resource.open()
+        return TektronixTBS1062(resource = self.scope_resource)
+
+    def generator(self):
+        """ return a pylef.BK4052 connected to the simulated function generator """
+        from .generator import BK4052
+        self.generator_resource.open()
+        return BK4052(resource = self.generator_resource)
+
+    def changed(self):
+        """ the generator settings changed """
+        self.scope_resource.changed()
+
+    def signal(self, source, t, rng):
+        """ voltage at the scope input source at the times t """
+        gen = self.generator_resource
+        if source == 'CH1':
+            return gen.output('C1', t, rng)
+        if self.transfer is None:
+            return gen.output('C2', t, rng)
+        return gen.output('C1', t, rng, self.transfer)
+
+    def trigger_time(self, trigger, rng):
+        """
+            time shift that places the trigger event at t = 0. If the scope
+            cannot trigger, a random shift is returned (auto mode), or None
+            if rng is None.
+        """
+        gen = self.generator_resource
+        channel = gen.channels['C1']
+        triggered = channel['OUTP'] and channel['WVTP'] not in ['DC', 'NOISE']
+        if gen.sweeping('C1'):   # the trigger output marks the start of the sweeps
+            if trigger['SOU'].startswith('EXT') and channel['SWWV']['TRMD'] == 'ON':
+                return 0.
+            triggered = False
+        if triggered:
+            period = 1./channel['FRQ']
+            if trigger['SOU'].startswith('EXT'):   # sync output of the generator
+                return -channel['PHSE']/360.*period
+            if trigger['SOU'] in ['CH1', 'CH2']:
+                s = period*numpy.arange(-1, 2048)/2048.
+                v = self.signal(trigger['SOU'], s, None)
+                if trigger['SLO'] == 'FALL':
+                    v, level = -v, -trigger['LEV']
+                else:
+                    level = trigger['LEV']
+                index = numpy.flatnonzero((v[:-1] < level) & (v[1:] >= level))
+                if index.shape[0] > 0:
+                    n = index[0]
+                    return s[n] + (level - v[n])*(s[n + 1] - s[n])/(v[n + 1] - v[n])
+        if rng is None:
+            return None
+        return rng.uniform(0., 1.)
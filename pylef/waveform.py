@@ -0,0 +1,87 @@
+#-*- coding: utf-8 -*-
+
+""" Compact storage of the waveforms acquired by the scope """
+
+#################################
+import time # module for time related funtions
+import numpy  # module for array manipulation
+from . import analysis  # spectra computed from the curves
+################################
+class WaveformRecord:
+    """
+    WaveformRecord
+    ==============
+
+    A waveform as it comes from the scope: the raw integer samples (1 byte
+    per sample for "Data:Width 1"), the conversion values returned by
+    "ChannelScope.waveform_conversion" and the acquisition time stamp. The
+    time axis "t" and the voltages "y" are only computed when accessed, so
+    thousands of records take little more memory than the bytes transferred.
+
+    Usage:
+
+    >>> record = scope.ch1.read_record()
+    >>> plt.plot(record.t, record.y)
+    >>> t, Y = stack_records(records)    # many records into a 2-D array
+    """
+    __slots__ = ('raw', 'conversion', 'timestamp', 'channel')
+
+    def __init__(self, raw, conversion, timestamp = None, channel = ''):
+        self.raw = raw   # integer samples
+        self.conversion = conversion   # [[x_zero, x_factor, x_offset], [y_zero, y_factor, y_offset]]
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.channel = channel
+#
+    def __len__(self):
+        return self.raw.shape[0]
+#
+    def __repr__(self):
+        return 'WaveformRecord(%s, %d points, %s)' % (self.channel, len(self),
+                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.timestamp)))
+#
+    @property
+    def t(self):
+        """ time axis in seconds """
+        [[x_zero, x_factor, x_offset], _] = self.conversion
+        return x_zero + x_factor*(numpy.arange(len(self)) - x_offset)
+#
+    @property
+    def y(self):
+        """ voltages in volts """
+        [_, [y_zero, y_factor, y_offset]] = self.conversion
+        return y_zero + y_factor*(self.raw - y_offset)
+#
+    def nbytes(self):
+        """ memory used by the samples """
+        return self.raw.nbytes
+#
+    def spectrum(self, window = 'hann', scaling = 'amplitude'):
+        """ single sided spectrum (frequency, S), see "pylef.analysis.spectrum" """
+        return analysis.spectrum(self.y, self.conversion[0][1], window, scaling)
+
+def stack_records(records):
+    """
+        convert many records of the same length at once. Returns the tuple
+        (t, Y) with the time axis of the first record and a 2-D array with
+        the voltages of one record per row.
+    """
+    records = list(records)
+    if len(records) == 0:
+        raise ValueError('There are no records to stack')
+    if len(set([len(record) for record in records])) > 1:
+        raise ValueError('The records must have the same number of points')
+    raw = numpy.stack([record.raw for record in records])
+    [y_zero, y_factor, y_offset] = numpy.array([record.conversion[1] for record in records]).T[:, :, None]
+    Y = numpy.subtract(raw, y_offset)
+    Y *= y_factor
+    Y += y_zero
+    return (records[0].t, Y)
+
+def stack_spectra(records, window = 'hann', scaling = 'amplitude'):
+    """
+        spectra of many records of the same length, computed with a single
+        rfft call. Returns the tuple (frequency, S) with one spectrum per row.
+    """
+    records = list(records)
+    t, Y = stack_records(records)
+    return analysis.spectrum(Y, records[0].conversion[0][1], window, scaling)
@@ -0,0 +1,27 @@
+#-*- coding: utf-8 -*-
+
+""" Tests of the asyncio interface on the simulated bench """
+
+import asyncio
+import contextlib
+import io
+from pylef import aio, simulator
+
+def test_measurements_read_is_awaitable():
+    bench = simulator.SimulatedBench(latency_scale = 0.)
+    with contextlib.redirect_stdout(io.StringIO()):
+        func_gen, scope = bench.generator(), bench.scope()
+    func_gen.ch1.turn_on()
+    scope.measurements.configure([('Vpp1', ('PK2PK', 'CH1')), ('Vpp2', ('PK2PK', 'CH2'))])
+
+    async def main():
+        async_scope = aio.AsyncTektronixTBS1062(instrument = scope)
+        measurements = async_scope.measurements
+        assert isinstance(measurements, aio.AsyncProxy)
+        values = await measurements.read()
+        await async_scope.close()
+        return values
+
+    values = asyncio.run(main())
+    assert set(values) == {'Vpp1', 'Vpp2'}
+    assert abs(values['Vpp1'] - 4.) < 0.5   # 4 Vpp sine at the generator output
@@ -0,0 +1,32 @@
+#-*- coding: utf-8 -*-
+
+""" Tests of the host side analysis """
+
+import numpy
+import tracemalloc
+from pylef import analysis
+
+def test_waveform_statistics_match_numpy():
+    Y = numpy.random.default_rng(0).normal(size = (200, 2500))
+    stats = analysis.WaveformStatistics()
+    for y in Y[:100]:
+        stats.add(y)
+    stats.add(Y[100:])   # a stack of frames
+    snapshot = stats.snapshot()
+    assert snapshot['count'] == 200
+    assert numpy.allclose(snapshot['mean'], Y.mean(axis = 0))
+    assert numpy.allclose(snapshot['variance'], Y.var(axis = 0, ddof = 1))
+    assert numpy.array_equal(snapshot['minimum'], Y.min(axis = 0))
+    assert numpy.array_equal(snapshot['maximum'], Y.max(axis = 0))
+
+def test_waveform_statistics_single_frame_does_not_allocate():
+    y = numpy.random.default_rng(1).normal(size = 2500)
+    stats = analysis.WaveformStatistics()
+    stats.add(y)
+    tracemalloc.start()
+    try:
+        stats.add(y)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < y.nbytes/4   # no temporary array of the frame size
@@ -0,0 +1,107 @@
+#-*- coding: utf-8 -*-
+
+""" Tests of the function generator on the simulated bench """
+
+import contextlib
+import io
+import numpy
+from pylef import generator, simulator
+
+def simulated_generator(**kwargs):
+    """ simulated function generator (with no latency) """
+    bench = simulator.SimulatedBench(latency_scale = 0., **kwargs)
+    with contextlib.redirect_stdout(io.StringIO()):
+        func_gen = bench.generator()
+    return bench, func_gen
+
+def test_resample_does_not_alias():
+    store = generator.WaveformStore(lambda msg, data: len(data))
+    n = numpy.arange(32768)
+    slow = numpy.sin(2*numpy.pi*3*n/32768.)
+    fast = 0.5*numpy.sin(2*numpy.pi*12000*n/32768.)   # above the Nyquist frequency of 16384 points
+    y = store.resample(slow + fast)
+    assert y.shape == (16384,)
+    assert numpy.abs(y - slow[::2]).max() < 1e-3
+    x = numpy.linspace(0, 1, 1000, endpoint = False)
+    assert store.resample(x).shape == (1024,)   # short waveforms are interpolated
+
+def test_waveform_slots_are_reused():
+    uploads = []
+    store = generator.WaveformStore(lambda msg, data: uploads.append(msg) or len(data), slots = 2)
+    t = numpy.linspace(0, 1, 1024, endpoint = False)
+    a, b, c = numpy.sin(2*numpy.pi*t), t, numpy.exp(-5*t)
+    assert store.upload(a) == 'PY00' and store.upload(b) == 'PY01'
+    assert store.upload(a) == 'PY00'   # cached, now the most recently used
+    assert store.upload(c) == 'PY01'   # replaces b, the least recently used
+    assert len(store.names) == 2 and len(uploads) == 3
+    assert store.upload(b) == 'PY00'
+    assert store.stats()['hits'] == 1
+
+def test_set_arbitrary_selects_a_reused_slot():
+    bench, func_gen = simulated_generator()
+    func_gen.waveforms.slots = 1
+    t = numpy.linspace(0, 1, 1024, endpoint = False)
+    assert func_gen.ch1.set_arbitrary(numpy.sin(2*numpy.pi*t)) == 'PY00'
+    func_gen.ch1.set_arbitrary(numpy.sin(2*numpy.pi*t))   # reads the wave type once
+    writes = bench.generator_resource.stats['writes']
+    func_gen.ch1.set_arbitrary(numpy.sin(2*numpy.pi*t))   # cached and selected: nothing written
+    assert bench.generator_resource.stats['writes'] == writes
+    func_gen.ch1.set_arbitrary(t)   # same slot, new content
+    waveform = bench.generator_resource.waveforms['PY00']
+    assert numpy.abs(waveform - (2*t - 1)).max() < 3e-3   # stretched to the full range
+    assert bench.generator_resource.stats['writes'] > writes + 1   # uploaded and selected again
+
+def count_messages(bench):
+    """ list that receives the messages written into the simulated generator """
+    resource, messages = bench.generator_resource, []
+    handle = resource.handle
+    def recording(message):
+        messages.append(message.split(b',WAVEDATA,')[0].decode('latin-1').strip())
+        return handle(message)
+    resource.handle = recording
+    return messages
+
+def test_configure_writes_only_the_changed_values():
+    bench, func_gen = simulated_generator()
+    func_gen.ch1.configure(function = 'sine', frequency = 2e3, Vpp = 1.)
+    messages = count_messages(bench)
+    func_gen.ch1.configure(frequency = 2e3, Vpp = 1.)   # same values: nothing is written
+    assert messages == []
+    func_gen.ch1.configure(frequency = 3e3, Vpp = 1.)
+    assert [m for m in messages if 'BSWV' in m] == ['C1:BSWV FRQ,3000.0Hz']
+    wave = bench.generator_resource.channels['C1']
+    assert wave['FRQ'] == 3e3 and wave['AMP'] == 1.
+    assert func_gen.ch1.wave_info()['frequency'] == 3e3
+
+def test_deferred_commands_share_one_completion_check():
+    bench, func_gen = simulated_generator()
+    messages = count_messages(bench)
+    with func_gen.deferred():
+        func_gen.ch1.set_frequency(2e3)
+        func_gen.ch1.set_Vpp(1.)
+        func_gen.ch1.turn_on()
+    assert messages.count('*OPC?') == 1
+    assert bench.generator_resource.channels['C1']['OUTP']
+
+def test_sweep_settings_round_trip():
+    bench, func_gen = simulated_generator()
+    func_gen.ch1.set_sweep(100., 1e4, 0.5, spacing = 'log')
+    info = func_gen.ch1.sweep_info()
+    assert info['state'] == 'ON' and info['start'] == 100. and info['stop'] == 1e4 and info['time'] == 0.5
+    func_gen.ch1.sweep_off()
+    assert func_gen.ch1.sweep_info()['state'] == 'OFF'
+
+def test_settle_model_recovers_from_early_reads():
+    bench = simulator.SimulatedBench()   # with the latencies, reads issued too early fail
+    with contextlib.redirect_stdout(io.StringIO()):
+        func_gen = bench.generator()
+    func_gen.probe_timeout = 100
+    failures = []
+    settle_failure = func_gen.settle_failure
+    func_gen.settle_failure = lambda kind: failures.append(kind) or settle_failure(kind)
+    for n in range(30):
+        func_gen.ch1.set_frequency(100. + n)
+    assert failures.count('BSWV') <= 2   # the wait is not shortened again below the floor
+    assert func_gen.settle_floor.get('BSWV', 0.) <= func_gen.settle_time('BSWV') < func_gen.delay_time
+    assert bench.generator_resource.channels['C1']['FRQ'] == 129.
+    assert 'FRQ,129HZ' in func_gen.ch1.wave_info(raw_output = True)   # no late answer is read instead
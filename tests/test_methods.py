@@ -0,0 +1,91 @@
+#-*- coding: utf-8 -*-
+
+""" Tests of the sweeps on the simulated bench """
+
+import contextlib
+import io
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+from pylef import methods, simulator
+
+def simulated_bench(**kwargs):
+    """ simulated bench (with no latency) with the generator channel 1 on """
+    bench = simulator.SimulatedBench(latency_scale = 0., **kwargs)
+    with contextlib.redirect_stdout(io.StringIO()):
+        func_gen, scope = bench.generator(), bench.scope()
+    func_gen.ch1.turn_on()
+    return bench, func_gen, scope
+
+def test_sweep_hardware_restores_the_scope(tmp_path):
+    bench, func_gen, scope = simulated_bench()
+    scope.set_average()
+    scope.trigger.set_source('CH2')
+    scope.set_horizontal_scale(1e-3)
+    with contextlib.redirect_stdout(io.StringIO()):
+        fig, dados = methods.sweep_frequency_hardware(100, 10e3, 1., func_gen = func_gen, scope = scope,
+                                                      path = str(tmp_path) + '/')
+    assert abs(dados['T_dB'].values[0]) < 0.5 and dados['T_dB'].values[-1] < -15.   # RC low pass at 1 kHz
+    assert scope.acquisition_mode() == 'AVERAGE'
+    assert scope.trigger.source() == 'CH2'
+    assert scope.horizontal_scale() == 1e-3
+    assert 'RUNSTOP' in scope.instr.query('ACQuire:STOPAfter?')
+    assert func_gen.ch1.sweep_info()['state'] == 'OFF'
+
+class ClosingSession(methods.Session):
+    """ session over given instruments that records its closing """
+    closed = 0
+    def close(self):
+        ClosingSession.closed += 1
+        return super().close()
+
+def test_sweep_closes_the_session_when_the_checkpoint_does_not_match(tmp_path, monkeypatch):
+    bench, func_gen, scope = simulated_bench()
+    monkeypatch.setattr(methods, 'Session', lambda *args: ClosingSession(func_gen, scope))
+    checkpoint = tmp_path/'sweep.dat'
+    checkpoint.write_bytes(b'other\tcolumns\n1\t2\n3\t')   # with a partial last line
+    closed = ClosingSession.closed
+    try:
+        methods.sweep_frequency(100, 1e4, 4, checkpoint = str(checkpoint), resume = True, live_plot = False)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('the checkpoint columns were not checked')
+    assert ClosingSession.closed == closed + 1
+    assert checkpoint.read_bytes() == b'other\tcolumns\n1\t2\n3\t'   # not truncated
+
+def test_sweep_resumes_after_an_interruption(tmp_path, monkeypatch):
+    bench, func_gen, scope = simulated_bench()
+    monkeypatch.setattr(methods, 'Session', lambda *args: ClosingSession(func_gen, scope))
+    set_frequency, calls = func_gen.ch1.set_frequency, []
+    def interrupted(val):
+        calls.append(val)
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        set_frequency(val)
+    func_gen.ch1.set_frequency = interrupted
+    checkpoint, closed = str(tmp_path/'sweep.dat'), ClosingSession.closed
+    options = dict(checkpoint = checkpoint, live_plot = False, path = str(tmp_path) + '/')
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            methods.sweep_frequency(100, 1e4, 5, **options)
+        except KeyboardInterrupt:
+            pass
+        assert ClosingSession.closed == closed + 1
+        assert len(open(checkpoint).readlines()) == 3   # header and 2 points
+        func_gen.ch1.set_frequency = set_frequency
+        fig, dados = methods.sweep_frequency(100, 1e4, 5, resume = True, **options)
+    assert len(dados) == 5
+    assert ClosingSession.closed == closed + 2
+
+def test_adaptive_frequency_ignores_invalid_measurements():
+    freq = [100., 1e3, 1e4]
+    T_dB, phase = [0., -3., -20.], [-6., -45., -84.]
+    assert methods.next_adaptive_frequency(freq, T_dB, phase) is not None   # the corner is refined
+    freq = [100., 200., 400., 800.]
+    T_dB, phase = [0., -0.1, -0.2, -0.3], [-5., -10., -20., -40.]
+    assert methods.next_adaptive_frequency(freq, T_dB, phase, tolerance = (0.5, 10.)) is None
+    # overflowed Vpp2 (9.9E37) and NaN Vpp1 at the added points
+    for bad in [20*np.log10(9.9e37/2.), -20*np.log10(9.9e37/2.), np.nan]:
+        extra_freq = freq + [300.]
+        assert methods.next_adaptive_frequency(extra_freq, T_dB + [bad], phase + [-15.], tolerance = (0.5, 10.)) is None
@@ -0,0 +1,124 @@
+#-*- coding: utf-8 -*-
+
+""" Tests of the scope on the simulated bench """
+
+import contextlib
+import io
+import numpy
+from pylef import acquisition, analysis, simulator, scope
+
+def simulated_bench(**kwargs):
+    """ simulated bench (with no latency) with the generator channel 1 on """
+    bench = simulator.SimulatedBench(latency_scale = 0., **kwargs)
+    with contextlib.redirect_stdout(io.StringIO()):
+        func_gen, tek = bench.generator(), bench.scope()
+    func_gen.ch1.turn_on()
+    return bench, func_gen, tek
+
+def test_round_scale():
+    assert scope.round_scale(0.3077) == 0.5
+    assert scope.round_scale(0.2) == 0.2
+    assert abs(scope.round_scale(2.1e-3) - 5e-3) < 1e-12
+    assert scope.round_scale(6.) == 10.
+
+def test_auto_scale_with_offset():
+    bench, func_gen, tek = simulated_bench()
+    func_gen.ch1.set_Vpp(2.)
+    func_gen.ch1.set_offset(3.)
+    round_trips = tek.ch1.set_auto_scale()
+    y_raw = tek.ch1.acquire_y_raw_view()
+    assert y_raw.max() < 127 and y_raw.min() > -128   # not clipped
+    assert (int(y_raw.max()) - int(y_raw.min()))/25./8. >= 0.3   # fills the screen
+    assert tek.ch1.scale() == 0.5
+    assert round_trips < 10
+
+def test_preamble_hits_once_per_transfer():
+    bench, func_gen, tek = simulated_bench()
+    tek.ch1.read_channel_into()
+    saved = tek.preamble_queries_saved()
+    for n in range(10):
+        tek.ch1.read_channel_into()
+    tek.ch1.spectrum()
+    assert tek.preamble_queries_saved() - saved == 11
+    assert tek.preamble_cache.misses == 1
+
+def test_acquire_y_raw_after_16_bit_window():
+    bench, func_gen, tek = simulated_bench()
+    tek.ch1.read_channel_into(start = 1000, stop = 1500, width = 2)
+    y_raw = tek.ch1.acquire_y_raw()
+    assert y_raw.shape == (2500,)
+    assert tek.ch1.acquire_y_raw_view().shape == (2500,)
+    tek.ch1.read_channel_into(start = 1000, stop = 1500, width = 2)
+    tek.instr.write('DATa:ENCdg ASCIi')
+    assert tek.ch1.acquire_y_raw_ascii().shape == (2500,)
+
+def test_stream_counts_new_acquisitions():
+    bench, func_gen, tek = simulated_bench(noise = 0.)
+    frames = tek.ch1.stream(3)
+    assert tek.ch1.stream_stats['frames'] == 0   # available before the first frame
+    for t, y in frames:
+        assert abs(y.max() - y.min() - 4.) < 0.5
+    assert tek.ch1.stream_stats['frames'] == 3
+    assert tek.ch1.stream_stats['duplicates'] == 0   # identical noiseless frames are still new
+    assert 'RUNSTOP' in tek.instr.query('ACQuire:STOPAfter?')
+
+def test_read_channels_matches_the_single_channel_reads():
+    bench, func_gen, tek = simulated_bench(noise = 0.)
+    t, Y = tek.read_channels(['CH1', 'CH2'])
+    assert Y.shape == (2, 2500)
+    for y, channel in zip(Y, [tek.ch1, tek.ch2]):
+        t1, y1 = channel.read_channel()
+        assert numpy.allclose(t, t1) and numpy.allclose(y, y1)
+    out = numpy.empty((2, 2500))
+    t2, Y2 = tek.read_channels(['CH1', 'CH2'], out = out)
+    assert Y2 is out and numpy.allclose(t2, t) and numpy.allclose(Y2, Y)
+
+def test_window_and_16_bit_transfers():
+    bench, func_gen, tek = simulated_bench(noise = 0.)
+    t, y = tek.ch1.read_channel()
+    t_window, y_window = tek.ch1.read_channel_into(start = 1001, stop = 1500)
+    assert numpy.allclose(t_window, t[1000:1500]) and numpy.allclose(y_window, y[1000:1500])
+    t16, y16 = tek.ch1.read_channel_into(width = 2)
+    assert numpy.allclose(t16, t)
+    assert numpy.abs(y16 - y).max() <= tek.ch1.scale()/25.   # within one 8-bit count
+    record = tek.ch1.read_record(start = 1001, stop = 1500)
+    assert len(record) == 500 and numpy.allclose(record.t, t[1000:1500]) and numpy.allclose(record.y, y[1000:1500])
+
+def test_scope_and_host_measurements_agree():
+    bench, func_gen, tek = simulated_bench()
+    tek.measurements.configure([('Vpp1', ('PK2PK', 'CH1')), ('freq', ('FREQuency', 'CH1')), ('Vpp2', ('PK2PK', 'CH2'))])
+    values = tek.measurements.read()
+    t, Y = tek.read_channels(['CH1', 'CH2'])
+    host = analysis.measure(t, Y[0])
+    assert abs(values['Vpp1'] - 4.) < 0.2 and abs(host['Vpp'] - values['Vpp1']) < 0.2
+    assert abs(values['freq'] - 1e3) < 5. and abs(host['frequency'] - 1e3) < 5.
+    assert abs(values['Vpp2'] - 4./numpy.sqrt(2.)) < 0.2   # RC low pass at its corner
+
+def test_spectrum_peak_at_the_generator_frequency():
+    bench, func_gen, tek = simulated_bench(noise = 0.)
+    func_gen.ch1.set_frequency(2e3)
+    frequency, S = tek.ch1.spectrum()
+    assert abs(frequency[numpy.argmax(S[1:]) + 1] - 2e3) < 2*frequency[1]
+    assert abs(S.max() - 2.) < 0.2   # amplitude of the 4 Vpp sine
+
+def test_single_acquisition_stops_the_scope():
+    bench, func_gen, tek = simulated_bench()
+    assert tek.single_acquisition(timeout = 5.).strip().endswith('1')
+    assert tek.instr.timeout == 10000
+    assert tek.instr.query('ACQuire:STATE?').strip().endswith('0')
+    tek.set_run_stop()
+    assert 'RUNSTOP' in tek.instr.query('ACQuire:STOPAfter?')
+
+def test_acquisition_worker_frames():
+    bench, func_gen, tek = simulated_bench()
+    worker = acquisition.AcquisitionWorker(tek, ['CH1', 'CH2'], n_buffers = 2)
+    worker.start()
+    try:
+        n = 0
+        for t, Y in worker.frames(5):
+            assert Y.shape == (2, 2500) and t.shape == (2500,)
+            assert abs(Y[0].max() - Y[0].min() - 4.) < 0.3
+            n += 1
+    finally:
+        worker.stop()
+    assert n == 5